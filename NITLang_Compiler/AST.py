@@ -1,11 +1,58 @@
 class ASTNode:
-    pass
+    """
+    Base of every node. Nodes use __slots__ instead of a __dict__, and each class
+    lists the attributes that can hold child nodes in `_fields`, in evaluation
+    order, so generic walks never rebuild attribute dicts. `lineno`/`col` is the
+    1-based source position the parser stamps on the node (0 when unknown), and
+    `inferred_type` is the type the semantic checker computed for it (None until
+    checked).
+    """
+    __slots__ = ('lineno', 'col', 'inferred_type')
+    _fields = ()
+
+    def __new__(cls, *args, **kwargs):
+        node = super().__new__(cls)
+        node.lineno = 0
+        node.col = 0
+        node.inferred_type = None
+        return node
+
+    def forget_types(self):
+        """Clears `inferred_type` on this subtree."""
+        self.inferred_type = None
+        for child in self.child_nodes():
+            child.forget_types()
+
+    def child_nodes(self):
+        """Yields the direct child nodes, flattening list-valued fields."""
+        for field in self._fields:
+            child = getattr(self, field)
+            if isinstance(child, ASTNode):
+                yield child
+            elif isinstance(child, list):
+                for elem in child:
+                    if isinstance(elem, ASTNode):
+                        yield elem
 
 class ProgramNode(ASTNode):
+    __slots__ = ('children',)
+    _fields = ('children',)
+
     def __init__(self,children=None):
         self.children = children or []
 
+class ImportNode(ASTNode):
+    """`import name;` at the top of a file"""
+    __slots__ = ('name',)
+    _fields = ()
+
+    def __init__(self, name):
+        self.name = name
+
 class FunctionNode(ASTNode):
+    __slots__ = ('name', 'params', 'return_type', 'body', 'parent_class')
+    _fields = ('body',)
+
     def __init__(self, name, params, return_type, body):
         self.name = name
         self.params = params
@@ -14,39 +61,62 @@ class FunctionNode(ASTNode):
         self.parent_class = None
 
 class ReturnStatementNode(ASTNode):
+    __slots__ = ('returnVar',)
+    _fields = ('returnVar',)
+
     def __init__(self, returnVar=None):
         self.returnVar = returnVar
 
 class FunctionCallNode(ASTNode):
+    __slots__ = ('name', 'params')
+    _fields = ('name', 'params')
+
     def __init__(self, name, params,returnVar=None):
         self.name = name
         self.params = params
 
 class BinaryOperation(ASTNode):
+    __slots__ = ('left', 'right', 'op')
+    _fields = ('left', 'right')
+
     def __init__(self,left,op,right):
         self.left = left
         self.right = right
         self.op = op
 
 class SingleOperation(ASTNode):
+    __slots__ = ('right', 'op')
+    _fields = ('right',)
+
     def __init__(self,op,right):
         self.right = right
         self.op = op
 
 class VariableDeclarationNode(ASTNode):
+    __slots__ = ('name', 'var_type', 'value', 'initialized', 'size', 'parent_class', 'element_types')
+    _fields = ('value',)
+
     def __init__(self, name, var_type, value=None , size=None):
         self.name = name
         self.var_type = var_type
         self.value = value
         self.initialized = value is not None
         self.size = size
+        self.parent_class = None
+        self.element_types = None
 
 class AssignmentNode(ASTNode):
+    __slots__ = ('var', 'value')
+    _fields = ('var', 'value')
+
     def __init__(self, var, value):
         self.var = var
         self.value = value
 
 class IfWhileNode(ASTNode):
+    __slots__ = ('expr', 'stmt', 'stmtelse', 'is_while')
+    _fields = ('expr', 'stmt', 'stmtelse')
+
     def __init__(self, expr, stmt ,stmtelse=None , is_while=False):
         self.expr = expr
         self.stmt = stmt
@@ -54,69 +124,116 @@ class IfWhileNode(ASTNode):
         self.is_while = is_while
 
 class TernaryOperation(ASTNode):
-        def __init__(self, condition, body ,bodyelse):
-            self.condition = condition
-            self.body = body
-            self.bodyelse = bodyelse
+    __slots__ = ('condition', 'body', 'bodyelse')
+    _fields = ('condition', 'body', 'bodyelse')
+
+    def __init__(self, condition, body ,bodyelse):
+        self.condition = condition
+        self.body = body
+        self.bodyelse = bodyelse
 
 class ForNode(ASTNode):
+    __slots__ = ('var', 'exp1', 'exp2', 'stmt')
+    _fields = ('exp1', 'exp2', 'stmt')
+
     def __init__(self, var,exp1 , exp2, stmt ):
         self.var = var
         self.exp1 = exp1
         self.exp2 = exp2
         self.stmt = stmt
 
+class ForEachNode(ASTNode):
+    __slots__ = ('var', 'vector', 'stmt', 'var_type')
+    _fields = ('vector', 'stmt')
+
+    def __init__(self, var, vector, stmt):
+        self.var = var
+        self.vector = vector
+        self.stmt = stmt
+        self.var_type = None  # element type, set by the semantic checker
+
 class VectorNode(ASTNode):
+    __slots__ = ('elements',)
+    _fields = ('elements',)
+
     def __init__(self, elements):
         self.elements = elements
 
 class VectorAccessNode(ASTNode):
+    __slots__ = ('array_name', 'index')
+    _fields = ('array_name', 'index')
+
     def __init__(self, array_name, index):
         self.array_name = array_name
         self.index = index
 
 class BuiltinNode(ASTNode):
+    __slots__ = ('name', 'return_type')
+
     def __init__(self, name, return_type):
         self.name = name
         self.return_type = return_type
 
 class ScanNode(BuiltinNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("scan", "int")
 
 class PrintNode(BuiltinNode):
+    __slots__ = ('value',)
+    _fields = ('value',)
+
     def __init__(self, value):
         super().__init__("print", "null")
         self.value = value
 
 class ListNode(BuiltinNode):
+    __slots__ = ('size',)
+    _fields = ('size',)
+
     def __init__(self, size_expr):
         super().__init__("list", "vector")
         self.size = size_expr
 
 class LengthNode(BuiltinNode):
+    __slots__ = ('array',)
+    _fields = ('array',)
+
     def __init__(self, array_expr):
-        super().__init__("length", "int") 
+        super().__init__("length", "int")
         self.array = array_expr
 
 class ExitNode(BuiltinNode):
+    __slots__ = ('code',)
+    _fields = ('code',)
+
     def __init__(self, code_expr):
         super().__init__("exit", "noreturn")
         self.code = code_expr
 
 class RefNode(ASTNode):
     """Represents 'ref x' [cite: 88]"""
+    __slots__ = ('var_name',)
+    _fields = ('var_name',)
+
     def __init__(self, var_name):
         self.var_name = var_name
 
 class RefAssignmentNode(ASTNode):
     """Represents 'x := 5' [cite: 89, 91]"""
+    __slots__ = ('ref_var', 'value')
+    _fields = ('ref_var', 'value')
+
     def __init__(self, ref_var, value):
         self.ref_var = ref_var
         self.value = value
 
 class ClassNode(ASTNode):
     """Represents 'class Point { ... }' [cite: 70, 98]"""
+    __slots__ = ('name', 'fields', 'methods')
+    _fields = ('fields', 'methods')
+
     def __init__(self, name, fields, methods):
         self.name = name
         self.fields = fields
@@ -128,31 +245,59 @@ class ClassNode(ASTNode):
 
 class NewNode(ASTNode):
     """Represents 'new Point(2, 3)' [cite: 106, 127]"""
+    __slots__ = ('class_name', 'args')
+    _fields = ('args',)
+
     def __init__(self, class_name, args):
         self.class_name = class_name
         self.args = args
 
 class MethodCallNode(ASTNode):
-    """Represents 'p.move(1, 1)' [cite: 106]"""
+    """Represents 'p.move(1, 1)' [cite: 106]; `receiver_type` is the class the checker resolved"""
+    __slots__ = ('object_expr', 'method_name', 'args', 'receiver_type')
+    _fields = ('object_expr', 'args')
+
     def __init__(self, object_expr, method_name, args):
         self.object_expr = object_expr
         self.method_name = method_name
         self.args = args
+        self.receiver_type = None
+
+    def forget_types(self):
+        # a map lambda body is checked once per element type, so no one receiver class holds
+        self.receiver_type = None
+        super().forget_types()
 
 class FieldAccessNode(ASTNode):
     """Represents 'p.x'"""
+    __slots__ = ('object_expr', 'field_name')
+    _fields = ('object_expr',)
+
     def __init__(self, object_expr, field_name):
         self.object_expr = object_expr
         self.field_name = field_name
 
 class LambdaNode(ASTNode):
     """Represents 'lambda x -> x*2' [cite: 109, 128]"""
+    __slots__ = ('param', 'body')
+    _fields = ('body',)
+
     def __init__(self, param, body):
         self.param = param
         self.body = body
 
 class MapNode(ASTNode):
     """Represents 'map(lambda..., list)' [cite: 109, 129]"""
+    __slots__ = ('lambda_node', 'list_expr')
+    _fields = ('lambda_node', 'list_expr')
+
     def __init__(self, lambda_node, list_expr):
         self.lambda_node = lambda_node
-        self.list_expr = list_expr
\ No newline at end of file
+        self.list_expr = list_expr
+
+def node_attributes(node):
+    """Yields (name, value) for every slot of `node` except its position and what the checker records."""
+    for cls in reversed(type(node).__mro__):
+        for name in cls.__dict__.get('__slots__', ()):
+            if name not in ('lineno', 'col', 'inferred_type', 'receiver_type'):
+                yield name, getattr(node, name, None)
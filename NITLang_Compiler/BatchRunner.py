@@ -0,0 +1,178 @@
+"""
+Runs many compiled TSVM programs in parallel and compares their output.
+
+    python BatchRunner.py manifest.jsonl -j 8 --timeout 2 --max-steps 10000000
+
+The manifest has one JSON object per line:
+
+    {"name": "t1", "program": "t1.tsvm", "stdin": "3\\n", "expected": "7\\n"}
+
+`stdin_file` and `expected_file` may be given instead of `stdin` and
+`expected`; relative paths are taken from the manifest's directory. Every
+program is parsed once before the worker processes start, so forked workers
+already hold it; each worker then reuses one TSVM, reset between runs. The exit
+status is 1 unless every run passes.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from tsvm import TSVM, TSVMError, TSVMLimitExceeded
+
+_PROGRAMS = {}  # path -> TSVM.loaded_program(), filled before workers start
+_VM = None
+_RUNNING = False  # the time limit only interrupts the program itself
+
+
+def load_manifest(path):
+    """Returns the jobs of a manifest, with paths resolved and files read."""
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            job = {
+                "name": entry.get("name", entry["program"]),
+                "program": os.path.join(base, entry["program"]),
+                "stdin": entry.get("stdin", ""),
+                "expected": entry.get("expected"),
+            }
+            for key in ("stdin", "expected"):
+                if key + "_file" in entry:
+                    with open(os.path.join(base, entry[key + "_file"]), "r") as data:
+                        job[key] = data.read()
+            jobs.append(job)
+    return jobs
+
+
+def load_programs(paths):
+    for path in paths:
+        if path in _PROGRAMS:
+            continue
+        vm = TSVM()
+        try:
+            vm.load_program(path)
+        except TSVMError as e:
+            _PROGRAMS[path] = e
+            continue
+        _PROGRAMS[path] = vm.loaded_program()
+
+
+def _init_worker(paths, timeout):
+    global _VM
+    load_programs(paths)  # no-op when the programs came with the fork
+    _VM = TSVM()
+    if timeout and hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _on_timeout)
+
+
+def _on_timeout(signum, frame):
+    if _RUNNING:
+        raise TSVMLimitExceeded("Runtime Error: Time limit exceeded", _VM.ip)
+
+
+def run_job(job, max_steps=None, timeout=None):
+    """Runs one manifest entry on this process's VM; returns its result row."""
+    global _RUNNING
+    result = {"name": job["name"], "status": "error", "exit_code": None, "steps": 0, "seconds": 0.0, "error": None}
+    loaded = _PROGRAMS.get(job["program"])
+    if loaded is None or isinstance(loaded, TSVMError):
+        result["error"] = str(loaded or "program not loaded")
+        return result
+
+    vm = _VM
+    vm.use_program(loaded)
+    start = time.perf_counter()
+    if timeout and hasattr(signal, "SIGALRM"):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        _RUNNING = True
+        try:
+            run = vm.run_captured(job["stdin"], max_steps=max_steps)
+        finally:
+            _RUNNING = False
+        result["exit_code"] = run.exit_code
+        if job["expected"] is None:
+            result["status"] = "ok"
+        else:
+            result["status"] = "pass" if run.output == job["expected"] else "fail"
+    except TSVMLimitExceeded as e:
+        result["status"] = "limit"
+        result["error"] = str(e).strip()
+    except TSVMError as e:
+        result["error"] = str(e)
+    except Exception as e:  # a VM bug hit by one program must not sink the batch
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if timeout and hasattr(signal, "SIGALRM"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        result["seconds"] = round(time.perf_counter() - start, 6)
+        result["steps"] = vm.steps
+        vm.reset()
+    return result
+
+
+def _run_indexed(args):
+    index, job, max_steps, timeout = args
+    return index, run_job(job, max_steps, timeout)
+
+
+def run_batch(jobs, processes=None, max_steps=None, timeout=None):
+    """Runs `jobs` across worker processes; returns their results in manifest order."""
+    paths = sorted({job["program"] for job in jobs})
+    load_programs(paths)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    results = [None] * len(jobs)
+    work = [(i, job, max_steps, timeout) for i, job in enumerate(jobs)]
+    processes = processes or os.cpu_count() or 1
+    with context.Pool(processes, _init_worker, (paths, timeout)) as pool:
+        chunksize = max(1, len(work) // (processes * 8))
+        for index, result in pool.imap_unordered(_run_indexed, work, chunksize):
+            results[index] = result
+    return results
+
+
+def format_table(results):
+    lines = [f"{'name':<24} {'status':<6} {'exit':>4} {'instructions':>13} {'seconds':>9}  error"]
+    for r in results:
+        exit_code = "-" if r["exit_code"] is None else r["exit_code"]
+        lines.append(f"{r['name']:<24} {r['status']:<6} {exit_code:>4} {r['steps']:>13} "
+                     f"{r['seconds']:>9.4f}  {r['error'] or ''}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("manifest")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    arg_parser.add_argument("--max-steps", type=int, default=None, help="instruction limit per run")
+    arg_parser.add_argument("--timeout", type=float, default=None, help="wall-time limit per run, in seconds")
+    arg_parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = arg_parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    start = time.perf_counter()
+    results = run_batch(jobs, args.jobs, args.max_steps, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    print(format_table(results))
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    print(f"\n{len(results)} runs in {elapsed:.2f}s: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    return 0 if all(r["status"] in ("pass", "ok") for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
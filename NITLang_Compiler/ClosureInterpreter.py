@@ -0,0 +1,918 @@
+"""
+Runs checked NITLang programs directly, without generating TSVM code.
+
+    python ClosureInterpreter.py prog.txt
+
+`ClosureInterpreter` compiles every node of a checked AST once into a Python
+closure that holds its children's closures, and then calls the closures. It
+makes the code generator's decisions (evaluation order, the types that pick how
+values print and concatenate, frame offsets, which heap words are allocated)
+and calls the TSVM builtins on a TSVM's memory, so a program prints the same
+output, gets the same exit code and stops with the same runtime errors as its
+compiled code. What it does not reproduce: instruction counts, stack
+addresses (only visible through `ref`) and the exact depth at which the stack
+overflows, since registers are not saved on the stack. Programs that import
+modules are compiled and run on TSVM instead.
+"""
+import argparse
+import functools
+import io
+import operator
+import os
+import sys
+import threading
+
+import Parser
+from AST import *
+from CodeGenerator import CodeGenerator, _BRANCH_OPS
+from Linker import ModuleLoader, imports_of
+from MemoryLayout import DEFAULT_LAYOUT
+from SemanticAnalysis import SemanticChecker
+from tsvm import TSVM, TSVMError, TSVMRuntimeError, RunResult, _Halt, split_instruction
+
+_COMPARE = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt,
+    '>=': operator.ge, '==': operator.eq, '!=': operator.ne,
+}
+_ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul, '%': operator.mod}
+_PRINTERS = {'vector': 'vprint', 'string': 'sprint', 'int': 'nprint'}
+_THREAD_STACK = 256 << 20
+_FRAMES_PER_WORD = 16  # Python calls one word of TSVM stack can take, for the recursion limit
+
+
+def _fail(message):
+    raise TSVMRuntimeError(message)
+
+
+def _divide(a, b):
+    if b == 0:
+        _fail("Runtime Error: Division by zero")
+    return int(a / b)
+
+
+class ClosureInterpreter(CodeGenerator):
+    """
+    Interpreter over closures. It keeps the code generator's bookkeeping (var_map,
+    global slots, the type helpers) so that every choice the generator makes from
+    them comes out the same, but its visit methods return (closure, type) instead
+    of (register, type). An expression closure takes the frame pointer and returns
+    the value; a statement closure returns True when a `return` ran. Locals and
+    parameters live in the TSVM stack at the generator's offsets from the frame
+    pointer, and `for` variables get frame words past the locals.
+    """
+    def __init__(self, class_table, symbol_table, layout=None):
+        super().__init__(class_table, symbol_table, layout)
+        self.vm = TSVM(layout)
+        self.procs = {}
+        self.global_code = []
+        self.frame_words = 0
+        self.result = [0]  # r0: the value of the last return
+        self.sp = [self.vm.stack_top]
+
+        memory = self.vm.memory
+
+        def load(addr):
+            if 0 <= addr < len(memory):
+                val = memory[addr]
+                if val is None:
+                    _fail(f"Runtime Error: Read uninitialized memory at address {addr}")
+                return val
+            _fail(f"Runtime Error: Memory access out of bounds (ld) at {addr}")
+
+        def store(addr, val):
+            if 0 <= addr < len(memory):
+                memory[addr] = val
+            else:
+                _fail(f"Runtime Error: Memory access out of bounds (st) at {addr}")
+
+        self.load, self.store = load, store
+
+    def compile(self, ast):
+        """Compiles a checked program; top-level code goes to `global_code`, procedures to `procs`."""
+        children = ast.children if isinstance(ast, ProgramNode) else [ast]
+        for child in children:
+            stmt = self.statement(child)
+            if stmt is not None:
+                self.global_code.append(stmt)
+        self.global_frame = self.frame_words
+        return self
+
+    # -------------- RUNNING ------------------
+    def run(self):
+        """Runs the compiled program and returns its exit code; runtime errors raise TSVMRuntimeError."""
+        if 'main' not in self.procs:
+            raise TSVMError("No 'main' procedure found.")
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, _FRAMES_PER_WORD * self.vm.stack_top + 1000))
+        try:
+            return self._run_on_big_stack()
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def run_captured(self, stdin=""):
+        """Runs with `stdin` as input; returns a RunResult with everything printed (steps is None)."""
+        out = io.StringIO()
+        self.vm.stdout, self.vm.stdin = out, io.StringIO(stdin)
+        try:
+            exit_code = self.run()
+        except TSVMRuntimeError as e:
+            e.output = out.getvalue()
+            raise
+        finally:
+            self.vm.stdout = self.vm.stdin = None
+        return RunResult(exit_code, out.getvalue(), None)
+
+    def _run_on_big_stack(self):
+        outcome = []
+
+        def target():
+            try:
+                outcome.append(self._execute())
+            except BaseException as e:
+                outcome.append(e)
+
+        old_size = threading.stack_size()
+        threading.stack_size(_THREAD_STACK)
+        try:
+            thread = threading.Thread(target=target)
+            thread.start()
+        finally:
+            threading.stack_size(old_size)
+        thread.join()
+        if isinstance(outcome[0], BaseException):
+            raise outcome[0]
+        return outcome[0]
+
+    def _execute(self):
+        vm = self.vm
+        vm.mark_written(0, vm.heap_base)  # closures write the stack and globals directly
+        vm.reset()
+        vm.ip = None
+        top = vm.stack_top
+        self.result[0] = 0
+        self.sp[0] = top - self.global_frame
+        try:
+            for stmt in self.global_code:
+                stmt(top)
+            self.sp[0] = top
+            self.procs['main']()
+        except _Halt as halt:
+            return halt.code
+        except RecursionError:
+            _fail("Runtime Error: Stack overflow")
+        except TSVMError:
+            raise
+        except Exception as e:
+            raise TSVMRuntimeError(f"Runtime Error: {type(e).__name__}: {e}") from e
+        return 0
+
+    # -------------- STATEMENTS ------------------
+    def statement(self, node):
+        """Closure running the statement `node`, or None for definitions, which run nothing."""
+        if isinstance(node, (ProgramNode, list)):
+            stmts = [self.statement(child) for child in (node.children if isinstance(node, ProgramNode) else node)]
+            return self._block([stmt for stmt in stmts if stmt is not None])
+        if isinstance(node, (FunctionNode, ClassNode)):
+            self.visit(node)
+            return None
+        if isinstance(node, ImportNode):
+            return None
+        if isinstance(node, ReturnStatementNode):
+            return self._return(node)
+        if isinstance(node, IfWhileNode):
+            return self._if_while(node)
+        if isinstance(node, ForNode):
+            return self._for(node)
+        if isinstance(node, ForEachNode):
+            return self._for_each(node)
+        value, _ = self.visit(node)
+
+        def run(fp):
+            value(fp)
+        return run
+
+    def _block(self, stmts):
+        if len(stmts) == 1:
+            return stmts[0]
+        stmts = tuple(stmts)
+
+        def run(fp):
+            for stmt in stmts:
+                if stmt(fp):
+                    return True
+        return run
+
+    def _return(self, node):
+        result = self.result
+        if node.returnVar is None:
+            return lambda fp: True
+        value, _ = self.visit(node.returnVar)
+
+        def run(fp):
+            result[0] = value(fp)
+            return True
+        return run
+
+    def _if_while(self, node):
+        cond = self.condition(node.expr)
+        body = self.statement(node.stmt)
+        if node.is_while:
+            def run(fp):
+                while cond(fp):
+                    if body(fp):
+                        return True
+            return run
+
+        other = self.statement(node.stmtelse) if node.stmtelse else None
+
+        def run(fp):
+            if cond(fp):
+                return body(fp)
+            if other is not None:
+                return other(fp)
+        return run
+
+    def _loop_body(self, node, var_type):
+        """Compiles a for loop's body with its variable in a new frame word; returns (body, offset)."""
+        self.frame_words += 1
+        offset = self.frame_words
+        outer = self.var_map.get(node.var)
+        self.var_map[node.var] = {'scope': 'loop', 'offset': offset, 'var_type': var_type}
+        body = self.statement(node.stmt)
+        if outer is None:
+            del self.var_map[node.var]
+        else:
+            self.var_map[node.var] = outer
+        return body, offset
+
+    def _for(self, node):
+        memory = self.vm.memory
+        start, _ = self.visit(node.exp1)
+        end, _ = self.visit(node.exp2)
+        body, offset = self._loop_body(node, "int")
+
+        def run(fp):
+            i = start(fp)
+            last = end(fp)
+            slot = fp - offset
+            while i <= last:
+                memory[slot] = i
+                if body(fp):
+                    return True
+                i += 1
+        return run
+
+    def _for_each(self, node):
+        memory, load = self.vm.memory, self.load
+        vector, _ = self.visit(node.vector)
+        body, offset = self._loop_body(node, node.var_type or "int")
+
+        def run(fp):
+            ptr = vector(fp)
+            end = ptr + load(ptr - 1)
+            slot = fp - offset
+            while ptr < end:
+                memory[slot] = load(ptr)
+                if body(fp):
+                    return True
+                ptr += 1
+        return run
+
+    def condition(self, expr):
+        """Closure whose truth is that of the condition `expr`, evaluating what `_emit_branch` evaluates."""
+        if isinstance(expr, BinaryOperation) and expr.op in ('&&', '||'):
+            left, right = self.condition(expr.left), self.condition(expr.right)
+            if expr.op == '&&':
+                return lambda fp: left(fp) and right(fp)
+            return lambda fp: left(fp) or right(fp)
+        if isinstance(expr, SingleOperation) and expr.op == '!' and self._is_bool(expr.right):
+            operand = self.condition(expr.right)
+            return lambda fp: not operand(fp)
+        if isinstance(expr, BinaryOperation) and expr.op in _BRANCH_OPS:
+            left, _ = self.visit(expr.left)
+            right, _ = self.visit(expr.right)
+            compare = _COMPARE[expr.op]
+            if type(expr.right) is int:
+                value = expr.right
+                return lambda fp: compare(left(fp), value)
+            return lambda fp: compare(left(fp), right(fp))
+        value, _ = self.visit(expr)
+        return value
+
+    # -------------- PROCEDURES ------------------
+    def visit_FunctionNode(self, node):
+        self.current_function = node
+        old_var_map, old_fp_offset, old_frame_words = self.var_map, self.fp_offset, self.frame_words
+        self.var_map = {}
+        self.fp_offset = 1
+
+        label = node.name
+        if self.current_class:
+            label = f"{self.current_class['name']}_{node.name}"
+        self.frame_words = self.count_locals(node.body)
+
+        param_offset = 2
+        if self.current_class:
+            self.var_map['this'] = {'scope': 'param', 'offset': param_offset, 'var_type': self.current_class['name']}
+            param_offset += 1
+            for fname, finfo in self.current_class['fields'].items():
+                self.var_map[fname] = {'scope': 'field', 'offset': finfo['offset'], 'var_type': finfo['var_type']}
+        for pname, ptype in node.params:
+            self.var_map[pname] = {'scope': 'param', 'offset': param_offset, 'var_type': ptype}
+            param_offset += 1
+
+        body = self.statement(node.body)
+        self.procs[label] = self._proc(label, body, self.frame_words)
+
+        self.current_function = None
+        self.var_map, self.fp_offset, self.frame_words = old_var_map, old_fp_offset, old_frame_words
+        return self._r0, "null"
+
+    def _proc(self, label, body, frame):
+        """A procedure: pushes the return address and frame pointer, reserves `frame` words and runs `body`."""
+        sp, limit = self.sp, self.vm.stack_limit
+
+        def proc():
+            fp = sp[0] - 2
+            if fp - frame < limit:
+                _fail("Runtime Error: Stack overflow")
+            sp[0] = fp - frame
+            body(fp)
+            sp[0] = fp + 2
+        return proc
+
+    def _call(self, label, args):
+        """
+        Closure pushing the values of `args` in order (then `this`, when it is
+        called with one), calling `label`, popping them and giving r0.
+        """
+        procs, result, sp, memory, limit = self.procs, self.result, self.sp, self.vm.memory, self.vm.stack_limit
+        args = tuple(args)
+
+        def push(val):
+            top = sp[0] - 1
+            if top < limit:
+                _fail("Runtime Error: Stack overflow")
+            sp[0] = top
+            memory[top] = val
+
+        def call(fp, this=None):
+            base = sp[0]
+            for arg in args:
+                push(arg(fp))
+            if this is not None:
+                push(this)
+            procs[label]()
+            sp[0] = base
+            return result[0]
+        return call
+
+    # -------------- EXPRESSIONS ------------------
+    def visit(self, node):
+        if node is None: return self._r0, "null"
+        if isinstance(node, int): return self.visit_Number(node)
+        if isinstance(node, str): return self.visit_Identifier(node)
+        if isinstance(node, ASTNode):
+            method = getattr(self, f'visit_{type(node).__name__}', self.generic_visit)
+            return method(node)
+        if isinstance(node, list):
+            items = [self.visit(item)[0] for item in node]
+            return self._sequence(items), "null"
+        return self._r0, "unknown"
+
+    def _r0(self, fp):
+        return self.result[0]
+
+    def _sequence(self, items):
+        """Closure evaluating `items` for their effects; its value is r0, like a statement's register 0."""
+        result = self.result
+
+        def run(fp):
+            for item in items:
+                item(fp)
+            return result[0]
+        return run
+
+    def generic_visit(self, node):
+        return self._sequence([self.visit(child)[0] for child in node.child_nodes()]), "null"
+
+    def visit_ProgramNode(self, node):
+        stmt = self.statement(node)
+        result = self.result
+
+        def run(fp):
+            stmt(fp)
+            return result[0]
+        return run, "null"
+
+    def visit_ClassNode(self, node):
+        self.current_class = self.class_table[node.name]
+        for method_name, method_info in self.current_class['methods'].items():
+            if method_info['node'] is not None:
+                self.visit(method_info['node'])
+        self.current_class = None
+        return self._r0, "null"
+
+    def visit_Number(self, num):
+        return (lambda fp: num), "int"
+
+    def visit_Identifier(self, name):
+        if name in ('true', 'false', 'null'):
+            value = 1 if name == 'true' else 0
+            return (lambda fp: value), ("null" if name == 'null' else "bool")
+
+        if name.startswith('"') or name.startswith("'"):
+            # the characters `sload` gets from the generated line, which ends at a newline or `#`
+            line = f"sload r1, {name}".split('\n')[0]
+            text = split_instruction(line.split('#')[0].strip())[2]
+            store_string = self.vm.store_string
+            return (lambda fp: store_string(text)), "string"
+
+        memory = self.vm.memory
+        info = self.var_map.get(name) or self.global_var_map.get(name)
+        var_type = info.get('var_type', 'unknown') if info is not None else "unknown"
+        scope = info['scope'] if info is not None else None
+        if scope in ('local', 'loop'):
+            offset = info['offset']
+            return (lambda fp: memory[fp - offset]), var_type
+        if scope == 'param':
+            offset = info['offset']
+            return (lambda fp: memory[fp + offset]), var_type
+        if scope == 'field':
+            this, load, offset = self.var_map['this']['offset'], self.load, info['offset']
+            return (lambda fp: load(memory[fp + this] + offset)), var_type
+        addr = self.global_base_addr + info['offset'] if scope == 'global' else 0
+        return (lambda fp: memory[addr]), var_type
+
+    def _assign(self, name, value):
+        """Closure storing the value of `value` in the variable `name` and giving it back."""
+        memory = self.vm.memory
+        info = self.var_map.get(name) or self.global_var_map.get(name)
+        scope = info['scope'] if info is not None else None
+        if scope in ('local', 'loop', 'param'):
+            offset = -info['offset'] if scope != 'param' else info['offset']
+
+            def run(fp):
+                val = value(fp)
+                memory[fp + offset] = val
+                return val
+        elif scope == 'field':
+            this, store, offset = self.var_map['this']['offset'], self.store, info['offset']
+
+            def run(fp):
+                val = value(fp)
+                store(memory[fp + this] + offset, val)
+                return val
+        else:
+            addr = self.global_base_addr + info['offset'] if scope == 'global' else 0
+
+            def run(fp):
+                val = value(fp)
+                memory[addr] = val
+                return val
+        return run
+
+    def visit_VariableDeclarationNode(self, node):
+        result = self.result
+        if self.current_function is None:
+            offset = self.global_offset
+            self.global_var_map[node.name] = {'scope': 'global', 'offset': offset, 'var_type': node.var_type}
+            self.global_offset += 1
+        else:
+            extra_info = {}
+            if node.element_types is not None:
+                extra_info['element_types'] = list(node.element_types)
+            elif node.var_type == 'vector':
+                if isinstance(node.value, VectorNode):
+                    types = []
+                    for e in node.value.elements:
+                        if isinstance(e, int):
+                            types.append('int')
+                        elif isinstance(e, str):
+                            if e.startswith('"') or e.startswith("'"):
+                                types.append('string')
+                            elif e in self.var_map:
+                                types.append(self.var_map[e].get('var_type', 'unknown'))
+                            else:
+                                types.append('unknown')
+                        else:
+                            types.append('unknown')
+                    extra_info['element_types'] = types
+                elif isinstance(node.value, ListNode):
+                    if isinstance(node.value.size, int):
+                        extra_info['element_types'] = ['unknown'] * node.value.size
+            self.var_map[node.name] = {'scope': 'local', 'offset': self.fp_offset, 'var_type': node.var_type,
+                                       **extra_info}
+            self.fp_offset += 1
+
+        if node.value is None:
+            return self._r0, "null"
+        value, _ = self.visit(node.value)
+        assign = self._assign(node.name, value)
+
+        def run(fp):
+            assign(fp)
+            return result[0]
+        return run, "null"
+
+    def visit_AssignmentNode(self, node):
+        value, value_type = self.visit(node.value)
+
+        if isinstance(node.var, str):
+            return self._assign(node.var, value), value_type
+
+        if isinstance(node.var, VectorAccessNode):
+            array, _ = self.visit(node.var.array_name)
+            index, _ = self.visit(node.var.index)
+            store = self.store
+
+            def run(fp):
+                val = value(fp)
+                store(array(fp) + index(fp), val)
+                return val
+
+            arr_name = node.var.array_name
+            if isinstance(arr_name, str) and arr_name in self.var_map:
+                if 'element_types' in self.var_map[arr_name]:
+                    idx = node.var.index
+                    if isinstance(idx, int):
+                        try:
+                            self.var_map[arr_name]['element_types'][idx] = value_type
+                        except IndexError:
+                            pass
+            return run, value_type
+
+        if isinstance(node.var, FieldAccessNode):
+            obj, obj_type = self.visit(node.var.object_expr)
+            if obj_type not in self.class_table:
+                return self._sequence([value, obj]), value_type
+            offset, store = self.class_table[obj_type]['fields'][node.var.field_name]['offset'], self.store
+
+            def run(fp):
+                val = value(fp)
+                store(obj(fp) + offset, val)
+                return val
+            return run, value_type
+
+        return value, value_type
+
+    def visit_RefAssignmentNode(self, node):
+        value, value_type = self.visit(node.value)
+        ptr, _ = self.visit(node.ref_var)
+        store = self.store
+
+        def run(fp):
+            val = value(fp)
+            addr = ptr(fp)
+            if addr == 0:
+                raise _Halt(1)  # Null Pointer Assignment
+            store(addr, val)
+            return val
+        return run, value_type
+
+    def _logical(self, node):
+        cond = self.condition(node)
+        return (lambda fp: 1 if cond(fp) else 0), "bool"
+
+    def visit_BinaryOperation(self, node):
+        if node.op in ('&&', '||'):
+            return self._logical(node)
+        left, left_type = self.visit(node.left)
+        right, right_type = self.visit(node.right)
+        left_type = self._type_of(node.left, left_type)
+        right_type = self._type_of(node.right, right_type)
+
+        if node.op == '+':
+            if self._type_of(node, None) == 'string' or left_type == 'string' or right_type == 'string':
+                return self._concat(left, left_type, right, right_type), "string"
+
+        if node.op in _BRANCH_OPS:
+            compare = _COMPARE[node.op]
+            return (lambda fp: 1 if compare(left(fp), right(fp)) else 0), "bool"
+        if node.op == '/':
+            return (lambda fp: _divide(left(fp), right(fp))), "int"
+        op = _ARITHMETIC[node.op]
+        if type(node.right) is int:
+            value = node.right
+            return (lambda fp: op(left(fp), value)), "int"
+        return (lambda fp: op(left(fp), right(fp))), "int"
+
+    def _to_string(self, type_str):
+        """The builtin that turns a value of `type_str` into a string for concatenation, or None."""
+        if type_str in ('int', 'bool'):
+            return self.vm.builtins['itos']
+        if type_str == 'vector':
+            return self.vm.builtins['vtos']
+        return None
+
+    def _concat(self, left, left_type, right, right_type):
+        sconcat = self.vm.builtins['sconcat']
+        to_left, to_right = self._to_string(left_type), self._to_string(right_type)
+
+        def run(fp):
+            a = left(fp)
+            b = right(fp)
+            if to_left is not None:
+                a = to_left(a)
+            if to_right is not None:
+                b = to_right(b)
+            return sconcat(a, b)
+        return run
+
+    def visit_SingleOperation(self, node):
+        operand, operand_type = self.visit(node.right)
+        if node.op == '-':
+            return (lambda fp: -operand(fp)), "int"
+        if node.op == '!':
+            if operand_type == "ref" or operand_type.startswith("ref_"):
+                load = self.load
+
+                def run(fp):
+                    addr = operand(fp)
+                    if addr == 0:
+                        raise _Halt(1)  # Null Pointer Dereference
+                    return load(addr)
+                return run, operand_type.split("_", 1)[1] if "_" in operand_type else "int"
+            return (lambda fp: 1 if operand(fp) == 0 else 0), "bool"
+        return self._r0, "unknown"
+
+    def visit_TernaryOperation(self, node):
+        cond = self.condition(node.condition)
+        body, true_type = self.visit(node.body)
+        other, _ = self.visit(node.bodyelse)
+        return (lambda fp: body(fp) if cond(fp) else other(fp)), self._type_of(node, true_type)
+
+    def _printer(self, expr):
+        value, type_str = self.visit(expr)
+        return value, self.vm.builtins[_PRINTERS.get(self._type_of(expr, type_str), 'iput')]
+
+    def _print(self, expr):
+        parts = []
+        if expr is not None:
+            if self._is_concat(expr):
+                exprs = []
+                self._flatten_concat(expr, exprs)
+            else:
+                exprs = [expr]
+            parts = [self._printer(e) for e in exprs]
+        nl, result = self.vm.builtins['nl'], self.result
+
+        def run(fp):
+            for value, write in parts:
+                write(value(fp))
+            nl()
+            return result[0]
+        return run
+
+    def visit_PrintNode(self, node):
+        return self._print(node.value), "null"
+
+    def visit_ScanNode(self, node):
+        iget = self.vm.builtins['iget']
+        return (lambda fp: iget()), "int"
+
+    def visit_FunctionCallNode(self, node):
+        if node.name == 'print':
+            return self._print(node.params[0] if node.params else None), "null"
+        if node.name == 'scan':
+            return self.visit_ScanNode(node)
+        if node.name == 'exit':
+            code, _ = self.visit(node.params[0])
+            exit_ = self.vm.builtins['exit']
+            return (lambda fp: exit_(code(fp))), "noreturn"
+
+        args = [self.visit(arg)[0] for arg in reversed(node.params)]
+        finfo = self.global_symbol_table.get(node.name)
+        return_type = finfo['return_type'] if finfo else "unknown"
+        return self._call(node.name, args), self._type_of(node, return_type)
+
+    def visit_MethodCallNode(self, node):
+        args = [self.visit(arg)[0] for arg in reversed(node.args)]
+        this, class_name = self.visit(node.object_expr)
+        if class_name not in self.class_table:
+            return self._sequence(args + [this]), "unknown"
+        call = self._call(f"{class_name}_{node.method_name}", args + [this])
+        return call, self.class_table[class_name]['methods'][node.method_name]['return_type']
+
+    def visit_NewNode(self, node):
+        class_info = self.class_table.get(node.class_name)
+        if not class_info:
+            return (lambda fp: 0), "unknown"
+        field_count = len(class_info['fields'])
+        mem = self.vm.builtins['mem']
+        if 'init' not in class_info['methods']:
+            return (lambda fp: mem(field_count)), node.class_name
+
+        init = self._call(f"{node.class_name}_init", [self.visit(arg)[0] for arg in reversed(node.args)])
+
+        def run(fp):
+            ptr = mem(field_count)
+            init(fp, ptr)
+            return ptr
+        return run, node.class_name
+
+    def visit_FieldAccessNode(self, node):
+        obj, obj_type = self.visit(node.object_expr)
+        if obj_type not in self.class_table:
+            return (lambda fp: 0), "unknown"
+        field_info = self.class_table[obj_type]['fields'][node.field_name]
+        load, offset = self.load, field_info['offset']
+        return (lambda fp: load(obj(fp) + offset)), field_info['var_type']
+
+    def visit_RefNode(self, node):
+        name = node.var_name
+        info = self.var_map.get(name) or self.global_var_map.get(name)
+        var_type = info.get('var_type', 'unknown') if info is not None else "unknown"
+        scope = info['scope'] if info is not None else None
+        memory = self.vm.memory
+        if scope in ('local', 'loop', 'param'):
+            offset = -info['offset'] if scope != 'param' else info['offset']
+            return (lambda fp: fp + offset), f"ref_{var_type}"
+        if scope == 'field':
+            this, offset = self.var_map['this']['offset'], info['offset']
+            return (lambda fp: memory[fp + this] + offset), f"ref_{var_type}"
+        addr = self.global_base_addr + info['offset'] if scope == 'global' else 0
+        return (lambda fp: addr), f"ref_{var_type}"
+
+    def visit_ListNode(self, node):
+        size, _ = self.visit(node.size)
+        mem, store = self.vm.builtins['mem'], self.store
+
+        def run(fp):
+            n = size(fp)
+            base = mem(n + 1)
+            store(base, n)
+            return base + 1
+        return run, "vector"
+
+    def visit_LengthNode(self, node):
+        array, _ = self.visit(node.array)
+        load = self.load
+        return (lambda fp: load(array(fp) - 1)), "int"
+
+    def visit_VectorAccessNode(self, node):
+        array, _ = self.visit(node.array_name)
+        index, _ = self.visit(node.index)
+        vget = self.vm.builtins['vget']
+        return (lambda fp: vget(array(fp), index(fp))), self._type_of(node, "int")
+
+    def visit_VectorNode(self, node):
+        size = len(node.elements)
+        elements = tuple(self.visit(elem)[0] for elem in node.elements)
+        mem, memory = self.vm.builtins['mem'], self.vm.memory
+
+        def run(fp):
+            base = mem(size + 1)
+            memory[base] = size
+            for i, elem in enumerate(elements, base + 1):
+                memory[i] = elem(fp)
+            return base + 1
+        return run, "vector"
+
+    def visit_LambdaNode(self, node):
+        return self._r0, "function"
+
+    def visit_MapNode(self, node):
+        lambda_node = node.lambda_node
+        list_expr_node = node.list_expr
+
+        element_types = []
+        if isinstance(list_expr_node, str):
+            if list_expr_node in self.var_map:
+                element_types = self.var_map[list_expr_node].get('element_types', [])
+            elif list_expr_node in self.global_symbol_table:
+                element_types = self.global_symbol_table[list_expr_node].get('element_types', [])
+        if not element_types:
+            element_types = ['int']
+        non_unknown_types = [t for t in element_types if t != 'unknown']
+        unique_types = set(non_unknown_types) or {'int'}
+
+        lambdas = {}
+        old_var_map, old_fp_offset, old_func = self.var_map, self.fp_offset, self.current_function
+        result = self.result
+        for t in unique_types:
+            self.var_map = {lambda_node.param: {'scope': 'param', 'offset': 2, 'var_type': t}}
+            self.fp_offset = 1
+            self.current_function = lambda_node
+            body, _ = self.visit(lambda_node.body)
+
+            def run(fp, body=body):
+                result[0] = body(fp)
+            lambdas[t] = self._proc(f"lambda_{t}", run, 0)
+        self.var_map, self.fp_offset, self.current_function = old_var_map, old_fp_offset, old_func
+
+        if len(set(non_unknown_types)) <= 1:
+            only = lambdas[next(iter(unique_types))]
+            dispatch = None
+        else:
+            dispatch = {}
+            for idx, t in enumerate(element_types):
+                if t in lambdas:
+                    dispatch.setdefault(idx, lambdas[t])
+
+        source, _ = self.visit(list_expr_node)
+        builtins, load, store = self.vm.builtins, self.load, self.store
+        mem, vget = builtins['mem'], builtins['vget']
+        sp, memory, limit = self.sp, self.vm.memory, self.vm.stack_limit
+
+        def run(fp):
+            src = source(fp)
+            size = load(src - 1)
+            base = mem(size + 1)
+            store(base, size)
+            out = 0
+            for i in range(size):
+                elem = vget(src, i)
+                top = sp[0] - 1
+                if top < limit:
+                    _fail("Runtime Error: Stack overflow")
+                sp[0] = top
+                memory[top] = elem
+                proc = only if dispatch is None else dispatch.get(i)
+                if proc is not None:
+                    proc()
+                    out = result[0]
+                sp[0] += 1
+                store(base + 1 + i, out)
+            return base + 1
+        return run, "vector"
+
+
+# -------------- RUNNING SOURCE ------------------
+def load_program(ast, layout=None):
+    """Checks a parsed program; returns (semantic errors, compiled ClosureInterpreter or None)."""
+    checker = SemanticChecker()
+    semantic_errors = checker.check(ast)
+    if semantic_errors:
+        return semantic_errors, None
+    interpreter = ClosureInterpreter(checker.class_table, checker.global_symbol_table, layout)
+    return semantic_errors, interpreter.compile(ast)
+
+
+def load_source(data, layout=None, use_fast_lexer=False):
+    """Parses and checks `data`; returns (syntax errors, semantic errors, compiled ClosureInterpreter or None)."""
+    ast = Parser.parse_source(data, use_fast_lexer)
+    syntax_errors = list(Parser.error)
+    if syntax_errors:
+        return syntax_errors, [], None
+    return (syntax_errors,) + load_program(ast, layout)
+
+
+def _compile_and_run(data, args):
+    """Compiles a program that imports modules and runs it on TSVM; returns (errors, exit code)."""
+    source_dir = os.path.dirname(os.path.abspath(args.source))
+    loader = ModuleLoader(functools.partial(Parser.compile_object, layout=args.layout,
+                                            use_fast_lexer=args.fast_lexer),
+                          [source_dir] + args.include, args.layout)
+    syntax_errors, errors, code = Parser.compile_source(data, use_fast_lexer=args.fast_lexer, layout=args.layout,
+                                                        loader=loader)
+    if code is None:
+        return syntax_errors + errors, 1
+    vm = TSVM(args.layout)
+    vm.load_lines(code.splitlines())
+    return [], vm.run()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run a NITLang program without generating TSVM code.")
+    arg_parser.add_argument("source")
+    arg_parser.add_argument("-I", "--include", action="append", default=[], metavar="DIR",
+                            help="look for imported modules in DIR too (after the source's directory)")
+    arg_parser.add_argument("--fast-lexer", action="store_true",
+                            help="tokenize with FastLexer instead of the PLY lexer")
+    arg_parser.add_argument("--layout", type=Parser._layout_arg, default=DEFAULT_LAYOUT, metavar="SPEC",
+                            help="TSVM segment sizes in words, e.g. stack=100000,heap=1000000")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        with open(args.source, "r") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"Error: {e}")
+        return 1
+
+    try:
+        ast = Parser.parse_source(data, args.fast_lexer)
+        errors = list(Parser.error)
+        if not errors:
+            if imports_of(ast):
+                errors, exit_code = _compile_and_run(data, args)
+            else:
+                errors, program = load_program(ast, args.layout)
+                if program is not None:
+                    exit_code = program.run()
+    except TSVMRuntimeError as e:
+        print(e)
+        return 1
+    except TSVMError as e:
+        print(f"Error: {e}")
+        return 1
+    if errors:
+        for err in errors:
+            print(err)
+        return 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
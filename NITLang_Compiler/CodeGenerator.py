@@ -1,8 +1,12 @@
 from AST import *
+from MemoryLayout import DEFAULT_LAYOUT
 import copy
 
+_BRANCH_OPS = {'<': 'blt', '<=': 'ble', '>': 'bgt', '>=': 'bge', '==': 'beq', '!=': 'bne'}
+_NEGATED = {'<': '>=', '<=': '>', '>': '<=', '>=': '<', '==': '!=', '!=': '=='}
+
 class CodeGenerator:
-    def __init__(self, class_table, symbol_table):
+    def __init__(self, class_table, symbol_table, layout=None, stack_allocated=None, relocatable=False):
         self.code = []
         self.current_function = None
         self.class_table = class_table
@@ -16,9 +20,13 @@ class CodeGenerator:
         self.fp_offset = 0
         
         self.global_var_map = {} 
-        self.global_base_addr = 10000 
+        self.global_base_addr = (layout or DEFAULT_LAYOUT).global_base
         self.global_offset = 0
 
+        self.stack_allocated = stack_allocated or set()  # allocation nodes placed in their frame
+        self.frame_blocks = {}
+        self.relocatable = relocatable  # address globals through `@gN` slots the linker resolves
+
     def emit(self, instruction):
         self.code.append(instruction)
 
@@ -42,8 +50,23 @@ class CodeGenerator:
                 return True
         return False
 
+    def _type_of(self, expr, fallback):
+        """The type the semantic checker recorded on `expr`, or `fallback` when it has none."""
+        if isinstance(expr, ASTNode) and expr.inferred_type not in (None, 'unknown'):
+            return expr.inferred_type
+        return fallback
+
+    def _is_concat(self, expr):
+        """Is this a '+' that concatenates strings?"""
+        if not (isinstance(expr, BinaryOperation) and expr.op == '+'):
+            return False
+        if expr.inferred_type is not None:
+            return expr.inferred_type == 'string'
+        return self._contains_string_expr(expr)
+
     def _contains_string_expr(self, node):
-        """Does this subtree contain any expression that is (definitely) a string?"""
+        """Does this subtree contain any expression that is (definitely) a string?
+        Only used for nodes the checker did not type, i.e. map lambda bodies."""
         if node is None:
             return False
 
@@ -54,13 +77,9 @@ class CodeGenerator:
             return self._contains_string_expr(node.left) or self._contains_string_expr(node.right)
 
         if isinstance(node, ASTNode):
-            for v in vars(node).values():
-                if isinstance(v, ASTNode) and self._contains_string_expr(v):
+            for child in node.child_nodes():
+                if self._contains_string_expr(child):
                     return True
-                if isinstance(v, list):
-                    for e in v:
-                        if isinstance(e, ASTNode) and self._contains_string_expr(e):
-                            return True
 
         return False
 
@@ -68,7 +87,7 @@ class CodeGenerator:
         """
         Flatten a + chain that involves strings into a list of parts.
         """
-        if isinstance(expr, BinaryOperation) and expr.op == '+' and self._contains_string_expr(expr):
+        if self._is_concat(expr):
             self._flatten_concat(expr.left, parts)
             self._flatten_concat(expr.right, parts)
         else:
@@ -76,10 +95,13 @@ class CodeGenerator:
 
     def _emit_print_value(self, expr):
         value_reg, type_str = self.visit(expr)
+        type_str = self._type_of(expr, type_str)
         if type_str == 'vector':
             self.emit(f"call vprint, r{value_reg}")
         elif type_str == 'string':
             self.emit(f"call sprint, r{value_reg}")
+        elif type_str == 'int':
+            self.emit(f"call nprint, r{value_reg}")
         else:
             self.emit(f"call iput, r{value_reg}")
 
@@ -136,13 +158,8 @@ class CodeGenerator:
         return 0, "unknown"
 
     def generic_visit(self, node):
-        if not hasattr(node, '__dict__'): return 0, "null"
-        for _, value in vars(node).items():
-            if isinstance(value, list):
-                for item in value:
-                    if isinstance(item, ASTNode): self.visit(item)
-            elif isinstance(value, ASTNode):
-                self.visit(value)
+        for child in node.child_nodes():
+            self.visit(child)
         return 0, "null"
 
     def visit_ProgramNode(self, node):
@@ -213,23 +230,32 @@ class CodeGenerator:
     def count_locals(self, node):
         count = 0
         if isinstance(node, VariableDeclarationNode):
-            count += 1
-        
-        for field in getattr(node, '__dict__', {}):
-            child = getattr(node, field)
-            if isinstance(child, ASTNode):
-                if not isinstance(child, (FunctionNode, ClassNode)):
-                    count += self.count_locals(child)
-            elif isinstance(child, list):
-                for elem in child:
-                    if isinstance(elem, ASTNode):
-                         if not isinstance(elem, (FunctionNode, ClassNode)):
-                            count += self.count_locals(elem)
+            count += 1 + self._frame_words(node.value)
+        
+        for child in node.child_nodes():
+            if not isinstance(child, (FunctionNode, ClassNode)):
+                count += self.count_locals(child)
         return count
 
+    def _frame_words(self, value):
+        """Words of stack frame an allocation in `stack_allocated` takes, else 0."""
+        if value not in self.stack_allocated:
+            return 0
+        if isinstance(value, NewNode):
+            return len(self.class_table[value.class_name]['fields'])
+        if isinstance(value, VectorNode):
+            return len(value.elements) + 1
+        return value.size + 1
+
+    def _frame_block(self, node):
+        """Register holding the lowest address of the frame block reserved for `node`."""
+        addr_reg = self.new_register()
+        self.emit(f"sub r{addr_reg}, fp, {self.frame_blocks[node]}")
+        return addr_reg
+
     def visit_VariableDeclarationNode(self, node):
         if self.current_function is None:
-            offset = self.global_offset
+            offset = f"@g{self.global_offset}" if self.relocatable else self.global_offset
             self.global_var_map[node.name] = {'scope': 'global', 'offset': offset, 'var_type': node.var_type}
             self.global_offset += 1
             
@@ -247,7 +273,9 @@ class CodeGenerator:
             offset = self.fp_offset
             
             extra_info = {}
-            if node.var_type == 'vector':
+            if node.element_types is not None:
+                extra_info['element_types'] = list(node.element_types)
+            elif node.var_type == 'vector':
                 if isinstance(node.value, VectorNode):
                     types = []
                     for e in node.value.elements:
@@ -269,6 +297,10 @@ class CodeGenerator:
 
             self.var_map[node.name] = {'scope': 'local', 'offset': offset, 'var_type': node.var_type, **extra_info}
             self.fp_offset += 1
+            words = self._frame_words(node.value)
+            if words:
+                self.fp_offset += words
+                self.frame_blocks[node.value] = self.fp_offset - 1
             
             if node.value is not None:
                 value_reg, _ = self.visit(node.value)
@@ -330,12 +362,83 @@ class CodeGenerator:
         self.emit(f"st [r{ptr_reg}], r{value_reg}")
         return value_reg, value_type
 
+    def _is_bool(self, expr):
+        if isinstance(expr, str):
+            if expr in ('true', 'false'):
+                return True
+            info = self.var_map.get(expr) or self.global_var_map.get(expr)
+            return info is not None and info.get('var_type') == 'bool'
+        return isinstance(expr, ASTNode) and expr.inferred_type == 'bool'
+
+    def _is_trivial(self, expr):
+        """Is `expr` cheap, free of side effects and unable to fail, so it may be evaluated eagerly?"""
+        if isinstance(expr, int):
+            return True
+        if isinstance(expr, str):
+            return not expr.startswith(('"', "'"))  # a string literal allocates
+        if isinstance(expr, SingleOperation):
+            return (expr.op == '-' or self._is_bool(expr.right)) and self._is_trivial(expr.right)
+        if isinstance(expr, BinaryOperation):
+            return (expr.op in ('+', '-', '*', '&&', '||') or expr.op in _BRANCH_OPS) and \
+                not self._is_concat(expr) and self._is_trivial(expr.left) and self._is_trivial(expr.right)
+        return False
+
+    def _emit_branch(self, expr, when, label):
+        """
+        Jumps to `label` when the condition `expr` is `when` (True or False), falling
+        through otherwise. `&&`, `||` and `!` become control flow, comparisons become
+        fused compare-and-branch instructions, and only what decides the outcome runs.
+        """
+        if isinstance(expr, BinaryOperation) and expr.op in ('&&', '||'):
+            if (expr.op == '&&') != when:
+                # a false operand decides &&, a true one decides ||
+                self._emit_branch(expr.left, when, label)
+                self._emit_branch(expr.right, when, label)
+            else:
+                skip_label = self.new_label()
+                self._emit_branch(expr.left, not when, skip_label)
+                self._emit_branch(expr.right, when, label)
+                self.emit(f"{skip_label}:")
+            return
+        if isinstance(expr, SingleOperation) and expr.op == '!' and self._is_bool(expr.right):
+            self._emit_branch(expr.right, not when, label)
+            return
+        if isinstance(expr, BinaryOperation) and expr.op in _BRANCH_OPS:
+            left_reg, _ = self.visit(expr.left)
+            right_reg, _ = self.visit(expr.right)
+            op = expr.op if when else _NEGATED[expr.op]
+            self.emit(f"{_BRANCH_OPS[op]} r{left_reg}, r{right_reg}, {label}")
+            return
+        cond_reg, _ = self.visit(expr)
+        self.emit(f"{'bnz' if when else 'bz'} r{cond_reg}, {label}")
+
+    def _emit_logical(self, node):
+        """Value of `a && b` or `a || b`; `b` only runs when `a` does not decide, unless it is trivial."""
+        result_reg = self.new_register()
+        if self._is_trivial(node.right):
+            left_reg, _ = self.visit(node.left)
+            right_reg, _ = self.visit(node.right)
+            self.emit(f"{'and' if node.op == '&&' else 'or'} r{result_reg}, r{left_reg}, r{right_reg}")
+            return result_reg, "bool"
+        false_label = self.new_label(); end_label = self.new_label()
+        self._emit_branch(node, False, false_label)
+        self.emit(f"mov r{result_reg}, 1")
+        self.emit(f"br {end_label}")
+        self.emit(f"{false_label}:")
+        self.emit(f"mov r{result_reg}, 0")
+        self.emit(f"{end_label}:")
+        return result_reg, "bool"
+
     def visit_BinaryOperation(self, node):
+        if node.op in ('&&', '||'):
+            return self._emit_logical(node)
         left_reg, left_type = self.visit(node.left)
         right_reg, right_type = self.visit(node.right)
+        left_type = self._type_of(node.left, left_type)
+        right_type = self._type_of(node.right, right_type)
 
         if node.op == '+':
-            if left_type == 'string' or right_type == 'string':
+            if self._type_of(node, None) == 'string' or left_type == 'string' or right_type == 'string':
                 
                 if left_type in ('int', 'bool'):
                     new_reg = self.new_register()
@@ -415,7 +518,7 @@ class CodeGenerator:
         if node.name == 'print':
             if node.params:
                 expr = node.params[0]
-                if isinstance(expr, BinaryOperation) and self._contains_string_expr(expr):
+                if self._is_concat(expr):
                     parts = []
                     self._flatten_concat(expr, parts)
                     for part in parts:
@@ -462,7 +565,7 @@ class CodeGenerator:
         finfo = self.global_symbol_table.get(node.name)
         return_type = finfo['return_type'] if finfo else "unknown"
         
-        return result_reg, return_type
+        return result_reg, self._type_of(node, return_type)
 
     def visit_MethodCallNode(self, node):
         regs_to_save = [i for i in range(1, self.next_register)]
@@ -508,11 +611,17 @@ class CodeGenerator:
             self.emit(f"mov r{reg}, 0")
             return reg, "unknown"
             
-        obj_ptr_reg = self.new_register()
-        size_reg = self.new_register()
         field_count = len(class_info['fields'])
-        self.emit(f"mov r{size_reg}, {field_count}")
-        self.emit(f"call mem, r{obj_ptr_reg}, r{size_reg}")
+        if node in self.frame_blocks:
+            obj_ptr_reg = self._frame_block(node)
+            size_reg = self.new_register()
+            self.emit(f"mov r{size_reg}, {field_count}")
+            self.emit(f"call mclr, r{obj_ptr_reg}, r{size_reg}")
+        else:
+            obj_ptr_reg = self.new_register()
+            size_reg = self.new_register()
+            self.emit(f"mov r{size_reg}, {field_count}")
+            self.emit(f"call mem, r{obj_ptr_reg}, r{size_reg}")
         
         if 'init' in class_info['methods']:
             regs_to_save = [i for i in range(1, self.next_register)]
@@ -585,15 +694,13 @@ class CodeGenerator:
         if node.is_while:
             start_label = self.new_label(); end_label = self.new_label()
             self.emit(f"{start_label}:")
-            cond_reg, _ = self.visit(node.expr)
-            self.emit(f"bz r{cond_reg}, {end_label}")
+            self._emit_branch(node.expr, False, end_label)
             self.visit(node.stmt)
             self.emit(f"br {start_label}")
             self.emit(f"{end_label}:")
         else:
             else_label = self.new_label(); end_label = self.new_label()
-            cond_reg, _ = self.visit(node.expr)
-            self.emit(f"bz r{cond_reg}, {else_label}")
+            self._emit_branch(node.expr, False, else_label)
             self.visit(node.stmt)
             self.emit(f"br {end_label}")
             self.emit(f"{else_label}:")
@@ -605,8 +712,7 @@ class CodeGenerator:
         else_label = self.new_label(); end_label = self.new_label()
         result_reg = self.new_register()
         
-        cond_reg, _ = self.visit(node.condition)
-        self.emit(f"bz r{cond_reg}, {else_label}")
+        self._emit_branch(node.condition, False, else_label)
         
         true_val_reg, true_type = self.visit(node.body)
         self.emit(f"mov r{result_reg}, r{true_val_reg}")
@@ -617,10 +723,50 @@ class CodeGenerator:
         self.emit(f"mov r{result_reg}, r{false_val_reg}")
         
         self.emit(f"{end_label}:")
-        return result_reg, true_type
+        return result_reg, self._type_of(node, true_type)
 
-    def visit_ForNode(self, node):
+    def _visit_loop_body(self, node, var_reg, var_type):
+        """Generates the body of a for loop, with its variable living in register `var_reg`."""
+        outer = self.var_map.get(node.var)
+        self.var_map[node.var] = {'scope': 'register', 'reg': var_reg, 'var_type': var_type}
         self.visit(node.stmt)
+        if outer is None:
+            del self.var_map[node.var]
+        else:
+            self.var_map[node.var] = outer
+
+    def visit_ForNode(self, node):
+        # `for i = a to b`: both bounds are evaluated once and `b` is inclusive
+        i_reg = self.new_register()
+        start_reg, _ = self.visit(node.exp1)
+        self.emit(f"mov r{i_reg}, r{start_reg}")
+        end_reg, _ = self.visit(node.exp2)
+        body_label = self.new_label(); end_label = self.new_label()
+        self.emit(f"bgt r{i_reg}, r{end_reg}, {end_label}")
+        self.emit(f"{body_label}:")
+        self._visit_loop_body(node, i_reg, "int")
+        self.emit(f"add r{i_reg}, r{i_reg}, 1")
+        self.emit(f"ble r{i_reg}, r{end_reg}, {body_label}")
+        self.emit(f"{end_label}:")
+        return 0, "null"
+
+    def visit_ForEachNode(self, node):
+        # walks a pointer from the first element to one past the last, so no index or bounds checks
+        ptr_reg = self.new_register()
+        vector_reg, _ = self.visit(node.vector)
+        self.emit(f"mov r{ptr_reg}, r{vector_reg}")
+        base_ptr_reg = self.new_register(); self.emit(f"sub r{base_ptr_reg}, r{ptr_reg}, 1")
+        size_reg = self.new_register(); self.emit(f"ld r{size_reg}, [r{base_ptr_reg}]")
+        end_reg = self.new_register(); self.emit(f"add r{end_reg}, r{ptr_reg}, r{size_reg}")
+        body_label = self.new_label(); end_label = self.new_label()
+        self.emit(f"bge r{ptr_reg}, r{end_reg}, {end_label}")
+        self.emit(f"{body_label}:")
+        elem_reg = self.new_register()
+        self.emit(f"ld r{elem_reg}, [r{ptr_reg}]")
+        self._visit_loop_body(node, elem_reg, node.var_type or "int")
+        self.emit(f"add r{ptr_reg}, r{ptr_reg}, 1")
+        self.emit(f"blt r{ptr_reg}, r{end_reg}, {body_label}")
+        self.emit(f"{end_label}:")
         return 0, "null"
 
     def visit_ScanNode(self, node):
@@ -630,7 +776,7 @@ class CodeGenerator:
     def visit_PrintNode(self, node):
         value = node.value
 
-        if isinstance(value, BinaryOperation) and self._contains_string_expr(value):
+        if self._is_concat(value):
             parts = []
             self._flatten_concat(value, parts)
             for part in parts:
@@ -645,7 +791,11 @@ class CodeGenerator:
         size_reg, _ = self.visit(node.size)
         one_reg = self.new_register(); self.emit(f"mov r{one_reg}, 1")
         alloc_size_reg = self.new_register(); self.emit(f"add r{alloc_size_reg}, r{size_reg}, r{one_reg}")
-        base_ptr_reg = self.new_register(); self.emit(f"call mem, r{base_ptr_reg}, r{alloc_size_reg}")
+        if node in self.frame_blocks:
+            base_ptr_reg = self._frame_block(node)
+            self.emit(f"call mclr, r{base_ptr_reg}, r{alloc_size_reg}")
+        else:
+            base_ptr_reg = self.new_register(); self.emit(f"call mem, r{base_ptr_reg}, r{alloc_size_reg}")
         self.emit(f"st [r{base_ptr_reg}], r{size_reg}")
         elem_ptr_reg = self.new_register(); self.emit(f"add r{elem_ptr_reg}, r{base_ptr_reg}, r{one_reg}")
         return elem_ptr_reg, "vector"
@@ -663,14 +813,17 @@ class CodeGenerator:
         index_reg, _ = self.visit(node.index)
         result_reg = self.new_register()
         self.emit(f"call vget, r{result_reg}, r{array_ptr_reg}, r{index_reg}")
-        return result_reg, "int"
+        return result_reg, self._type_of(node, "int")
 
     def visit_VectorNode(self, node):
         size = len(node.elements)
         one_reg = self.new_register(); self.emit(f"mov r{one_reg}, 1")
         
-        alloc_size_reg = self.new_register(); self.emit(f"mov r{alloc_size_reg}, {size + 1}")
-        base_ptr_reg = self.new_register(); self.emit(f"call mem, r{base_ptr_reg}, r{alloc_size_reg}")
+        if node in self.frame_blocks:
+            base_ptr_reg = self._frame_block(node)
+        else:
+            alloc_size_reg = self.new_register(); self.emit(f"mov r{alloc_size_reg}, {size + 1}")
+            base_ptr_reg = self.new_register(); self.emit(f"call mem, r{base_ptr_reg}, r{alloc_size_reg}")
         
         size_reg = self.new_register(); self.emit(f"mov r{size_reg}, {size}")
         self.emit(f"st [r{base_ptr_reg}], r{size_reg}")
@@ -771,9 +924,7 @@ class CodeGenerator:
         loop_end = self.new_label()
         
         self.emit(f"{loop_start}:")
-        cond_reg = self.new_register()
-        self.emit(f"cmp>= r{cond_reg}, r{i_reg}, r{size_reg}")
-        self.emit(f"bnz r{cond_reg}, {loop_end}")
+        self.emit(f"bge r{i_reg}, r{size_reg}, {loop_end}")
 
         elem_reg = self.new_register()
         self.emit(f"call vget, r{elem_reg}, r{list_ptr_reg}, r{i_reg}")
@@ -802,9 +953,7 @@ class CodeGenerator:
                 
                 idx_check_reg = self.new_register()
                 self.emit(f"mov r{idx_check_reg}, {idx}")
-                cmp_idx_reg = self.new_register()
-                self.emit(f"cmp!= r{cmp_idx_reg}, r{i_reg}, r{idx_check_reg}")
-                self.emit(f"bnz r{cmp_idx_reg}, {next_check}")
+                self.emit(f"bne r{i_reg}, r{idx_check_reg}, {next_check}")
                 
                 self.emit(f"call {target_func}")
                 self.emit(f"mov r{result_reg}, r0")
@@ -853,6 +1002,10 @@ class CodeGenerator:
             self.emit(f"sload r{reg}, {name}") 
             return reg, "string"
 
+        info = self.var_map.get(name)
+        if info is not None and info['scope'] == 'register':
+            return info['reg'], info['var_type']
+
         addr_reg = self.get_var_addr_reg(name)
         val_reg = self.new_register()
         self.emit(f"ld r{val_reg}, [r{addr_reg}]")
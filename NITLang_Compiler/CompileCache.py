@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import re
+
+from AST import *
+from tsvm import LABEL_OPERANDS
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+_COMPILER_FILES = ("AST.py", "Parser.py", "SemanticAnalysis.py", "CodeGenerator.py", "CompileCache.py",
+                   "Tokenizer.py", "FastLexer.py", "MemoryLayout.py",
+                   "TreeShaker.py", "PartialEvaluator.py", "EscapeAnalysis.py", "Linker.py")
+_LABEL_RE = re.compile(r'L(\d+)(_(?:lambda|end)_\w+)?')  # L7, and the L7_lambda_int / L7_end_int of lambdas
+_LABEL_OPERANDS = dict(LABEL_OPERANDS, proc=1)
+_OPERAND_RE = re.compile(r'[^\s,]+')
+
+
+def _shift_label(label, shift):
+    m = _LABEL_RE.fullmatch(label)
+    if m is None:  # a function or method name, like L1go
+        return label
+    return f"L{int(m.group(1)) + shift}{m.group(2) or ''}"
+
+
+def shift_labels(line, shift):
+    """
+    Renumbers the generator labels `line` defines or jumps to by `shift`. Only
+    whole label operands change; names that merely start with L<digits> and
+    other operands, like string literals, are left alone.
+    """
+    words = list(_OPERAND_RE.finditer(line))
+    if not words:
+        return line
+    op = words[0].group()
+    if len(words) == 1 and op.endswith(":"):
+        start, end = words[0].span()
+        return line[:start] + _shift_label(op[:-1], shift) + ":" + line[end:]
+    index = _LABEL_OPERANDS.get(op)
+    if index is None or index >= len(words):
+        return line
+    start, end = words[index].span()
+    return line[:start] + _shift_label(words[index].group(), shift) + line[end:]
+
+
+def compiler_fingerprint():
+    """Hash of the compiler sources, so a changed compiler never reuses stale entries."""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _COMPILER_FILES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """
+    Persistent content-addressed store for compile results.
+
+    Entries are JSON files named by their key. `index.json` keeps their sizes and
+    a use counter; once the total size passes `max_bytes` the least recently used
+    entries are evicted.
+    """
+    def __init__(self, directory=".nitcache", max_bytes=DEFAULT_MAX_BYTES, layout=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.salt = compiler_fingerprint()
+        if layout is not None and not layout.is_default():
+            self.salt += layout.spec()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, "index.json")
+        self.index = {"tick": 0, "entries": {}}
+        try:
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+        self.total_bytes = sum(e["size"] for e in self.index["entries"].values())
+
+    def key(self, *parts):
+        digest = hashlib.sha256(self.salt.encode())
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(part.encode() if isinstance(part, str) else part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _touch(self, key):
+        self.index["tick"] += 1
+        self.index["entries"][key]["used"] = self.index["tick"]
+
+    def get(self, key):
+        if key not in self.index["entries"]:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.total_bytes -= self.index["entries"].pop(key)["size"]
+            self.misses += 1
+            return None
+        self._touch(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        data = json.dumps(entry)
+        with open(self._path(key), "w") as f:
+            f.write(data)
+        if key in self.index["entries"]:
+            self.total_bytes -= self.index["entries"][key]["size"]
+        self.index["entries"][key] = {"size": len(data)}
+        self.total_bytes += len(data)
+        self._touch(key)
+        self._evict()
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        entries = self.index["entries"]
+        for key in sorted(entries, key=lambda k: entries[k]["used"]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.total_bytes -= entries.pop(key)["size"]
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        with open(self.index_path, "w") as f:
+            json.dump(self.index, f)
+
+    # -------- WHOLE PROGRAM --------
+    def get_program(self, source):
+        entry = self.get(self.key("program", source))
+        return entry["code"] if entry else None
+
+    def put_program(self, source, code):
+        self.put(self.key("program", source), {"code": code})
+
+
+# -------------- UNIT FINGERPRINTS ------------------
+def _fingerprint(value, out, names):
+    if isinstance(value, ASTNode):
+        out.append(type(value).__name__ + "(")
+        for field, child in node_attributes(value):
+            out.append(field + "=")
+            _fingerprint(child, out, names)
+        out.append(")")
+    elif isinstance(value, (list, tuple)):
+        out.append("[")
+        for item in value:
+            _fingerprint(item, out, names)
+        out.append("]")
+    else:
+        if isinstance(value, str):
+            names.add(value)
+        out.append(repr(value) + ",")
+
+
+def _signature(entry):
+    return {k: v for k, v in entry.items() if k != "node"}
+
+
+def _class_signature(class_info):
+    return {
+        "fields": class_info["fields"],
+        "methods": {name: _signature(m) for name, m in class_info["methods"].items()},
+    }
+
+
+def _type_names(entry):
+    names = [entry.get("var_type"), entry.get("return_type"), entry.get("points_to_type")]
+    names.extend(ptype for _, ptype in entry.get("params") or [])
+    return [n for n in names if isinstance(n, str)]
+
+
+class IncrementalBuild:
+    """
+    One compilation that reuses cached results for top-level functions and classes.
+
+    A unit's key covers its own AST and the signatures of every global symbol and
+    class it can reach through names, as they stand when the unit is checked, plus
+    the global slots code generation will assign to them. A hit reuses the unit's
+    semantic errors and its generated code; everything else is recompiled.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.keys = {}
+        self.entries = {}
+        self.unit_errors = {}
+        self.global_slots = 0
+
+    def _unit_key(self, unit, checker, global_layout):
+        out, names = [], set()
+        _fingerprint(unit, out, names)
+
+        deps = {"symbols": {}, "classes": {}, "globals": {}}
+        pending = list(names)
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            entry = checker.symbol_table.get(name)
+            if entry is not None:
+                deps["symbols"][name] = _signature(entry)
+                pending.extend(_type_names(entry))
+            if name in global_layout:
+                deps["globals"][name] = global_layout[name]
+            class_info = checker.class_table.get(name)
+            if class_info is not None:
+                deps["classes"][name] = _class_signature(class_info)
+                for member in list(class_info["fields"].values()) + list(class_info["methods"].values()):
+                    pending.extend(_type_names(member))
+
+        return self.cache.key("unit", "".join(out), json.dumps(deps, sort_keys=True, default=str))
+
+    def _declare_globals(self, node, global_layout):
+        """Mirrors the global slots CodeGenerator hands out to top-level declarations."""
+        if isinstance(node, VariableDeclarationNode):
+            global_layout[node.name] = self.global_slots
+            self.global_slots += 1
+        if isinstance(node, (FunctionNode, ClassNode)):
+            return
+        if isinstance(node, ASTNode):
+            for child in node.child_nodes():
+                self._declare_globals(child, global_layout)
+
+    def check(self, checker, ast):
+        if not isinstance(ast, ProgramNode):
+            return checker.check(ast)
+
+        for child in ast.children:
+            if isinstance(child, ClassNode):
+                checker.register_class(child)
+        for child in ast.children:
+            if isinstance(child, FunctionNode):
+                checker.register_function(child)
+
+        global_layout = {}
+        for i, child in enumerate(ast.children):
+            if not isinstance(child, (FunctionNode, ClassNode)):
+                self._declare_globals(child, global_layout)
+                checker.visit(child)
+                continue
+
+            key = self._unit_key(child, checker, global_layout)
+            self.keys[i] = key
+            entry = self.cache.get(key)
+            if entry is not None and (entry["code"] is not None or entry["errors"]):
+                self.entries[i] = entry
+                checker.errors.extend(entry["errors"])
+                continue
+
+            start = len(checker.errors)
+            checker.visit(child)
+            self.unit_errors[i] = checker.errors[start:]
+            if self.unit_errors[i]:
+                self.cache.put(key, {"errors": self.unit_errors[i], "code": None})
+
+        return checker.errors
+
+    def generate(self, generator, ast):
+        if not isinstance(ast, ProgramNode):
+            return generator.generate(ast)
+
+        for i, child in enumerate(ast.children):
+            entry = self.entries.get(i)
+            if entry is not None:
+                base = generator.label_count
+                generator.code.extend(shift_labels(line, base) for line in entry["code"])
+                generator.label_count += entry["labels"]
+                generator.next_register = entry["next_register"]
+                continue
+
+            code_start = len(generator.code)
+            label_start = generator.label_count
+            generator.visit(child)
+            if i in self.keys:
+                fragment = [shift_labels(line, -label_start) for line in generator.code[code_start:]]
+                self.cache.put(self.keys[i], {
+                    "errors": [],
+                    "code": fragment,
+                    "labels": generator.label_count - label_start,
+                    "next_register": generator.next_register,
+                })
+
+        return "\n".join(generator.code)
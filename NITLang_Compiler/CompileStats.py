@@ -0,0 +1,118 @@
+import json
+import re
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from AST import *
+
+_REGISTER_RE = re.compile(r'\br(\d+)\b')
+_LAMBDA_END_RE = re.compile(r'L\d+_end_\w+:')
+
+
+class CompileStats:
+    """
+    Opt-in measurements of one compilation, written out as a JSON report.
+
+    `phase(name)` times a block and records the peak memory traced while it ran;
+    the `record_*` methods summarise the AST, the symbol tables and the generated
+    code. Nothing is measured unless the driver is given a CompileStats.
+
+    tracemalloc runs for the whole of each phase, so its `seconds` include the
+    tracing overhead: compare them with each other, not with untraced builds.
+    """
+    def __init__(self, source=None):
+        self.source = source
+        self.phases = {}
+        self.ast = None
+        self.symbols = None
+        self.code = None
+        self.registers = None
+
+    @contextmanager
+    def phase(self, name):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            self.phases[name] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+
+    def record_ast(self, ast):
+        counts = Counter()
+        pending = [ast]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, ASTNode):
+                counts[type(node).__name__] += 1
+                pending.extend(node.child_nodes())
+        self.ast = {"nodes": sum(counts.values()), "by_type": dict(sorted(counts.items()))}
+
+    def record_symbols(self, checker):
+        kinds = Counter(entry.get("kind", "variable") for entry in checker.global_symbol_table.symbols.values())
+        self.symbols = {
+            "globals": len(checker.global_symbol_table.symbols),
+            "by_kind": dict(sorted(kinds.items())),
+            "classes": len(checker.class_table),
+            "fields": sum(len(c["fields"]) for c in checker.class_table.values()),
+            "methods": sum(len(c["methods"]) for c in checker.class_table.values()),
+        }
+
+    def record_code(self, code):
+        """
+        Counts instructions by opcode and the distinct virtual registers each
+        procedure uses. A lambda is counted apart from the function around it.
+        """
+        opcodes = Counter()
+        labels = 0
+        registers = {}
+        procs = ["<globals>"]  # lambdas nest inside the proc they are mapped in
+        for line in code.splitlines():
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            if line.endswith(':'):
+                labels += 1
+                if _LAMBDA_END_RE.fullmatch(line) and len(procs) > 1:
+                    procs.pop()
+                continue
+            op = line.split()[0]
+            if op == 'proc':
+                proc = line.split()[1]
+                if "_lambda_" in proc:
+                    procs.append(proc)
+                else:
+                    procs = [proc]
+                registers.setdefault(proc, set())
+                continue
+            opcodes[op] += 1
+            registers.setdefault(procs[-1], set()).update(_REGISTER_RE.findall(line))
+        self.code = {
+            "instructions": sum(opcodes.values()),
+            "labels": labels,
+            "by_opcode": dict(sorted(opcodes.items())),
+        }
+        self.registers = {proc: len(regs) for proc, regs in registers.items()}
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "phases": self.phases,
+            "ast": self.ast,
+            "symbols": self.symbols,
+            "code": self.code,
+            "registers_per_proc": self.registers,
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
@@ -0,0 +1,147 @@
+from collections import Counter
+
+from AST import *
+
+MAX_FRAME_VECTOR = 256  # words; larger vectors stay on the heap, however short-lived
+
+
+def _occurrences(node):
+    """
+    Yields (parent, field, name) for every identifier in `node`, not entering nested
+    functions and classes; identifiers anywhere in a lambda have the LambdaNode as parent.
+    """
+    stack = [(node, None, None)]
+    while stack:
+        node, parent, field = stack.pop()
+        if isinstance(node, str):
+            yield parent, field, node
+        elif isinstance(node, list):
+            stack.extend((child, parent, field) for child in node)
+        elif isinstance(node, LambdaNode):
+            for _, _, name in _occurrences(node.body):
+                yield node, 'body', name
+        elif isinstance(node, ASTNode) and not isinstance(node, (FunctionNode, ClassNode)):
+            stack.extend((getattr(node, f), node, f) for f in node._fields)
+
+
+class EscapeAnalysis:
+    """
+    Finds allocations that can live in their function's stack frame.
+
+    An allocation qualifies when it is the initializer of a local declared once
+    in a function or method (`let p = new P(...)`, `let v = [...]` or
+    `let v = list(N)` with a constant N) and that variable is only used where
+    the object cannot outlive the call: vectors as the target of indexing,
+    `length`, `map`, `print`, `for ... in` and string concatenation; objects as
+    the receiver of methods that never let `this` out (`init` included).
+    Passing, returning, storing, comparing or taking a `ref` of the variable, or
+    naming it inside a lambda, counts as an escape. Vectors of more than
+    MAX_FRAME_VECTOR elements and every other allocation stay on the heap, so a
+    frame, even one repeated by recursion, does not eat the stack.
+
+    Objects are not replaced by scalars: fields are private, so outside its
+    methods an object is only ever used through calls that need its address.
+    """
+    def __init__(self, class_table):
+        self.class_table = class_table
+        self.safe_methods = self._methods_keeping_this()
+
+    def analyze(self, ast):
+        """The allocation nodes of `ast` that can be placed in a stack frame."""
+        allocations = set()
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, FunctionNode):
+                allocations.update(self._function_allocations(node))
+                continue
+            if isinstance(node, ClassNode):
+                stack.extend(node.methods)
+            elif isinstance(node, ProgramNode):
+                stack.extend(node.children)
+        return allocations
+
+    def _methods_keeping_this(self):
+        """(class, method) pairs whose body uses `this` only to reach fields and other such methods."""
+        uses = {}
+        for class_name, info in self.class_table.items():
+            for method_name, method in info["methods"].items():
+                if method["node"] is None:
+                    continue
+                calls = set()
+                ok = True
+                for parent, field, name in _occurrences(method["node"].body):
+                    if name != "this":
+                        continue
+                    if isinstance(parent, FieldAccessNode):
+                        continue
+                    if isinstance(parent, MethodCallNode) and field == "object_expr":
+                        calls.add((class_name, parent.method_name))
+                        continue
+                    ok = False
+                    break
+                if ok:
+                    uses[(class_name, method_name)] = calls
+        changed = True
+        while changed:
+            changed = False
+            for key in list(uses):
+                if not uses[key] <= uses.keys():
+                    del uses[key]
+                    changed = True
+        return set(uses)
+
+    def _function_allocations(self, func):
+        params = {name for name, _ in func.params}
+        declarations = []
+        stack = [func.body]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, VariableDeclarationNode):
+                declarations.append(node)
+            if isinstance(node, ASTNode) and not isinstance(node, (FunctionNode, ClassNode)):
+                stack.extend(node.child_nodes())
+        counts = Counter(decl.name for decl in declarations)
+
+        candidates = {}
+        for decl in declarations:
+            if counts[decl.name] == 1 and decl.name not in params and decl.name != "this":
+                kind = self._allocation_kind(decl.value)
+                if kind is not None:
+                    candidates[decl.name] = (decl.value, kind)
+        if not candidates:
+            return set()
+
+        for parent, field, name in _occurrences(func.body):
+            if name in candidates and not self._harmless_use(parent, field, candidates[name]):
+                del candidates[name]
+        return {value for value, _ in candidates.values()}
+
+    def _allocation_kind(self, value):
+        if isinstance(value, VectorNode):
+            return "vector" if len(value.elements) <= MAX_FRAME_VECTOR else None
+        if isinstance(value, ListNode):
+            return "vector" if type(value.size) is int and 0 <= value.size <= MAX_FRAME_VECTOR else None
+        if isinstance(value, NewNode):
+            info = self.class_table.get(value.class_name)
+            if info is None or not info["fields"]:
+                return None
+            if "init" in info["methods"] and (value.class_name, "init") not in self.safe_methods:
+                return None
+            return value.class_name
+        return None
+
+    def _harmless_use(self, parent, field, candidate):
+        _, kind = candidate
+        if isinstance(parent, AssignmentNode) and field == "var":
+            return True  # rebinding the variable leaves the old object unreachable
+        if kind == "vector":
+            if isinstance(parent, VectorAccessNode):
+                return field == "array_name"
+            if isinstance(parent, (LengthNode, MapNode, PrintNode, ForEachNode)):
+                return field in ("array", "list_expr", "value", "vector")
+            return (isinstance(parent, BinaryOperation) and parent.op == '+'
+                    and parent.inferred_type == 'string')
+        if isinstance(parent, MethodCallNode) and field == "object_expr":
+            return (kind, parent.method_name) in self.safe_methods
+        return False
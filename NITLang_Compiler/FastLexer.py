@@ -0,0 +1,277 @@
+import bisect
+import functools
+import re
+
+import Tokenizer
+from Tokenizer import reserved
+
+
+class Token:
+    """Same fields as ply.lex.LexToken, which is all ply.yacc reads or sets."""
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'lexer')
+
+    def __init__(self, type, value, lineno, lexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __repr__(self):
+        return f"LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})"
+
+
+def _string_rules():
+    """The t_NAME = r'...' token rules of Tokenizer, ordered the way PLY orders them."""
+    rules = []
+    for name, value in vars(Tokenizer).items():
+        if name.startswith('t_') and isinstance(value, str) and not name.startswith('t_ignore') \
+                and not name.endswith('_ignore'):
+            rules.append((name[2:], value))
+    rules.sort(key=lambda rule: len(rule[1]), reverse=True)
+    return rules
+
+
+# Function rules come first in definition order, then string rules by decreasing
+# regex length, exactly like PLY's master regex, so both produce the same tokens.
+# `error` catches what PLY would reject.
+_INITIAL_RULES = [
+    ('comment', Tokenizer.t_comment.__doc__),
+    ('mstring', Tokenizer.t_mstring.__doc__),
+    ('STRING', Tokenizer.t_STRING.__doc__),
+    ('NUMBER', Tokenizer.t_NUMBER.__doc__),
+    ('BOOL', Tokenizer.t_BOOL.__doc__),
+    ('ID', Tokenizer.t_ID.__doc__),
+] + _string_rules() + [
+    ('eof', r'\Z'),
+    ('error', r'[\s\S]'),
+]
+
+
+def _initial_pattern(blanks):
+    """Blanks and '#' comments never start any other token, so they are skipped by
+    a prefix of the same match."""
+    return (
+        f'(?:[{blanks}]+|{Tokenizer.t_ignore_COMMENT})*(?:'
+        + '|'.join(f'(?P<{name}>{regex})' for name, regex in _INITIAL_RULES)
+        + ')'
+    )
+
+
+_COMMENT_PATTERN = (
+    f'(?P<open>{Tokenizer.t_comment_open.__doc__})'
+    f'|(?P<close>{Tokenizer.t_comment_close.__doc__})'
+    f'|(?P<newline>{Tokenizer.t_comment_newline.__doc__})'
+)
+_MSTRING_PATTERN = (
+    r'[ \t]*(?:'
+    f'(?P<newline>{Tokenizer.t_mstring_newline.__doc__})'
+    f'|(?P<content>{Tokenizer.t_mstring_content.__doc__})'
+    f'|(?P<end>{Tokenizer.t_mstring_end.__doc__})'
+    ')'
+)
+_SPECIAL = {'NUMBER', 'comment', 'mstring', 'eof', 'error'}
+_INITIAL_RE = re.compile(_initial_pattern(r' \t\n'))
+_NEWLINE_RE = re.compile('\n')
+
+
+class FastLexer:
+    """
+    Pure-Python lexer producing the same token stream as the PLY rules in
+    Tokenizer.py, with one master regex match per token.
+
+    Nested `</ ... />` comments and `\"\"\"` strings are scanned inline instead of
+    through PLY state switches, and line/column lookups go through a line-start
+    index built once per input. It has the `input`/`token` interface ply.yacc
+    expects, so it can be passed to `parser.parse(data, lexer=FastLexer())`.
+    """
+    _initial_re = _INITIAL_RE
+    _comment_re = re.compile(_COMMENT_PATTERN)
+    _mstring_re = re.compile(_MSTRING_PATTERN)
+    _blanks = ' \t'
+    _empty = ''
+
+    def __init__(self):
+        self.lexdata = ""
+        self.lexpos = 0
+        self.lineno = 1
+        self._tokens = iter(())
+        self._line_starts = None
+
+    def input(self, data):
+        self.lexdata = data
+        self.lexpos = 0
+        self.lineno = 1
+        self._line_starts = None
+        self._tokens = self._scan()
+        self.token = functools.partial(next, self._tokens, None)
+
+    def token(self):
+        return None
+
+    def __iter__(self):
+        return self._tokens
+
+    def line_starts(self):
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in _NEWLINE_RE.finditer(self.lexdata)]
+        return self._line_starts
+
+    def position(self, lexpos):
+        """(line, column), both 1-based, of a character offset."""
+        starts = self.line_starts()
+        line = bisect.bisect_right(starts, lexpos)
+        return line, lexpos - starts[line - 1] + 1
+
+    def column(self, token):
+        return self.position(token.lexpos)[1]
+
+    def _scan(self):
+        data = self.lexdata
+        finditer = self._initial_re.finditer
+        get_reserved = reserved.get
+        line_of = functools.partial(bisect.bisect_right, self.line_starts())
+        special = _SPECIAL
+        pos = 0
+
+        while pos is not None:
+            resume, pos = pos, None
+            for m in finditer(data, resume):
+                kind = m.lastgroup
+                text = m.group(kind)
+                start = m.end() - len(text)
+                if kind == 'ID':
+                    yield Token(get_reserved(text, 'ID'), text, line_of(start), start)
+                elif kind not in special:
+                    yield Token(kind, text, line_of(start), start)
+                elif kind == 'NUMBER':
+                    yield Token('NUMBER', int(text), line_of(start), start)
+                elif kind == 'comment':
+                    pos = self._skip_comment(data, m.end())
+                    break
+                elif kind == 'mstring':
+                    end, content = self._scan_mstring(data, m.end(), line_of(start))
+                    if content is not None:
+                        yield Token('MULTI_STRING', '"""' + content + '"""', line_of(start), end - 3)
+                        pos = end
+                    break
+                elif kind == 'error':
+                    print("Illegal character '%s'" % text)
+                else:
+                    break
+        self.lexpos = len(data)
+        self.lineno = len(self.line_starts())
+
+    def _skip_comment(self, data, pos):
+        level = 1
+        search = self._comment_re.search
+        while level:
+            m = search(data, pos)
+            if m is None:
+                return None
+            pos = m.end()
+            if m.lastgroup == 'open':
+                level += 1
+            elif m.lastgroup == 'close':
+                level -= 1
+        return pos
+
+    def _scan_mstring(self, data, pos, start_line):
+        parts = []
+        end = len(data)
+        match = self._mstring_re.match
+        while True:
+            m = match(data, pos)
+            if m is None:
+                while pos < end and data[pos] in self._blanks:
+                    pos += 1
+                if pos >= end:
+                    return pos, None
+                print(f"Illegal character in multi-line string at line {start_line}")
+                pos += 1
+                continue
+            pos = m.end()
+            kind = m.lastgroup
+            if kind == 'end':
+                return pos, self._empty.join(parts)
+            parts.append(m.group(kind))
+
+
+class BufferLexer(FastLexer):
+    """
+    FastLexer over a bytes-like buffer, typically an mmap of the source file.
+
+    Token values are decoded one at a time and lines are counted as the scan moves
+    forward, so nothing proportional to the whole input is kept: `line_starts()`
+    only covers the lines seen since the last `mark()`.
+    """
+    _initial_re = re.compile(_initial_pattern(r' \t\r\n').encode())
+    _comment_re = re.compile(_COMMENT_PATTERN.encode())
+    _mstring_re = re.compile(_MSTRING_PATTERN.encode())
+    _blanks = b' \t'
+    _empty = b''
+
+    def input(self, data):
+        super().input(data)
+        self._line_starts = [0]
+        self._counted = 0
+
+    def line_starts(self):
+        return self._line_starts
+
+    def mark(self):
+        """Forgets the line starts before the current line."""
+        del self._line_starts[:-1]
+
+    def position(self, lexpos):
+        starts = self._line_starts
+        index = bisect.bisect_right(starts, lexpos) - 1
+        return self.lineno - (len(starts) - 1 - index), lexpos - starts[index] + 1
+
+    def _line_at(self, pos):
+        data = self.lexdata
+        starts = self._line_starts
+        newline = data.find(b'\n', self._counted, pos)
+        while newline >= 0:
+            starts.append(newline + 1)
+            self.lineno += 1
+            newline = data.find(b'\n', newline + 1, pos)
+        self._counted = max(self._counted, pos)
+        return self.lineno
+
+    def _scan(self):
+        data = self.lexdata
+        finditer = self._initial_re.finditer
+        get_reserved = reserved.get
+        line_of = self._line_at
+        special = _SPECIAL
+        pos = 0
+
+        while pos is not None:
+            resume, pos = pos, None
+            for m in finditer(data, resume):
+                kind = m.lastgroup
+                raw = m.group(kind)
+                start = m.end() - len(raw)
+                if kind == 'ID':
+                    text = raw.decode()
+                    yield Token(get_reserved(text, 'ID'), text, line_of(start), start)
+                elif kind not in special:
+                    yield Token(kind, raw.decode(), line_of(start), start)
+                elif kind == 'NUMBER':
+                    yield Token('NUMBER', int(raw), line_of(start), start)
+                elif kind == 'comment':
+                    pos = self._skip_comment(data, m.end())
+                    break
+                elif kind == 'mstring':
+                    lineno = line_of(start)
+                    end, content = self._scan_mstring(data, m.end(), lineno)
+                    if content is not None:
+                        yield Token('MULTI_STRING', '"""' + content.decode().replace('\r\n', '\n') + '"""', lineno, end - 3)
+                        pos = end
+                    break
+                elif kind == 'error':
+                    print("Illegal character '%s'" % raw.decode(errors='replace'))
+                else:
+                    break
+        self.lexpos = len(data)
+        line_of(len(data))
@@ -0,0 +1,327 @@
+"""
+Object files and the linker for programs split into modules.
+
+    python Linker.py main.nito math.nito -o program.tsvm
+
+An object file is the JSON form of one compiled module: its code, the symbols it
+exports and the modules it imports. Its code is relocatable: local labels are
+numbered from L1, and global variables are addressed through `@gN` (slot N of
+this module) and `@g:name` (a global another module exports) instead of fixed
+offsets. `link` gives every module its own range of global slots and labels,
+resolves those references and checks that each `call` has a target and that no
+symbol is defined twice.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+from AST import *
+from CompileCache import compiler_fingerprint, shift_labels
+from MemoryLayout import DEFAULT_LAYOUT, MemoryLayout
+from tsvm import BUILTINS
+
+OBJECT_FORMAT = 1
+OBJECT_SUFFIX = ".nito"
+SOURCE_SUFFIX = ".txt"
+STDLIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stdlib")
+
+_GLOBAL_RE = re.compile(r'@g(?:(\d+)|:(\w+))')
+_GLOBAL_ENTRY_KEYS = ("var_type", "size", "element_types", "points_to_type")
+
+
+class LinkError(Exception):
+    pass
+
+
+def imports_of(ast):
+    """Names of the modules `ast` imports, in source order."""
+    if not isinstance(ast, ProgramNode):
+        return []
+    return [child.name for child in ast.children if isinstance(child, ImportNode)]
+
+
+# -------------- OBJECT FILES ------------------
+def make_object(name, ast, checker, generator, layout=None):
+    """The object file of a module, from its AST after checking and relocatable code generation."""
+    functions, classes = {}, {}
+    for child in ast.children:
+        if isinstance(child, FunctionNode):
+            functions[child.name] = {"params": child.params, "return_type": child.return_type}
+        elif isinstance(child, ClassNode):
+            info = checker.class_table[child.name]
+            classes[child.name] = {
+                "fields": info["fields"],
+                "methods": {m: {"params": i["params"], "return_type": i["return_type"]}
+                            for m, i in info["methods"].items()},
+            }
+
+    global_vars = {}
+    for var_name, info in generator.global_var_map.items():
+        match = _GLOBAL_RE.fullmatch(str(info["offset"]))
+        if match and match.group(1) is not None:
+            entry = checker.global_symbol_table.symbols.get(var_name, {})
+            exported = {key: entry[key] for key in _GLOBAL_ENTRY_KEYS if entry.get(key) is not None}
+            exported.setdefault("var_type", info["var_type"])
+            global_vars[var_name] = dict(exported, slot=int(match.group(1)))
+
+    return {
+        "format": OBJECT_FORMAT,
+        "module": name,
+        "layout": (layout or DEFAULT_LAYOUT).spec(),
+        "imports": imports_of(ast),
+        "exports": {"functions": functions, "classes": classes, "globals": global_vars},
+        "global_slots": generator.global_offset,
+        "labels": generator.label_count,
+        "code": generator.code,
+    }
+
+
+def declare_imports(checker, objects):
+    """Makes what `objects` export visible to a module about to be checked."""
+    for obj in objects:
+        checker.modules.add(obj["module"])
+        exports = obj["exports"]
+        for class_name, info in exports["classes"].items():
+            checker.class_table[class_name] = {
+                "name": class_name,
+                "fields": info["fields"],
+                "methods": {m: dict(i, node=None) for m, i in info["methods"].items()},
+            }
+        for func_name, info in exports["functions"].items():
+            checker.global_symbol_table[func_name] = {
+                "kind": "function", "params": [tuple(p) for p in info["params"]],
+                "return_type": info["return_type"], "node": None,
+            }
+        for var_name, info in exports["globals"].items():
+            entry = {key: info[key] for key in _GLOBAL_ENTRY_KEYS if key in info}
+            checker.global_symbol_table[var_name] = dict(entry, kind="global_var", initialized=True)
+
+
+def import_globals(generator, objects):
+    """Lets relocatable code address the globals `objects` export, by name."""
+    for obj in objects:
+        for var_name, info in obj["exports"]["globals"].items():
+            generator.global_var_map[var_name] = {'scope': 'global', 'offset': f"@g:{var_name}",
+                                                  'var_type': info["var_type"]}
+
+
+def read_object(path):
+    with open(path, "r") as f:
+        obj = json.load(f)
+    if obj.get("format") != OBJECT_FORMAT:
+        raise LinkError(f"{path}: not an object file of format {OBJECT_FORMAT}")
+    return obj
+
+
+def write_object(path, obj):
+    with open(path, "w") as f:
+        json.dump(obj, f)
+
+
+# -------------- LINKING ------------------
+def link_order(objects):
+    """`objects` sorted so every module comes after the modules it imports."""
+    by_name = {obj["module"]: obj for obj in objects}
+    ordered, state = [], {}
+
+    def visit(obj):
+        name = obj["module"]
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "active":
+            raise LinkError(f"import cycle through module '{name}'")
+        state[name] = "active"
+        for dep in obj["imports"]:
+            if dep not in by_name:
+                raise LinkError(f"module '{name}' imports '{dep}', which is not being linked")
+            visit(by_name[dep])
+        state[name] = "done"
+        ordered.append(obj)
+
+    for obj in objects:
+        visit(obj)
+    return ordered
+
+
+def link(objects):
+    """
+    Joins object files, already in link order, into one TSVM program. Top-level
+    code runs module by module in that order, so imports are initialized first.
+    """
+    defined, slots, bases, base = {}, {}, {}, 0
+    for obj in objects:
+        exports = obj["exports"]
+        for kind in ("functions", "classes", "globals"):
+            for name in exports[kind]:
+                if name in defined:
+                    raise LinkError(f"duplicate symbol '{name}' in modules '{defined[name]}' and '{obj['module']}'")
+                defined[name] = obj["module"]
+        bases[obj["module"]] = base
+        for name, info in exports["globals"].items():
+            slots[name] = base + info["slot"]
+        base += obj["global_slots"]
+
+    layouts = {obj["layout"] for obj in objects}
+    if len(layouts) > 1:
+        raise LinkError("modules were compiled for different memory layouts")
+
+    code, label_base = [], 0
+    for obj in objects:
+        module, slot_base = obj["module"], bases[obj["module"]]
+
+        def relocate_global(m):
+            if m.group(1) is not None:
+                return str(slot_base + int(m.group(1)))
+            if m.group(2) not in slots:
+                raise LinkError(f"module '{module}' uses undefined global '{m.group(2)}'")
+            return str(slots[m.group(2)])
+
+        for line in obj["code"]:
+            if not line.startswith("sload"):  # string literals are left alone
+                line = shift_labels(line, label_base)
+                if "@g" in line:
+                    line = _GLOBAL_RE.sub(relocate_global, line)
+            code.append(line)
+        label_base += obj["labels"]
+
+    procs = {line.split()[1] for line in code if line.startswith("proc ")}
+    for line in code:
+        if line.startswith("call "):
+            target = line.split()[1].rstrip(",")
+            if target not in BUILTINS and target not in procs:
+                raise LinkError(f"undefined reference to '{target}'")
+
+    layout = MemoryLayout.parse(layouts.pop()) if layouts else DEFAULT_LAYOUT
+    if not layout.is_default():
+        code.insert(0, layout.header())
+    return "\n".join(code)
+
+
+# -------------- MODULE LOADING ------------------
+class ModuleLoader:
+    """
+    Finds imported modules and gives back their object files, compiling each one
+    at most once per run.
+
+    `import name;` looks for `name.txt` in each directory of `search_path` (the
+    standard library comes last). A module's object file is kept next to its
+    source as `name.nito`; it is reused while its key (the compiler, the layout,
+    the source and the keys of everything it imports) still matches, so the
+    standard library is compiled once and then loaded from there. `compile_module`
+    is called as compile_module(source, loader) and returns (syntax errors,
+    semantic errors, object). Problems are collected in `errors`.
+    """
+    def __init__(self, compile_module, search_path=(), layout=None):
+        self.compile_module = compile_module
+        self.search_path = [os.path.abspath(d) for d in search_path] + [STDLIB_DIR]
+        self.layout = layout or DEFAULT_LAYOUT
+        self.salt = compiler_fingerprint() + self.layout.spec()
+        self.modules = {}  # path -> object, or None when the module failed
+        self.loading = []
+        self.errors = []
+        self.compiled = 0
+        self.reused = 0
+
+    def find(self, name):
+        for directory in self.search_path:
+            path = os.path.join(directory, name + SOURCE_SUFFIX)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def load(self, names):
+        """
+        Object files of the modules `names` and everything they import, in link
+        order. Modules that fail to load are left out and reported in `errors`.
+        """
+        objects = [obj for obj in map(self._load, names) if obj is not None]
+        closure, seen = [], set()
+        pending = list(objects)
+        while pending:
+            obj = pending.pop()
+            if obj["module"] not in seen:
+                seen.add(obj["module"])
+                closure.append(obj)
+                pending.extend(self.modules[self.find(dep)] for dep in obj["imports"])
+        return link_order(closure)
+
+    def key(self, source, imports):
+        """Key an object file compiled from `source` has while its imports are unchanged."""
+        digest = hashlib.sha256(self.salt.encode())
+        digest.update(source.encode())
+        for name in imports:
+            digest.update(b"\0" + self.modules[self.find(name)]["key"].encode())
+        return digest.hexdigest()
+
+    def _load(self, name):
+        path = self.find(name)
+        if path is None:
+            self.errors.append(f"Error: module '{name}' not found")
+            return None
+        if path in self.modules:
+            return self.modules[path]
+        if path in self.loading:
+            self.errors.append(f"Error: import cycle through module '{name}'")
+            return None
+
+        self.loading.append(path)
+        try:
+            with open(path, "r") as f:
+                source = f.read()
+            object_path = path[:-len(SOURCE_SUFFIX)] + OBJECT_SUFFIX
+            obj = self._reuse(object_path, name, source)
+            if obj is None:
+                obj = self._compile(object_path, name, source)
+        finally:
+            self.loading.pop()
+        self.modules[path] = obj
+        return obj
+
+    def _reuse(self, object_path, name, source):
+        try:
+            obj = read_object(object_path)
+        except (OSError, ValueError, LinkError):
+            return None
+        if obj.get("module") != name or any(self._load(dep) is None for dep in obj["imports"]):
+            return None
+        if obj.get("key") != self.key(source, obj["imports"]):
+            return None
+        self.reused += 1
+        return obj
+
+    def _compile(self, object_path, name, source):
+        syntax_errors, semantic_errors, obj = self.compile_module(source, self)
+        if obj is None:
+            self.errors.extend(f"In module '{name}': {e}" for e in syntax_errors + semantic_errors)
+            return None
+        obj["module"] = name
+        obj["key"] = self.key(source, obj["imports"])
+        self.compiled += 1
+        try:
+            write_object(object_path, obj)
+        except OSError:
+            pass  # a read-only directory only costs a recompile next time
+        return obj
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Link NITLang object files into a TSVM program.")
+    arg_parser.add_argument("objects", nargs="+")
+    arg_parser.add_argument("-o", "--output", default="output.tsvm")
+    args = arg_parser.parse_args(argv)
+    try:
+        code = link(link_order([read_object(path) for path in args.objects]))
+    except (OSError, ValueError, LinkError) as e:
+        print(f"Link error: {e}")
+        return 1
+    with open(args.output, "w") as f:
+        f.write(code)
+    print(f"Linked {len(args.objects)} modules into {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+DEFAULT_HEAP_LIMIT = 1 << 24  # words
+HEADER_PREFIX = "# layout:"
+
+
+class MemoryLayout:
+    """
+    Segment sizes of TSVM memory, shared by the code generator and the VM.
+
+    From address 0 come the stack (growing down from `stack_top`), a gap holding
+    the initial frame, the globals at `global_base` and the heap at `heap_base`.
+    Memory starts `heap_size` words past the heap base and grows on demand until
+    the heap reaches `heap_limit` words.
+    """
+    FIELDS = ("stack", "gap", "globals", "heap", "heap_limit")
+
+    def __init__(self, stack=9000, gap=1000, globals=10000, heap=30000, heap_limit=DEFAULT_HEAP_LIMIT):
+        if min(stack, gap, globals, heap) < 1 or heap_limit < heap:
+            raise ValueError("segment sizes must be positive and heap_limit at least heap")
+        self.stack_size = stack
+        self.gap_size = gap
+        self.globals_size = globals
+        self.heap_size = heap
+        self.heap_limit = heap_limit
+
+        self.stack_top = stack
+        self.stack_limit = 0
+        self.global_base = stack + gap
+        self.heap_base = self.global_base + globals
+        self.memory_size = self.heap_base + heap
+        self.heap_end = self.heap_base + heap_limit
+
+    @classmethod
+    def parse(cls, spec):
+        """Layout from "stack=100000,heap=1000000"; unnamed segments keep their defaults."""
+        sizes = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            name, _, value = item.partition("=")
+            if name not in cls.FIELDS:
+                raise ValueError(f"unknown segment '{name}' (expected one of {', '.join(cls.FIELDS)})")
+            sizes[name] = int(value)
+        return cls(**sizes)
+
+    @classmethod
+    def from_header(cls, line):
+        """Layout named by a `# layout: ...` line of generated code, or None."""
+        if line.startswith(HEADER_PREFIX):
+            return cls.parse(line[len(HEADER_PREFIX):])
+        return None
+
+    def sizes(self):
+        return (self.stack_size, self.gap_size, self.globals_size, self.heap_size, self.heap_limit)
+
+    def spec(self):
+        return ",".join(f"{name}={size}" for name, size in zip(self.FIELDS, self.sizes()))
+
+    def header(self):
+        return f"{HEADER_PREFIX} {self.spec()}"
+
+    def is_default(self):
+        return self == DEFAULT_LAYOUT
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryLayout) and self.sizes() == other.sizes()
+
+    def __hash__(self):
+        return hash(self.sizes())
+
+    def __repr__(self):
+        return f"MemoryLayout({self.spec()})"
+
+
+DEFAULT_LAYOUT = MemoryLayout()
@@ -1,8 +1,26 @@
+import argparse
+import bisect
+import contextlib
+import functools
+import mmap
+import os
+import re
+import ply.lex as lex
 import ply.yacc as yacc
+import Tokenizer
 from Tokenizer import tokens
 from AST import *
 from SemanticAnalysis import *
 from CodeGenerator import CodeGenerator
+from CompileCache import CompileCache, IncrementalBuild, DEFAULT_MAX_BYTES
+from FastLexer import FastLexer, BufferLexer
+from CompileStats import CompileStats
+from MemoryLayout import DEFAULT_LAYOUT, MemoryLayout
+from TreeShaker import TreeShaker
+from PartialEvaluator import PartialEvaluator, DEFAULT_STEP_BUDGET
+from EscapeAnalysis import EscapeAnalysis
+from Linker import (ModuleLoader, LinkError, STDLIB_DIR, SOURCE_SUFFIX, OBJECT_SUFFIX, imports_of, make_object,
+                    declare_imports, import_globals, link, write_object)
 
 
 precedence = (
@@ -19,56 +37,84 @@ precedence = (
     ('right', 'TERNARY'),
 )
 
+line_starts = [0]
+
+
+def _at(node, p, n):
+    """Stamps `node` with the line and column of terminal `n` of production `p`."""
+    lexpos = p.lexpos(n)
+    node.lineno = p.lineno(n)
+    node.col = lexpos - line_starts[bisect.bisect_right(line_starts, lexpos) - 1] + 1
+    return node
+
 def p_prog(p):
-    '''prog : stmt_list'''
-    p[0] = ProgramNode(p[1])
+    '''prog : import_list stmt_list'''
+    p[0] = ProgramNode(p[1] + p[2])
+
+def p_import_list(p):
+    '''import_list : import_list IMPORT ID SEMI_COLON
+                   | empty'''
+    if len(p) == 5:
+        p[1].append(_at(ImportNode(p[3]), p, 2))
+        p[0] = p[1]
+    else:
+        p[0] = []
 
+# List productions are left-recursive and append in place, so long lists are
+# built in linear time without growing the parser stack.
 def p_stmt_list(p):
-    '''stmt_list : stmt stmt_list
+    '''stmt_list : stmt_list stmt
                  | empty'''
     if len(p) == 3:
-        p[0] = [p[1]] + p[2]
+        p[1].append(p[2])
+        p[0] = p[1]
     else:
         p[0] = []
 
 def p_block(p):
     '''block : LCURLYEBR stmt_list RCURLYEBR'''
-    p[0] = ProgramNode(p[2])
+    p[0] = _at(ProgramNode(p[2]), p, 1)
 
 def p_class_decl(p):
     '''class_decl : CLASS ID LCURLYEBR field_list method_list RCURLYEBR'''
-    p[0] = ClassNode(p[2], p[4], p[5])
+    p[0] = _at(ClassNode(p[2], p[4], p[5]), p, 1)
 
 def p_field_list(p):
-    '''field_list : let_decl SEMI_COLON field_list
+    '''field_list : field_list let_decl SEMI_COLON
                   | empty'''
     if len(p) == 4:
-        p[0] = [p[1]] + p[3]
+        p[1].append(p[2])
+        p[0] = p[1]
     else:
         p[0] = []
 
 def p_method_list(p):
-    '''method_list : func method_list
+    '''method_list : method_list func
                    | empty'''
     if len(p) == 3:
-        p[0] = [p[1]] + p[2]
+        p[1].append(p[2])
+        p[0] = p[1]
     else:
         p[0] = []
 
 def p_func(p):
     '''func : FUNC ID LPAREN param_list RPAREN LESS_THAN type GREATER_THAN block'''
-    p[0] = FunctionNode(p[2], p[4], p[7], p[9])
+    p[0] = _at(FunctionNode(p[2], p[4], p[7], p[9]), p, 1)
 
 def p_param_list(p):
-    '''param_list : param COMMA param_list
-                  | param
+    '''param_list : nonempty_param_list
+                  | nonempty_param_list COMMA
                   | empty'''
+    p[0] = p[1] if p[1] else []
+
+def p_nonempty_param_list(p):
+    '''nonempty_param_list : param
+                           | nonempty_param_list COMMA param'''
     if len(p) == 4:
-        p[0] = [p[1]] + p[3]
-    elif len(p) == 2:
-        p[0] = [p[1]] if p[1] else []
+        p[1].append(p[3])
+        p[0] = p[1]
     else:
-        p[0] = []
+        p[0] = [p[1]]
 
 def p_param(p):
     '''param : ID COLON type'''
@@ -81,15 +127,16 @@ def p_stmt(p):
             | class_decl
             | if_stmt
             | while_stmt
+            | for_stmt
             | block
             | RETURN expr SEMI_COLON
             | RETURN SEMI_COLON'''
     
     if len(p) == 4:
-        p[0] = ReturnStatementNode(p[2])
+        p[0] = _at(ReturnStatementNode(p[2]), p, 1)
     elif len(p) == 3:
         if p[1] == 'return':
-            p[0] = ReturnStatementNode(None)
+            p[0] = _at(ReturnStatementNode(None), p, 1)
         else:
             p[0] = p[1] 
     else:
@@ -99,39 +146,48 @@ def p_if_stmt(p):
     '''if_stmt : IF expr THEN block
                | IF expr THEN block ELSE block'''
     if len(p) == 5:
-        p[0] = IfWhileNode(p[2], p[4], is_while=False)
+        p[0] = _at(IfWhileNode(p[2], p[4], is_while=False), p, 1)
     else:
-        p[0] = IfWhileNode(p[2], p[4], p[6], is_while=False)
+        p[0] = _at(IfWhileNode(p[2], p[4], p[6], is_while=False), p, 1)
 
 def p_while_stmt(p):
     '''while_stmt : WHILE expr DO block'''
-    p[0] = IfWhileNode(p[2], p[4], is_while=True)
+    p[0] = _at(IfWhileNode(p[2], p[4], is_while=True), p, 1)
+
+def p_for_stmt(p):
+    '''for_stmt : FOR ID EQ expr TO expr DO block
+                | FOR ID IN expr DO block'''
+    if len(p) == 9:
+        p[0] = _at(ForNode(p[2], p[4], p[6], p[8]), p, 1)
+    else:
+        p[0] = _at(ForEachNode(p[2], p[4], p[6]), p, 1)
 
 def p_let_decl(p):
     '''let_decl : LET ID COLON type
                 | LET ID COLON type EQ expr
                 | LET ID EQ expr'''
     if len(p) == 5 and p[3] == ':':
-        p[0] = VariableDeclarationNode(p[2], p[4])
+        p[0] = _at(VariableDeclarationNode(p[2], p[4]), p, 2)
     elif len(p) == 7:
-        p[0] = VariableDeclarationNode(p[2], p[4], p[6])
+        p[0] = _at(VariableDeclarationNode(p[2], p[4], p[6]), p, 2)
     elif len(p) == 5 and p[3] == '=':
-        p[0] = VariableDeclarationNode(p[2], None, p[4])
+        p[0] = _at(VariableDeclarationNode(p[2], None, p[4]), p, 2)
         
 
 def p_clist(p):
-    '''clist : expr
-             | expr COMMA clist
+    '''clist : nonempty_clist
+             | nonempty_clist COMMA
              | empty'''
+    p[0] = p[1] if p[1] else []
+
+def p_nonempty_clist(p):
+    '''nonempty_clist : expr
+                      | nonempty_clist COMMA expr'''
     if len(p) == 4:
-        p[0] = [p[1]] + p[3]
-    elif len(p) == 2:
-        if p[1] is None:
-            p[0] = []
-        else:
-            p[0] = [p[1]]
+        p[1].append(p[3])
+        p[0] = p[1]
     else:
-        p[0] = []
+        p[0] = [p[1]]
 
 
 def p_type(p):
@@ -162,6 +218,7 @@ def p_builtin(p):
         p[0] = LengthNode(p[3])
     elif p[1] == 'exit':
         p[0] = ExitNode(p[3])
+    _at(p[0], p, 1)
     
 # =============== EXPRESSION GRAMMAR ===============
 def p_expr(p):
@@ -175,13 +232,13 @@ def p_assignment_expr(p):
     if len(p) == 2:
         p[0] = p[1]
     elif p[2] == '=': 
-        p[0] = AssignmentNode(p[1], p[3])
+        p[0] = _at(AssignmentNode(p[1], p[3]), p, 2)
     else:
-        p[0] = RefAssignmentNode(p[1], p[3])
+        p[0] = _at(RefAssignmentNode(p[1], p[3]), p, 2)
 
 def p_field_access(p):
     '''field_access : postfix_expr DOT ID'''
-    p[0] = FieldAccessNode(p[1], p[3])
+    p[0] = _at(FieldAccessNode(p[1], p[3]), p, 2)
 
 def p_lvalue(p):
     '''lvalue : ID
@@ -192,11 +249,11 @@ def p_lvalue(p):
 def p_vector_access(p):
     '''vector_access : ID LSQUAREBR expr RSQUAREBR
                      | vector_literal LSQUAREBR expr RSQUAREBR'''
-    p[0] = VectorAccessNode(p[1], p[3])
+    p[0] = _at(VectorAccessNode(p[1], p[3]), p, 2)
 
 def p_vector_literal(p):
     '''vector_literal : LSQUAREBR clist RSQUAREBR'''
-    p[0] = VectorNode(p[2])
+    p[0] = _at(VectorNode(p[2]), p, 1)
 
 def p_ternary_expr(p):
     '''ternary_expr : logical_or_expr
@@ -204,26 +261,26 @@ def p_ternary_expr(p):
     if len(p) == 2:
         p[0] = p[1]
     else:
-        p[0] = TernaryOperation(p[1], p[3], p[5])
+        p[0] = _at(TernaryOperation(p[1], p[3], p[5]), p, 2)
 
 def p_logical_or_expr(p):
     '''logical_or_expr : logical_and_expr
                        | logical_or_expr OR logical_and_expr'''
     if len(p) == 2: p[0] = p[1]
-    else: p[0] = BinaryOperation(p[1], p[2], p[3])
+    else: p[0] = _at(BinaryOperation(p[1], p[2], p[3]), p, 2)
     
 def p_logical_and_expr(p):
     '''logical_and_expr : equality_expr
                         | logical_and_expr AND equality_expr'''
     if len(p) == 2: p[0] = p[1]
-    else: p[0] = BinaryOperation(p[1], p[2], p[3])
+    else: p[0] = _at(BinaryOperation(p[1], p[2], p[3]), p, 2)
 
 def p_equality_expr(p):
     '''equality_expr : relational_expr
                      | equality_expr EQUAL relational_expr
                      | equality_expr NEQUAL relational_expr'''
     if len(p) == 2: p[0] = p[1]
-    else: p[0] = BinaryOperation(p[1], p[2], p[3])
+    else: p[0] = _at(BinaryOperation(p[1], p[2], p[3]), p, 2)
 
 def p_relational_expr(p):
     '''relational_expr : additive_expr
@@ -232,21 +289,21 @@ def p_relational_expr(p):
                        | relational_expr LEQUAL additive_expr
                        | relational_expr GEQUAL additive_expr'''
     if len(p) == 2: p[0] = p[1]
-    else: p[0] = BinaryOperation(p[1], p[2], p[3])
+    else: p[0] = _at(BinaryOperation(p[1], p[2], p[3]), p, 2)
 
 def p_additive_expr(p):
     '''additive_expr : multiplicative_expr
                      | additive_expr PLUS multiplicative_expr
                      | additive_expr MINUS multiplicative_expr'''
     if len(p) == 2: p[0] = p[1]
-    else: p[0] = BinaryOperation(p[1], p[2], p[3])
+    else: p[0] = _at(BinaryOperation(p[1], p[2], p[3]), p, 2)
 
 def p_multiplicative_expr(p):
     '''multiplicative_expr : unary_expr
                            | multiplicative_expr TIMES unary_expr
                            | multiplicative_expr DIVIDE unary_expr'''
     if len(p) == 2: p[0] = p[1]
-    else: p[0] = BinaryOperation(p[1], p[2], p[3])
+    else: p[0] = _at(BinaryOperation(p[1], p[2], p[3]), p, 2)
 
 def p_unary_expr(p):
     '''unary_expr : postfix_expr
@@ -256,9 +313,9 @@ def p_unary_expr(p):
     if len(p) == 2:
         p[0] = p[1]
     elif p[1] == 'ref':
-        p[0] = RefNode(p[2])
+        p[0] = _at(RefNode(p[2]), p, 1)
     else:
-        p[0] = SingleOperation(p[1], p[2])
+        p[0] = _at(SingleOperation(p[1], p[2]), p, 1)
 
 def p_postfix_expr(p):
     '''postfix_expr : primary_expr
@@ -273,15 +330,16 @@ def p_postfix_expr(p):
             p[0] = MethodCallNode(field_access_node.object_expr, field_access_node.field_name, p[3])
         else:
             p[0] = FunctionCallNode(p[1], p[3])
+        _at(p[0], p, 2)
 
 
 def p_lambda_expr(p):
     '''lambda_expr : LAMBDA ID ARROW expr'''
-    p[0] = LambdaNode(p[2], p[4])
+    p[0] = _at(LambdaNode(p[2], p[4]), p, 1)
 
 def p_map_expr(p):
     '''map_expr : MAP LPAREN lambda_expr COMMA expr RPAREN'''
-    p[0] = MapNode(p[3], p[5])
+    p[0] = _at(MapNode(p[3], p[5]), p, 1)
 
 def p_primary_expr(p):
     '''primary_expr : ID
@@ -302,7 +360,7 @@ def p_primary_expr(p):
     elif p[1] == '(':
         p[0] = p[2]
     elif p[1] == 'new':
-        p[0] = NewNode(p[2], p[4])
+        p[0] = _at(NewNode(p[2], p[4]), p, 1)
 # =============== END EXPRESSION GRAMMAR ===============
 
 def p_empty(p):
@@ -331,44 +389,427 @@ def p_error(p):
 
 error = []
 
-try:
-    inputFile = open("test.txt", "r")
-    data = inputFile.read()
-    inputFile.close()
-except FileNotFoundError:
-    print("Error: test.txt not found. Please create it.")
-    data = ""
-    error.append("test.txt not found.")
-
+lexer = lex.lex(module=Tokenizer)
+fast_lexer = FastLexer()
 parser = yacc.yacc()
-ast = parser.parse(data)
-
-checker = SemanticChecker()
-errors = checker.check(ast)
-
-print("\n=============|Syntax Errors|=============\n")
-if error:
-    for err in error:
-        print(err)
-else:
-    print("No syntax errors found.")
-
-print("\n=============|Semantic Errors|=============\n")
-if errors:
-    for error in errors:
-        print(error)
-else:
-    print("No semantic errors found.")
-
-print("\n=============|Code Generation|=============\n")
-if not error and not errors:
-    generator = CodeGenerator(checker.class_table, checker.global_symbol_table)
-    tsvm_code = generator.generate(ast)
-
-    with open("output.tsvm", "w") as outfile:
-       outfile.write(tsvm_code)
-    print("Code written to output.tsvm")
-    
-    print("Code generated successfully.")
-else:
-    print("Code generation skipped due to syntax or semantic errors.")
\ No newline at end of file
+
+
+def parse_source(data, use_fast_lexer=False):
+    del error[:]
+    if use_fast_lexer:
+        fast_lexer.input(data)
+        line_starts[:] = fast_lexer.line_starts()
+        return parser.parse(None, lexer=fast_lexer)
+    line_starts[:] = [0] + [m.end() for m in re.finditer('\n', data)]
+    lexer.lineno = 1
+    return parser.parse(data, lexer=lexer)
+
+
+class TokenFeed:
+    """Lexer interface over tokens that were already scanned, for ply.yacc."""
+    def __init__(self, tokens):
+        self.token = functools.partial(next, iter(tokens), None)
+
+
+def iter_units(lexer):
+    """
+    Groups the token stream of `lexer` (a BufferLexer) into top-level statements.
+    Yields (tokens, line starts) per statement; a statement ends at a `;` or at the
+    `}` closing its outermost block, unless an `else` follows.
+    """
+    tok = lexer.token()
+    while tok is not None:
+        lexer.mark()
+        unit, depth = [], 0
+        while tok is not None:
+            unit.append(tok)
+            kind = tok.type
+            tok = lexer.token()
+            if kind == 'LCURLYEBR':
+                depth += 1
+            elif kind == 'RCURLYEBR':
+                depth -= 1
+                if depth <= 0 and (tok is None or tok.type != 'ELSE'):
+                    break
+            elif kind == 'SEMI_COLON' and depth <= 0:
+                break
+        yield unit, list(lexer.line_starts())
+
+
+def parse_unit(tokens, unit_line_starts):
+    del error[:]
+    line_starts[:] = unit_line_starts
+    return parser.parse(None, lexer=TokenFeed(tokens))
+
+
+def _attach_methods(checker, node, methods):
+    """Points the class table entries of class `node` at `methods` (or None)."""
+    class_info = checker.class_table.get(node.name)
+    if class_info is None:
+        return
+    for method in node.methods:
+        if method.name in class_info['methods']:
+            class_info['methods'][method.name]['node'] = method if methods else None
+
+
+def compile_stream(path, output, layout=None):
+    """
+    Compiles the file at `path` one top-level statement at a time, lexing from an
+    mmap of it and appending each statement's code to `output` as soon as it is
+    generated, so besides the global symbol tables memory is bounded by the
+    largest statement rather than the program.
+
+    The source is streamed twice. The first pass only registers class and function
+    signatures (method and function bodies are dropped right away), so later
+    statements can still call anything declared further down. The second pass
+    checks and generates each statement with one long-lived checker and generator.
+    Statements with syntax errors are not checked. Imports are rejected in the first
+    pass, since modules are linked as whole programs. `output` is only replaced when
+    the whole program compiles. Returns (syntax errors, semantic errors, written).
+    A non-default `layout` is recorded in a header line of the output.
+    """
+    layout = layout or DEFAULT_LAYOUT
+    checker = SemanticChecker()
+    syntax_errors, broken, functions = [], set(), []
+
+    with open(path, "rb") as source:
+        size = os.fstat(source.fileno()).st_size
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    lexer = BufferLexer()
+    try:
+        lexer.input(buffer)
+        for i, (tokens, unit_line_starts) in enumerate(iter_units(lexer)):
+            ast = parse_unit(tokens, unit_line_starts)
+            if error:
+                syntax_errors.extend(error)
+                broken.add(i)
+            if ast is None:
+                continue
+            for child in ast.children:
+                if isinstance(child, ClassNode):
+                    checker.register_class(child)
+                    _attach_methods(checker, child, None)
+                elif isinstance(child, FunctionNode):
+                    functions.append(FunctionNode(child.name, child.params, child.return_type, None))
+                elif isinstance(child, ImportNode):
+                    checker.error(f"Cannot import module '{child.name}': --stream does not support imports")
+        if checker.errors:
+            return syntax_errors, checker.errors, False
+        for func in functions:
+            checker.register_function(func)
+        del functions
+
+        generator = CodeGenerator(checker.class_table, checker.global_symbol_table, layout)
+        partial_output = output + ".part"
+        try:
+            with open(partial_output, "w") as out:
+                separator = ""
+                if not layout.is_default():
+                    out.write(layout.header())
+                    separator = "\n"
+                lexer.input(buffer)
+                for i, (tokens, unit_line_starts) in enumerate(iter_units(lexer)):
+                    if i in broken:
+                        continue
+                    ast = parse_unit(tokens, unit_line_starts)
+                    for child in ast.children:
+                        if isinstance(child, ClassNode):
+                            _attach_methods(checker, child, child.methods)
+                        checker.visit(child)
+                        if not syntax_errors and not checker.errors:
+                            generator.visit(child)
+                            if generator.code:
+                                out.write(separator + "\n".join(generator.code))
+                                separator = "\n"
+                                del generator.code[:]
+                        if isinstance(child, ClassNode):
+                            _attach_methods(checker, child, None)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(partial_output)
+            raise
+    finally:
+        lexer.input(b"")
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+    if syntax_errors or checker.errors:
+        os.remove(partial_output)
+        return syntax_errors, checker.errors, False
+    os.replace(partial_output, output)
+    return syntax_errors, checker.errors, True
+
+
+def _phase(stats, name):
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
+
+
+def _load_imports(ast, loader, checker):
+    """
+    Declares the exports of the modules `ast` imports to `checker`; returns their
+    objects in link order and the errors met loading them.
+    """
+    names = imports_of(ast)
+    if not names or loader is None:
+        return [], []  # the checker reports imports nothing loaded
+    start = len(loader.errors)
+    objects = loader.load(names)
+    declare_imports(checker, objects)
+    checker.modules.update(names)  # a module that failed to load is already reported
+    return objects, loader.errors[start:]
+
+
+def compile_object(data, loader=None, layout=None, use_fast_lexer=False, check_jobs=1):
+    """
+    Compiles one module to an object file (see Linker.py), resolving its imports
+    with `loader`; returns (syntax errors, semantic errors, object or None). Errors
+    in the imported modules are left in `loader.errors`.
+    """
+    ast = parse_source(data, use_fast_lexer)
+    syntax_errors = list(error)
+    checker = SemanticChecker(check_jobs)
+    objects, import_errors = _load_imports(ast, loader, checker)
+    semantic_errors = checker.check(ast)
+    if syntax_errors or semantic_errors or import_errors:
+        return syntax_errors, semantic_errors, None
+    generator = CodeGenerator(checker.class_table, checker.global_symbol_table, layout, relocatable=True)
+    import_globals(generator, objects)
+    generator.generate(ast)
+    return syntax_errors, semantic_errors, make_object(None, ast, checker, generator, layout)
+
+
+def compile_source(data, cache=None, use_fast_lexer=False, stats=None, layout=None, shaker=None, evaluator=None,
+                   stack_alloc=False, loader=None, check_jobs=1):
+    """
+    Runs every compiler phase on `data`; returns (syntax errors, semantic errors, tsvm code).
+    Phases are measured into `stats` when a CompileStats is given. Globals are
+    placed by `layout`, which the code names in a header line unless it is the
+    default. A PartialEvaluator given as `evaluator` folds constant code and a
+    TreeShaker given as `shaker` then drops unreachable code before generation.
+    With `stack_alloc`, allocations that never escape their function are placed
+    in its stack frame. These passes need the whole program, so none of them can
+    be used with `cache`. With `check_jobs` above 1, function and method bodies
+    are checked in that many processes.
+
+    Imported modules are found and compiled by `loader`, a ModuleLoader; the
+    program is then generated as relocatable code and linked with them. Passes
+    only see the importing program, and `cache` is not used for it, since its
+    source alone does not determine its code.
+    """
+    if cache is not None and (shaker is not None or evaluator is not None or stack_alloc):
+        raise ValueError("whole-program passes cannot be combined with a compile cache")
+    if cache is not None and check_jobs > 1:
+        raise ValueError("parallel checking cannot be combined with a compile cache")
+    layout = layout or DEFAULT_LAYOUT
+    if cache is not None:
+        with _phase(stats, "cache"):
+            code = cache.get_program(data)
+        if code is not None:
+            if stats is not None:
+                stats.record_code(code)
+            return [], [], code
+
+    with _phase(stats, "parse"):
+        ast = parse_source(data, use_fast_lexer)
+    syntax_errors = list(error)
+    if stats is not None:
+        stats.record_ast(ast)
+
+    checker = SemanticChecker(check_jobs)
+    with _phase(stats, "import"):
+        objects, import_errors = _load_imports(ast, loader, checker)
+    if imports_of(ast):
+        cache = None
+    build = IncrementalBuild(cache) if cache is not None else None
+    with _phase(stats, "check"):
+        if build:
+            semantic_errors = build.check(checker, ast)
+        else:
+            semantic_errors = checker.check(ast)
+    semantic_errors = import_errors + semantic_errors
+    if stats is not None:
+        stats.record_symbols(checker)
+
+    code = None
+    if not syntax_errors and not semantic_errors:
+        if evaluator is not None:
+            with _phase(stats, "evaluate"):
+                ast = evaluator.evaluate(ast)
+        if shaker is not None:
+            with _phase(stats, "shake"):
+                ast = shaker.shake(ast, checker.class_table)
+        stack_allocated = None
+        if stack_alloc:
+            with _phase(stats, "escape"):
+                stack_allocated = EscapeAnalysis(checker.class_table).analyze(ast)
+        relocatable = bool(imports_of(ast))
+        generator = CodeGenerator(checker.class_table, checker.global_symbol_table, layout, stack_allocated,
+                                  relocatable)
+        with _phase(stats, "generate"):
+            if relocatable:
+                import_globals(generator, objects)
+            code = build.generate(generator, ast) if build else generator.generate(ast)
+        if relocatable:
+            with _phase(stats, "link"):
+                try:
+                    code = link(objects + [make_object("__main__", ast, checker, generator, layout)])
+                except LinkError as e:
+                    return syntax_errors, semantic_errors + [f"Link error: {e}"], None
+        elif not layout.is_default():
+            code = layout.header() + "\n" + code
+        if stats is not None:
+            stats.record_code(code)
+        if cache is not None:
+            cache.put_program(data, code)
+
+    if cache is not None:
+        cache.save()
+    return syntax_errors, semantic_errors, code
+
+
+def _layout_arg(spec):
+    try:
+        return MemoryLayout.parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile a NITLang program to TSVM assembly.")
+    arg_parser.add_argument("source", nargs="?", default="test.txt")
+    arg_parser.add_argument("-o", "--output", help="output file (default: output.tsvm, or SOURCE.nito with -c)")
+    arg_parser.add_argument("-c", "--compile-only", action="store_true",
+                            help="compile the source as a module and write its object file instead of a program")
+    arg_parser.add_argument("-I", "--include", action="append", default=[], metavar="DIR",
+                            help="look for imported modules in DIR too (after the source's directory)")
+    arg_parser.add_argument("--build-stdlib", action="store_true",
+                            help="compile the standard library modules to object files and exit")
+    arg_parser.add_argument("--cache", metavar="DIR",
+                            help="reuse unchanged functions and classes from an on-disk compile cache")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES, metavar="BYTES",
+                            help="evict least recently used cache entries above this size")
+    arg_parser.add_argument("--fast-lexer", action="store_true",
+                            help="tokenize with FastLexer instead of the PLY lexer")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="compile one top-level statement at a time, writing code as it is generated")
+    arg_parser.add_argument("--stats", nargs="?", const="", metavar="PATH",
+                            help="write a JSON report of per-phase compile costs (default: OUTPUT.stats.json)")
+    arg_parser.add_argument("--layout", type=_layout_arg, default=DEFAULT_LAYOUT, metavar="SPEC",
+                            help="TSVM segment sizes in words, e.g. stack=100000,heap=1000000,heap_limit=50000000")
+    arg_parser.add_argument("--shake", action="store_true",
+                            help="drop functions, methods, classes, globals and fields the program never reaches")
+    arg_parser.add_argument("--partial-eval", action="store_true",
+                            help="evaluate constant expressions and pure function calls with constant arguments")
+    arg_parser.add_argument("--eval-steps", type=int, default=DEFAULT_STEP_BUDGET, metavar="N",
+                            help="interpreter steps allowed per folded call (default: %(default)s)")
+    arg_parser.add_argument("--stack-alloc", action="store_true",
+                            help="place objects and fixed-size vectors that never escape their function in its frame")
+    arg_parser.add_argument("--check-jobs", type=int, default=1, metavar="N",
+                            help="check function and method bodies in N worker processes")
+    args = arg_parser.parse_args(argv)
+    if args.check_jobs < 1:
+        arg_parser.error("--check-jobs must be at least 1")
+    if args.check_jobs > 1 and (args.stream or args.cache):
+        arg_parser.error("--check-jobs cannot be combined with --stream or --cache")
+    if args.stream and args.cache:
+        arg_parser.error("--stream cannot be combined with --cache")
+    if args.stream and args.stats is not None:
+        arg_parser.error("--stream cannot be combined with --stats")
+    if args.shake and (args.stream or args.cache):
+        arg_parser.error("--shake cannot be combined with --stream or --cache")
+    if args.partial_eval and (args.stream or args.cache):
+        arg_parser.error("--partial-eval cannot be combined with --stream or --cache")
+    if args.stack_alloc and (args.stream or args.cache):
+        arg_parser.error("--stack-alloc cannot be combined with --stream or --cache")
+    if args.compile_only and (args.stream or args.cache or args.shake or args.partial_eval or args.stack_alloc):
+        arg_parser.error("-c cannot be combined with --stream, --cache or whole-program passes")
+    source_dir = os.path.dirname(os.path.abspath(args.source))
+    loader = ModuleLoader(functools.partial(compile_object, layout=args.layout, use_fast_lexer=args.fast_lexer),
+                          [source_dir] + args.include, args.layout)
+    if args.build_stdlib:
+        names = sorted(name[:-len(SOURCE_SUFFIX)] for name in os.listdir(STDLIB_DIR) if name.endswith(SOURCE_SUFFIX))
+        loader.search_path = [STDLIB_DIR]
+        loader.load(names)
+        for err in loader.errors:
+            print(err)
+        print(f"Standard library: {loader.compiled} modules compiled, {loader.reused} up to date")
+        return
+    if args.output is None:
+        args.output = os.path.splitext(args.source)[0] + OBJECT_SUFFIX if args.compile_only else "output.tsvm"
+
+    shaker = TreeShaker() if args.shake else None
+    evaluator = PartialEvaluator(args.eval_steps) if args.partial_eval else None
+    stats = CompileStats(args.source) if args.stats is not None else None
+
+    cache = CompileCache(args.cache, args.cache_size, args.layout) if args.cache else None
+    written = False
+    tsvm_code = None
+    try:
+        if args.stream:
+            syntax_errors, errors, written = compile_stream(args.source, args.output, args.layout)
+        else:
+            inputFile = open(args.source, "r")
+            data = inputFile.read()
+            inputFile.close()
+            if args.compile_only:
+                syntax_errors, errors, obj = compile_object(data, loader, args.layout, args.fast_lexer,
+                                                            args.check_jobs)
+                errors = loader.errors + errors
+                if obj is not None:
+                    obj["module"] = os.path.splitext(os.path.basename(args.source))[0]
+                    obj["key"] = loader.key(data, obj["imports"])
+                    write_object(args.output, obj)
+                    written = True
+            else:
+                syntax_errors, errors, tsvm_code = compile_source(data, cache, args.fast_lexer, stats, args.layout,
+                                                                shaker, evaluator, args.stack_alloc, loader,
+                                                                args.check_jobs)
+    except FileNotFoundError:
+        print(f"Error: {args.source} not found. Please create it.")
+        syntax_errors, errors = [f"{args.source} not found."], []
+
+    print("\n=============|Syntax Errors|=============\n")
+    if syntax_errors:
+        for err in syntax_errors:
+            print(err)
+    else:
+        print("No syntax errors found.")
+
+    print("\n=============|Semantic Errors|=============\n")
+    if errors:
+        for err in errors:
+            print(err)
+    else:
+        print("No semantic errors found.")
+
+    print("\n=============|Code Generation|=============\n")
+    if tsvm_code is not None:
+        with open(args.output, "w") as outfile:
+           outfile.write(tsvm_code)
+        written = True
+    if written:
+        print(f"Code written to {args.output}")
+
+        print("Code generated successfully.")
+    else:
+        print("Code generation skipped due to syntax or semantic errors.")
+
+    if cache is not None:
+        print(f"Compile cache: {cache.hits} hits, {cache.misses} misses")
+    if loader.compiled or loader.reused:
+        print(f"Modules: {loader.compiled} compiled, {loader.reused} loaded from object files")
+
+    if evaluator is not None and written:
+        print("Partial evaluation folded " + ", ".join(f"{n} {kind}" for kind, n in evaluator.folded.items()))
+    if shaker is not None and written:
+        print("Tree shaking removed " + ", ".join(f"{n} {kind}" for kind, n in shaker.removed.items()))
+
+    if stats is not None:
+        stats_path = args.stats or args.output + ".stats.json"
+        stats.write(stats_path)
+        print(f"Compile stats written to {stats_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+import shlex
+from collections import Counter
+
+from AST import *
+from TreeShaker import _is_pure
+
+DEFAULT_STEP_BUDGET = 100000
+_MAX_DEPTH = 64
+_MAX_VECTOR_LITERAL = 256  # elements; longer results stay calls rather than bloat the code
+_UNSET = object()  # a local or vector element nothing has written yet
+_PARAM_TYPES = ('int', 'bool', 'string', 'vector')
+_COMPARE = {
+    '==': lambda a, b: a == b, '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b, '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+}
+
+
+class _GiveUp(Exception):
+    """The VM would do something the evaluator does not reproduce exactly, or the budget ran out."""
+
+
+class _Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+def _is_literal(name):
+    return name in ('true', 'false', 'null') or name.startswith('"') or name.startswith("'")
+
+
+def _string_value(literal):
+    """The characters `sload` stores for a string literal, or None when that is hard to predict."""
+    if '#' in literal:
+        return None
+    try:
+        parts = shlex.split(literal)
+    except ValueError:
+        return None
+    if len(parts) != 1:
+        return None
+    return parts[0][:-1] if parts[0].endswith(',') else parts[0]
+
+
+def _string_literal(value):
+    """A literal that `sload` turns back into `value`, or None."""
+    if not value.isprintable() or value.endswith(',') or any(c in value for c in '"\'\\#'):
+        return None
+    return f'"{value}"'
+
+
+def _constant(expr):
+    if type(expr) is int:
+        return True
+    return isinstance(expr, str) and (expr in ('true', 'false') or
+                                      (_is_literal(expr) and _string_value(expr) is not None))
+
+
+class PartialEvaluator:
+    """
+    Compile-time evaluation, run on a checked AST before code generation.
+
+    A top-level function is pure when it does no I/O, touches no globals, refs or
+    objects and calls only pure functions. Calls to pure functions with int, bool
+    or string literal arguments, and operators on literals, are interpreted with
+    the VM's semantics; when that finishes within `max_steps` and yields an int,
+    bool, string or a vector of up to 256 ints or bools, the expression is
+    replaced by the result. A vector literal allocates a fresh vector each time it
+    runs, as the call did, so lookup-table builders fold too. Anything the
+    interpreter cannot reproduce exactly (runtime errors, reads of uninitialized
+    memory, comparisons of pointers) leaves the code as it was. `length` of a
+    vector whose size is fixed by its declaration is folded too. `folded` counts
+    the replacements.
+    """
+    def __init__(self, max_steps=DEFAULT_STEP_BUDGET):
+        self.max_steps = max_steps
+        self.folded = {"calls": 0, "expressions": 0, "lengths": 0}
+
+    def evaluate(self, ast):
+        if not isinstance(ast, ProgramNode):
+            return ast
+        self.functions = {c.name: c for c in ast.children if isinstance(c, FunctionNode)}
+        self.pure = self._pure_functions()
+        self.results = {}
+        self.reassigned = self._reassigned_names(ast)
+        self._rewrite_body(ast, [])
+        return ast
+
+    # ---------------- purity ----------------
+
+    def _pure_functions(self):
+        callees = {}
+        for name, func in self.functions.items():
+            called = self._callees_if_pure(func)
+            if called is not None:
+                callees[name] = called
+        changed = True
+        while changed:
+            changed = False
+            for name in list(callees):
+                if not callees[name] <= callees.keys():
+                    del callees[name]
+                    changed = True
+        return set(callees)
+
+    def _callees_if_pure(self, func):
+        """Names `func` calls if its body is pure apart from those calls, else None."""
+        params = [name for name, _ in func.params]
+        if any(ptype not in _PARAM_TYPES for _, ptype in func.params):
+            return None
+        locals_ = Counter(decl.name for decl in _declarations(func.body))
+        if any(n > 1 for n in locals_.values()) or set(params) & locals_.keys():
+            return None
+        called = set()
+        if not self._pure_node(func.body, set(params) | locals_.keys(), called):
+            return None
+        return called
+
+    def _pure_node(self, node, names, called):
+        if node is None or type(node) is int:
+            return True
+        if isinstance(node, str):
+            return _is_literal(node) or node in names
+        if isinstance(node, list):
+            return all(self._pure_node(n, names, called) for n in node)
+        if isinstance(node, FunctionCallNode):
+            if not isinstance(node.name, str) or node.name not in self.functions:
+                return False
+            called.add(node.name)
+            return self._pure_node(node.params, names, called)
+        if isinstance(node, MapNode):
+            return (self._pure_node(node.list_expr, names, called) and
+                    self._pure_node(node.lambda_node.body, {node.lambda_node.param}, called))
+        if isinstance(node, (ForNode, ForEachNode)):
+            if node.var in names:
+                return False
+            return all(self._pure_node(getattr(node, field), names, called) for field in node._fields[:-1]) \
+                and self._pure_node(node.stmt, names | {node.var}, called)
+        if isinstance(node, AssignmentNode):
+            if not isinstance(node.var, (str, VectorAccessNode)):
+                return False
+        elif isinstance(node, VariableDeclarationNode):
+            if node.var_type not in _PARAM_TYPES + (None,):
+                return False
+        elif not isinstance(node, (ProgramNode, ReturnStatementNode, IfWhileNode, BinaryOperation,
+                                   SingleOperation, TernaryOperation, VectorNode, VectorAccessNode,
+                                   ListNode, LengthNode)):
+            return False
+        return all(self._pure_node(getattr(node, field), names, called) for field in node._fields)
+
+    # ---------------- interpreter ----------------
+
+    def _tick(self, n=1):
+        self.steps += n
+        if self.steps > self.max_steps:
+            raise _GiveUp()
+
+    def _call(self, name, args, depth):
+        func = self.functions[name]
+        if depth > _MAX_DEPTH or len(args) != len(func.params):
+            raise _GiveUp()
+        env = {pname: arg for (pname, _), arg in zip(func.params, args)}
+        try:
+            self._exec(func.body, env, depth)
+        except _Return as r:
+            return r.value
+        raise _GiveUp()  # fell off the end: r0 holds whatever was last there
+
+    def _exec(self, node, env, depth):
+        self._tick()
+        if isinstance(node, ProgramNode):
+            for child in node.children:
+                self._exec(child, env, depth)
+        elif isinstance(node, VariableDeclarationNode):
+            if node.value is not None:
+                env[node.name] = self._eval(node.value, env, depth)
+            else:
+                env.setdefault(node.name, _UNSET)  # a loop reuses the slot and its old value
+        elif isinstance(node, ReturnStatementNode):
+            raise _Return(_UNSET if node.returnVar is None else self._eval(node.returnVar, env, depth))
+        elif isinstance(node, IfWhileNode):
+            if node.is_while:
+                while self._int(self._eval(node.expr, env, depth)):
+                    self._exec(node.stmt, env, depth)
+            elif self._int(self._eval(node.expr, env, depth)):
+                self._exec(node.stmt, env, depth)
+            elif node.stmtelse is not None:
+                self._exec(node.stmtelse, env, depth)
+        elif isinstance(node, ForNode):
+            start = self._int(self._eval(node.exp1, env, depth))
+            end = self._int(self._eval(node.exp2, env, depth))
+            for i in range(start, end + 1):
+                env[node.var] = i
+                self._exec(node.stmt, env, depth)
+        elif isinstance(node, ForEachNode):
+            for element in self._vector(self._eval(node.vector, env, depth)):
+                if element is _UNSET:
+                    raise _GiveUp()
+                env[node.var] = element
+                self._exec(node.stmt, env, depth)
+        else:
+            self._eval(node, env, depth)
+
+    @staticmethod
+    def _int(value):
+        if type(value) is not int:
+            raise _GiveUp()
+        return value
+
+    @staticmethod
+    def _vector(value):
+        if type(value) is not list:
+            raise _GiveUp()
+        return value
+
+    @staticmethod
+    def _index(vector, index):
+        if type(index) is not int or not 0 <= index < len(vector):
+            raise _GiveUp()
+        return index
+
+    def _eval(self, expr, env, depth):
+        self._tick()
+        if type(expr) is int:
+            return expr
+        if isinstance(expr, str):
+            if expr in ('true', 'false'):
+                return int(expr == 'true')
+            if expr == 'null':
+                raise _GiveUp()
+            if _is_literal(expr):
+                value = _string_value(expr)
+                if value is None:
+                    raise _GiveUp()
+                return value
+            value = env.get(expr, _UNSET)
+            if value is _UNSET:
+                raise _GiveUp()
+            return value
+
+        if isinstance(expr, BinaryOperation):
+            left = self._eval(expr.left, env, depth)
+            if expr.op in ('&&', '||'):
+                if bool(self._int(left)) == (expr.op == '||'):
+                    return int(expr.op == '||')
+                return int(bool(self._int(self._eval(expr.right, env, depth))))
+            right = self._eval(expr.right, env, depth)
+            if expr.op == '+' and expr.inferred_type == 'string':
+                parts = []
+                for side, value in ((expr.left, left), (expr.right, right)):
+                    expected = ('string',) if type(value) is str else ('int', 'bool')
+                    side_type = side.inferred_type if isinstance(side, ASTNode) else None
+                    if type(value) not in (int, str) or side_type not in expected + (None,):
+                        raise _GiveUp()  # the code generator would convert it differently
+                    parts.append(str(value))
+                return parts[0] + parts[1]
+            left, right = self._int(left), self._int(right)
+            if expr.op == '+':
+                return left + right
+            if expr.op == '-':
+                return left - right
+            if expr.op == '*':
+                return left * right
+            if expr.op == '/':
+                if right == 0:
+                    raise _GiveUp()
+                try:
+                    return int(left / right)  # as the VM divides
+                except OverflowError:
+                    raise _GiveUp() from None
+            if expr.op in _COMPARE:
+                return int(_COMPARE[expr.op](left, right))
+            raise _GiveUp()
+
+        if isinstance(expr, SingleOperation):
+            value = self._int(self._eval(expr.right, env, depth))
+            if expr.op == '-':
+                return -value
+            if expr.op == '!':
+                return int(value == 0)
+            raise _GiveUp()
+
+        if isinstance(expr, TernaryOperation):
+            if self._int(self._eval(expr.condition, env, depth)):
+                return self._eval(expr.body, env, depth)
+            return self._eval(expr.bodyelse, env, depth)
+
+        if isinstance(expr, AssignmentNode):
+            value = self._eval(expr.value, env, depth)
+            if isinstance(expr.var, str):
+                env[expr.var] = value
+            else:
+                vector = self._vector(self._eval(expr.var.array_name, env, depth))
+                vector[self._index(vector, self._eval(expr.var.index, env, depth))] = value
+            return value
+
+        if isinstance(expr, VectorNode):
+            return [self._eval(e, env, depth) for e in expr.elements]
+        if isinstance(expr, ListNode):
+            size = self._int(self._eval(expr.size, env, depth))
+            if size < 0:
+                raise _GiveUp()
+            self._tick(size)
+            return [_UNSET] * size
+        if isinstance(expr, LengthNode):
+            return len(self._vector(self._eval(expr.array, env, depth)))
+        if isinstance(expr, VectorAccessNode):
+            vector = self._vector(self._eval(expr.array_name, env, depth))
+            value = vector[self._index(vector, self._eval(expr.index, env, depth))]
+            if value is _UNSET:
+                raise _GiveUp()
+            return value
+
+        if isinstance(expr, FunctionCallNode):
+            if expr.name not in self.pure:
+                raise _GiveUp()
+            args = [self._eval(arg, env, depth) for arg in expr.params]
+            return self._call(expr.name, args, depth + 1)
+
+        if isinstance(expr, MapNode):
+            vector = self._vector(self._eval(expr.list_expr, env, depth))
+            lambda_node = expr.lambda_node
+            return [self._eval(lambda_node.body, {lambda_node.param: self._int(elem)}, depth) for elem in vector]
+
+        raise _GiveUp()
+
+    # ---------------- folding ----------------
+
+    def _run(self, expr):
+        """Value of a closed expression, or None."""
+        self.steps = 0
+        try:
+            return self._eval(expr, {}, 0)
+        except (_GiveUp, RecursionError):
+            return None
+
+    def _literal(self, value, value_type):
+        if value_type == 'bool':
+            return ('false', 'true')[value] if value in (0, 1) and type(value) is int else None
+        if value_type in ('int', None):
+            return value if type(value) is int else None
+        if value_type == 'string':
+            return _string_literal(value) if type(value) is str else None
+        if value_type == 'vector':
+            if type(value) is not list or len(value) > _MAX_VECTOR_LITERAL:
+                return None
+            if not all(type(e) is int for e in value):
+                return None  # unwritten elements, strings (heap pointers) and nested vectors
+            literal = VectorNode(list(value))
+            literal.inferred_type = 'vector'
+            return literal
+        return None
+
+    def _fold(self, node, lengths):
+        """Replacement for `node`, whose children are already folded, or `node` itself."""
+        if isinstance(node, FunctionCallNode):
+            if node.name not in self.pure or not all(_constant(arg) for arg in node.params):
+                return node
+            key = (node.name, tuple(node.params))
+            if key not in self.results:
+                self.results[key] = self._run(node)
+            value_type = node.inferred_type or self.functions[node.name].return_type
+            return self._replace(node, self.results[key], value_type, "calls")
+
+        if isinstance(node, (BinaryOperation, SingleOperation, TernaryOperation)):
+            if not all(_constant(getattr(node, field)) for field in node._fields):
+                return node
+            if isinstance(node, SingleOperation) and node.op not in ('-', '!'):
+                return node
+            value_type = node.inferred_type
+            if value_type is None and isinstance(node, BinaryOperation) and node.op in ('&&', '||', *_COMPARE):
+                value_type = 'bool'
+            return self._replace(node, self._run(node), value_type, "expressions")
+
+        if isinstance(node, LengthNode):
+            size = self._static_length(node.array, lengths)
+            if size is not None and (isinstance(node.array, str) or _is_pure(node.array)):
+                self.folded["lengths"] += 1
+                return size
+        return node
+
+    def _replace(self, node, value, value_type, kind):
+        literal = None if value is None else self._literal(value, value_type)
+        if literal is None:
+            return node
+        self.folded[kind] += 1
+        return literal
+
+    def _static_length(self, expr, lengths):
+        if isinstance(expr, VectorNode):
+            return len(expr.elements)
+        if isinstance(expr, ListNode):
+            return expr.size if type(expr.size) is int and expr.size >= 0 else None
+        if isinstance(expr, MapNode):
+            return self._static_length(expr.list_expr, lengths)
+        if isinstance(expr, str):
+            return lengths.get(expr)
+        return None
+
+    def _rewrite_body(self, body, params):
+        """Folds a function body or the top level, with its own table of fixed vector sizes."""
+        declared = Counter(decl.name for decl in _declarations(body))
+        once = {name for name, n in declared.items() if n == 1} - set(params) - self.reassigned
+        self._rewrite(body, {}, once)
+
+    def _rewrite(self, node, lengths, once):
+        if isinstance(node, FunctionNode):
+            self._rewrite_body(node.body, [name for name, _ in node.params])
+            return
+        if isinstance(node, ClassNode):
+            for method in node.methods:
+                self._rewrite(method, lengths, once)
+            return
+        if isinstance(node, LambdaNode):
+            lengths, once = {}, set()  # the lambda sees only its parameter
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, ASTNode):
+                setattr(node, field, self._rewrite_child(value, lengths, once, node))
+            elif isinstance(value, list):
+                setattr(node, field, [self._rewrite_child(v, lengths, once, node) if isinstance(v, ASTNode) else v
+                                      for v in value])
+        if isinstance(node, VariableDeclarationNode) and node.name in once:
+            size = self._static_length(node.value, lengths)
+            if size is not None:
+                lengths[node.name] = size
+
+    def _rewrite_child(self, child, lengths, once, parent):
+        self._rewrite(child, lengths, once)
+        if isinstance(parent, ProgramNode):
+            return child  # a statement's value is unused
+        return self._fold(child, lengths)
+
+    @staticmethod
+    def _reassigned_names(ast):
+        """Names that are assigned to, passed by `ref` or used as loop variables anywhere, so their vector may change."""
+        names = set()
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, AssignmentNode) and isinstance(node.var, str):
+                names.add(node.var)
+            elif isinstance(node, RefNode) and isinstance(node.var_name, str):
+                names.add(node.var_name)
+            elif isinstance(node, (ForNode, ForEachNode)):
+                names.add(node.var)  # the loop variable shadows any vector of that name
+            if isinstance(node, ASTNode):
+                stack.extend(node.child_nodes())
+        return names
+
+
+def _declarations(body):
+    """Variable declarations in `body`, not counting nested functions and classes."""
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, VariableDeclarationNode):
+            yield node
+        if isinstance(node, ASTNode) and not isinstance(node, (FunctionNode, ClassNode)):
+            stack.extend(node.child_nodes())
@@ -1,15 +1,83 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
 from AST import *
-import copy
+
+_ANNOTATIONS = ('inferred_type', 'var_type', 'element_types', 'receiver_type')
+
+class Scope:
+    """
+    One frame of the symbol table, chained to the frame that encloses it.
+
+    Functions, loops and lambdas push a frame in O(1) and lookups walk the short
+    parent chain. An entry that lives in an enclosing frame is copied into the
+    current one before it is changed, so popping the frame drops the change.
+    """
+    __slots__ = ('symbols', 'parent')
+
+    def __init__(self, parent=None):
+        self.symbols = {}
+        self.parent = parent
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            entry = scope.symbols.get(name)
+            if entry is not None:
+                return entry
+            scope = scope.parent
+        return None
+
+    def lookup_for_update(self, name):
+        entry = self.symbols.get(name)
+        if entry is None:
+            entry = self.lookup(name)
+            if entry is not None:
+                entry = dict(entry)
+                if 'element_types' in entry:
+                    entry['element_types'] = list(entry['element_types'])
+                self.symbols[name] = entry
+        return entry
+
+    def get(self, name, default=None):
+        entry = self.lookup(name)
+        return default if entry is None else entry
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def __getitem__(self, name):
+        entry = self.lookup(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def __setitem__(self, name, entry):
+        self.symbols[name] = entry
 
 class SemanticChecker:
-    def __init__(self):
-        self.symbol_table = {}
+    """
+    Checks a program and records the types it infers on the AST. With `jobs`
+    above 1, `check` checks function and method bodies in that many worker
+    processes, see `_check_parallel`.
+    """
+    def __init__(self, jobs=1):
+        self.symbol_table = Scope()
         self.class_table = {} 
         self.errors = []
         self.current_function = None
         self.current_class = None
         self.global_symbol_table = self.symbol_table
         self.function_has_return = False
+        self.modules = set()  # modules whose exports were declared, see Linker.declare_imports
+        self.jobs = jobs
+
+    def push_scope(self):
+        self.symbol_table = Scope(self.symbol_table)
+
+    def pop_scope(self):
+        self.symbol_table = self.symbol_table.parent
 
     def error(self, msg):
         prefix = ""
@@ -125,8 +193,7 @@ class SemanticChecker:
             result_types = []
             param_name = value.lambda_node.param
 
-            old_entry = self.symbol_table.get(param_name)
-            
+            self.push_scope()
             for t in source_types:
                 self.symbol_table[param_name] = {
                     'kind': 'param', 
@@ -134,14 +201,11 @@ class SemanticChecker:
                     'initialized': True
                 }
 
+                self._forget_lambda_types(value.lambda_node)
                 res_t = self._get_type(value.lambda_node.body)
                 result_types.append(res_t)
-
-            if old_entry: 
-                self.symbol_table[param_name] = old_entry
-            else: 
-                if param_name in self.symbol_table: 
-                    del self.symbol_table[param_name]
+            self._forget_lambda_types(value.lambda_node)
+            self.pop_scope()
                 
             return result_types
             
@@ -178,7 +242,20 @@ class SemanticChecker:
                 return left // right
         return None
 
+    def _forget_lambda_types(self, lambda_node):
+        # A map lambda body is typed once per element type, so its types must not outlive one pass.
+        if isinstance(lambda_node.body, ASTNode):
+            lambda_node.body.forget_types()
+
     def _get_type(self, expr):
+        """Type of `expr`, inferred once per node and recorded on it as `inferred_type`."""
+        if isinstance(expr, ASTNode) and not isinstance(expr, VariableDeclarationNode):
+            if expr.inferred_type is None:
+                expr.inferred_type = self._infer_type(expr)
+            return expr.inferred_type
+        return self._infer_type(expr)
+
+    def _infer_type(self, expr):
         if isinstance(expr, ASTNode):
             if isinstance(expr, BinaryOperation):
                 left_type = self._get_type(expr.left)
@@ -398,7 +475,7 @@ class SemanticChecker:
 
         # -------- FUNCTION DEF --------
         if isinstance(node, FunctionNode):
-            prev_vars = copy.deepcopy(self.symbol_table)
+            self.push_scope()
             self.current_function = node
             
             self.function_has_return = False
@@ -435,10 +512,16 @@ class SemanticChecker:
             if not self.function_has_return and self.current_function.return_type != "null":
                 self.error(f"Function '{self.current_function.name}' should return '{self.current_function.return_type}', but implicitly returned 'null'")
 
-            self.symbol_table = prev_vars
+            self.pop_scope()
             self.current_function = None
             return
 
+        # -------- IMPORT --------
+        if isinstance(node, ImportNode):
+            if node.name not in self.modules:
+                self.error(f"Cannot import module '{node.name}': it was not loaded")
+            return
+
         # -------- VARIABLE DECL --------
         if isinstance(node, VariableDeclarationNode):
             
@@ -496,6 +579,7 @@ class SemanticChecker:
                     "size": size,
                     "element_types": element_types
                 }
+                node.element_types = list(element_types)
             else:
                 value_to_store = None
                 if isinstance(node.value, (int, str, bool)):
@@ -553,14 +637,17 @@ class SemanticChecker:
                 if isinstance(varname, VectorNode):
                     self.error("Cannot assign to element of a vector literal.")
                     return
-                varinfo = self.symbol_table.get(varname)
+                varinfo = self.symbol_table.lookup_for_update(varname)
             else:
                 varname = varname_or_node 
-                varinfo = self.symbol_table.get(varname)
+                varinfo = self.symbol_table.lookup_for_update(varname)
 
             if not varinfo:
                 self.error(f"Assign to undeclared variable '{varname}'")
                 return
+            if varinfo['kind'] == 'loopvar' and not is_vec_access:
+                self.error(f"Cannot assign to loop variable '{varname}'")
+                return
             
             exprtype = self._get_type(node.value)
             vtype = varinfo['var_type']
@@ -581,6 +668,15 @@ class SemanticChecker:
             
             return
 
+        # -------- REF (ref var) --------
+        if isinstance(node, RefNode):
+            varinfo = self.symbol_table.get(node.var_name) if isinstance(node.var_name, str) else None
+            if varinfo and varinfo['kind'] == 'loopvar':
+                self.error(f"Cannot take a reference to loop variable '{node.var_name}'")
+                return
+            self.visit(node.var_name)
+            return
+
         # -------- REF ASSIGNMENT (var := value) --------
         if isinstance(node, RefAssignmentNode):
             self.visit(node.value)
@@ -656,6 +752,7 @@ class SemanticChecker:
         if isinstance(node, MethodCallNode):
             self.visit(node.object_expr)
             obj_type = self._get_type(node.object_expr)
+            node.receiver_type = obj_type
             if obj_type not in self.class_table:
                 self.error(f"Cannot call method '{node.method_name}' on non-class type '{obj_type}'")
                 return
@@ -730,10 +827,27 @@ class SemanticChecker:
             if start_type != 'int': self.error("For loop start expression must be integer")
             if end_type != 'int': self.error("For loop end expression must be integer")
             
-            prev = copy.deepcopy(self.symbol_table)
+            self.push_scope()
             self.symbol_table[node.var] = {"kind": "loopvar", "var_type": "int", "initialized": True}
             self.visit(node.stmt)
-            self.symbol_table = prev
+            self.pop_scope()
+            return
+
+        if isinstance(node, ForEachNode):
+            self.visit(node.vector)
+            if self._get_type(node.vector) != 'vector':
+                self.error("For loop over a value that is not a vector")
+
+            element_types = set(self._get_element_types(node.vector))
+            if isinstance(node.vector, str) and node.vector in self.symbol_table:
+                element_types = set(self.symbol_table[node.vector].get('element_types') or ())
+            # like an indexed read, an element whose type is not known statically is an int
+            node.var_type = element_types.pop() if len(element_types) == 1 and 'unknown' not in element_types else 'int'
+
+            self.push_scope()
+            self.symbol_table[node.var] = {"kind": "loopvar", "var_type": node.var_type, "initialized": True}
+            self.visit(node.stmt)
+            self.pop_scope()
             return
 
         # -------- VECTOR --------
@@ -797,10 +911,10 @@ class SemanticChecker:
             return
 
         if isinstance(node, LambdaNode):
-            prev = copy.deepcopy(self.symbol_table)
+            self.push_scope()
             self.symbol_table[node.param] = {"kind": "param", "var_type": "int", "initialized": True}
             self.visit(node.body)
-            self.symbol_table = prev
+            self.pop_scope()
             return
 
         if isinstance(node, MapNode):
@@ -831,29 +945,25 @@ class SemanticChecker:
             lambda_node = node.lambda_node
             param_name = lambda_node.param
             
-            original_symbol_table = copy.deepcopy(self.symbol_table)
+            self.push_scope()
             
             for input_type in unique_input_types:
                 self.symbol_table[param_name] = {
                     "kind": "param", "var_type": input_type, "initialized": True
                 }
                 
+                self._forget_lambda_types(lambda_node)
                 self.visit(lambda_node.body)
+            self._forget_lambda_types(lambda_node)
 
-            self.symbol_table = original_symbol_table
+            self.pop_scope()
 
             return
 
         # -------- DEFAULT: traverse children if any --------
-        if not isinstance(node, (int, str)):
-            for field in getattr(node, '__dict__', {}):
-                child = getattr(node, field)
-                if isinstance(child, ASTNode):
-                    self.visit(child)
-                elif isinstance(child, list):
-                    for elem in child:
-                        if isinstance(elem, ASTNode):
-                            self.visit(elem)
+        if isinstance(node, ASTNode):
+            for child in node.child_nodes():
+                self.visit(child)
 
     def check(self, ast):
         if isinstance(ast, ProgramNode):
@@ -865,9 +975,127 @@ class SemanticChecker:
                 if isinstance(child, FunctionNode):
                     self.register_function(child)
             
-            for child in ast.children:
-                self.visit(child)
+            if self.jobs > 1:
+                self._check_parallel(ast.children)
+            else:
+                for child in ast.children:
+                    self.visit(child)
         elif ast:
              self.visit(ast)
              
-        return self.errors
\ No newline at end of file
+        return self.errors
+
+    # -------------- PARALLEL CHECKING ------------------
+    def _snapshot(self):
+        """The global tables as a function body sees them now, frozen as bytes."""
+        symbols = {name: dict(entry, node=None) if 'node' in entry else entry
+                   for name, entry in self.global_symbol_table.symbols.items()}
+        classes = {name: dict(info, methods={m: dict(i, node=None) for m, i in info['methods'].items()})
+                   for name, info in self.class_table.items()}
+        return pickle.dumps((symbols, classes, self.modules))
+
+    def _check_parallel(self, children):
+        """
+        Visits `children` like `check` does, but hands every function and method
+        body to a worker process. Top-level statements are still checked here, in
+        order, and a body is checked against a snapshot of the globals declared
+        before it, so it sees exactly what it would have seen in sequence. Errors
+        are merged back in source order and the types the workers inferred are
+        copied onto this AST.
+
+        Workers are forked so they inherit the AST instead of having it pickled,
+        which costs more than checking it. Where processes cannot be forked the
+        bodies are checked here in sequence.
+        """
+        global _work
+        snapshots, units, pieces = [], [], []
+        snapshot = None
+        for child in children:
+            if isinstance(child, (FunctionNode, ClassNode)):
+                if snapshot is None:
+                    snapshot = len(snapshots)
+                    snapshots.append(self._snapshot())
+                if isinstance(child, ClassNode):
+                    class_name = child.name
+                    funcs = [info['node'] for info in self.class_table[child.name]['methods'].values()]
+                else:
+                    class_name, funcs = None, [child]
+                for func in funcs:
+                    pieces.append(len(units))
+                    units.append((snapshot, class_name, func))
+            else:
+                mark = len(self.errors)
+                self.visit(child)
+                pieces.append(self.errors[mark:])
+                del self.errors[mark:]
+                snapshot = None
+
+        size = max(1, -(-len(units) // (self.jobs * 4)))
+        batches = [(start, min(start + size, len(units))) for start in range(0, len(units), size)]
+        _work = (snapshots, units)
+        try:
+            if len(batches) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                with ProcessPoolExecutor(min(self.jobs, len(batches)), multiprocessing.get_context('fork')) as pool:
+                    results = [result for batch in pool.map(_check_units, batches) for result in batch]
+            else:
+                results = _check_units((0, len(units)))
+        finally:
+            _work = None
+
+        for (_, _, func), (_, types, extras) in zip(units, results):
+            nodes = _subtree(func)
+            for node, inferred_type in zip(nodes, types):
+                node.inferred_type = inferred_type
+            for index, attr, value in extras:
+                setattr(nodes[index], attr, value)
+        for piece in pieces:
+            self.errors.extend(results[piece][0] if isinstance(piece, int) else piece)
+
+
+_extra_annotations = {}  # node class -> the annotations besides inferred_type it has slots for
+_work = None  # (snapshots, units) of the running _check_parallel, inherited by forked workers
+
+
+def _subtree(node):
+    """Every node of `node`'s subtree, in the same order in every process."""
+    nodes = [node]
+    for node in nodes:
+        for field in node._fields:
+            child = getattr(node, field)
+            if isinstance(child, ASTNode):
+                nodes.append(child)
+            elif isinstance(child, list):
+                nodes.extend(elem for elem in child if isinstance(elem, ASTNode))
+    return nodes
+
+
+def _check_units(batch):
+    """
+    Checks units[start:stop] of `_work`; returns (errors, inferred types, other
+    annotations as (node index, attribute, value)) for each.
+    """
+    snapshots, units = _work
+    start, stop = batch
+    tables = {}
+    results = []
+    for snapshot, class_name, func in units[start:stop]:
+        if snapshot not in tables:
+            tables[snapshot] = pickle.loads(snapshots[snapshot])
+        checker = SemanticChecker()
+        symbols, checker.class_table, checker.modules = tables[snapshot]
+        checker.global_symbol_table.symbols = symbols
+        if class_name is not None:
+            checker.current_class = ClassNode(class_name, [], [])
+        checker.visit(func)
+        nodes = _subtree(func)
+        extras = []
+        for index, node in enumerate(nodes):
+            attrs = _extra_annotations.get(type(node))
+            if attrs is None:
+                attrs = _extra_annotations[type(node)] = [a for a in _ANNOTATIONS[1:] if hasattr(type(node), a)]
+            for attr in attrs:
+                value = getattr(node, attr, None)
+                if value is not None:
+                    extras.append((index, attr, value))
+        results.append((checker.errors, [node.inferred_type for node in nodes], extras))
+    return results
@@ -9,7 +9,7 @@ reserved = {
    'func': 'FUNC',
    'return' : 'RETURN',
    'let' : 'LET',
-#    'for' : 'FOR',
+   'for' : 'FOR',
    'if' : 'IF',
    'else' : 'ELSE',
    'then' : 'THEN',
@@ -18,7 +18,8 @@ reserved = {
    'print' : 'PRINT',
    'list' : 'LIST',
    'exit' : 'EXIT',
-#    'to' : 'TO',
+   'to' : 'TO',
+   'in' : 'IN',
    'while' : 'WHILE',
    'do' : 'DO',
    'ref'   : 'REF',
@@ -26,6 +27,7 @@ reserved = {
    'new'   : 'NEW',
    'lambda': 'LAMBDA',
    'map'   : 'MAP',
+   'import': 'IMPORT',
 }
 
 tokens = [
@@ -197,4 +199,5 @@ def findtoken():
         print(f"| {tok.lineno:^10} | {find_column(data, tok):^10} | {tok.type:^15} |   {tok.value}")
 
 
-findtoken()
\ No newline at end of file
+if __name__ == "__main__":
+    findtoken()
\ No newline at end of file
@@ -0,0 +1,154 @@
+from AST import *
+
+_PURE_NODES = (BinaryOperation, SingleOperation, TernaryOperation, VectorNode, ListNode, LengthNode)
+_DIVISIONS = ('/', '%')
+
+
+def _nonzero_constant(expr):
+    if isinstance(expr, SingleOperation) and expr.op == '-':
+        expr = expr.right
+    return type(expr) is int and expr != 0
+
+
+def _is_pure(expr):
+    """Can evaluating `expr` be skipped without changing what the program does?"""
+    if expr is None or isinstance(expr, (int, str)):
+        return True
+    if isinstance(expr, list):
+        return all(_is_pure(e) for e in expr)
+    if isinstance(expr, BinaryOperation) and expr.op in _DIVISIONS and not _nonzero_constant(expr.right):
+        return False  # may fault with division by zero
+    if isinstance(expr, _PURE_NODES):
+        return all(_is_pure(getattr(expr, field)) for field in expr._fields)
+    return False
+
+
+class TreeShaker:
+    """
+    Whole-program dead code elimination, run on a checked AST before code generation.
+
+    Starting from `main` and the top-level statements, it follows function calls,
+    method calls (through the receiver type the checker recorded, or every class
+    with that method name when there is none, as in map lambdas), `new` (which
+    calls `init`) and names of globals and fields. Functions, methods and classes
+    nothing reaches are dropped, and so are globals whose initializer has no side
+    effects and fields no kept method uses; field offsets are compacted. Lambdas
+    are generated inside the function that maps them, so they go with it.
+    `removed` counts what was dropped.
+    """
+    def __init__(self):
+        self.removed = {"functions": 0, "methods": 0, "classes": 0, "globals": 0, "fields": 0}
+
+    def shake(self, ast, class_table):
+        if not isinstance(ast, ProgramNode):
+            return ast
+        self.class_table = class_table
+        self.functions = {c.name: c for c in ast.children if isinstance(c, FunctionNode)}
+        self.globals = {c.name: c for c in ast.children
+                        if isinstance(c, VariableDeclarationNode) and _is_pure(c.value)}
+        self.global_nodes = set(self.globals.values())
+        self.reached = set()
+        self.pending = []
+
+        for child in ast.children:
+            if isinstance(child, (FunctionNode, ClassNode)) or child in self.global_nodes:
+                continue
+            self._scan(child, None)
+        self._reach(("function", "main"))
+        while self.pending:
+            kind, *key = self.pending.pop()
+            if kind == "function":
+                self._scan(self.functions[key[0]].body, None)
+            elif kind == "global":
+                self._scan(self.globals[key[0]].value, None)
+            elif kind == "method":
+                self._scan(class_table[key[0]]["methods"][key[1]]["node"], key[0])
+
+        ast.children = [child for child in ast.children if self._keep(child)]
+        return ast
+
+    def _reach(self, item):
+        if item in self.reached:
+            return
+        kind, name = item[0], item[1]
+        if kind == "function" and name not in self.functions:
+            return
+        if kind == "global" and name not in self.globals:
+            return
+        self.reached.add(item)
+        self.pending.append(item)
+
+    def _reach_method(self, class_name, method_name):
+        if class_name in self.class_table:
+            classes = [class_name]
+        else:
+            classes = [name for name, info in self.class_table.items() if method_name in info["methods"]]
+        for name in classes:
+            if method_name in self.class_table[name]["methods"]:
+                self._reach(("method", name, method_name))
+
+    def _scan(self, node, class_name):
+        """Marks everything `node` refers to; `class_name` is the class whose method it is in."""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                self._reach(("function", node))
+                self._reach(("global", node))
+                if class_name is not None and node in self.class_table[class_name]["fields"]:
+                    self.reached.add(("field", class_name, node))
+                continue
+            if isinstance(node, list):
+                stack.extend(node)
+                continue
+            if not isinstance(node, ASTNode):
+                continue
+
+            if isinstance(node, MethodCallNode):
+                self._reach_method(node.receiver_type, node.method_name)
+            elif isinstance(node, NewNode):
+                self.reached.add(("class", node.class_name))
+                if node.class_name in self.class_table:
+                    self._reach_method(node.class_name, "init")
+            elif isinstance(node, FieldAccessNode):
+                owners = [class_name] if node.object_expr == "this" and class_name else list(self.class_table)
+                for owner in owners:
+                    if node.field_name in self.class_table[owner]["fields"]:
+                        self.reached.add(("field", owner, node.field_name))
+            stack.extend(getattr(node, field) for field in node._fields)
+
+    def _keep(self, child):
+        if isinstance(child, FunctionNode):
+            if ("function", child.name) in self.reached:
+                return True
+            self.removed["functions"] += 1
+            return False
+        if isinstance(child, ClassNode):
+            return self._shake_class(child)
+        if child in self.global_nodes and ("global", child.name) not in self.reached:
+            self.removed["globals"] += 1
+            return False
+        return True
+
+    def _shake_class(self, node):
+        info = self.class_table.get(node.name)
+        if info is None:
+            return True
+        kept = [m for m in node.methods if ("method", node.name, m.name) in self.reached]
+        for method in node.methods:
+            if method not in kept:
+                info["methods"][method.name]["node"] = None
+                self.removed["methods"] += 1
+        node.methods = kept
+
+        used = [f for f in node.fields if ("field", node.name, f.name) in self.reached]
+        if not used and node.fields:
+            used = node.fields[:1]  # distinct objects keep distinct addresses
+        self.removed["fields"] += len(node.fields) - len(used)
+        node.fields = used
+        info["fields"] = {f.name: dict(info["fields"][f.name], offset=i) for i, f in enumerate(used)}
+
+        if kept or ("class", node.name) in self.reached:
+            return True
+        self.removed["classes"] += 1
+        return False
@@ -0,0 +1,138 @@
+"""
+Times each compiler phase on synthetic programs of growing size and fits the growth.
+
+    python benchmarks/compile_scaling.py                 # every axis
+    python benchmarks/compile_scaling.py depth concat    # some axes
+
+For every axis of gen_programs.py, programs are generated at each size in AXES
+with the other axes at their defaults. The `lex`, `yacc`, `check` and `generate`
+phases are timed separately (best of `--repeat`). For each phase, the exponent k
+of time ~ size^k is fitted by least squares on a log-log scale, leaving out the
+smallest size, whose times are mostly fixed per-run costs. A phase whose
+exponent is above `--max-exponent` is flagged as superlinear, and the exit status
+is then 1.
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import Parser
+from SemanticAnalysis import SemanticChecker
+from CodeGenerator import CodeGenerator
+from gen_programs import generate
+
+AXES = {
+    "functions": [25, 50, 100, 200],
+    "statements": [10, 20, 40, 80],
+    "depth": [25, 50, 100, 200],
+    "concat": [50, 100, 200, 400],
+    "classes": [25, 50, 100, 200],
+    "vector": [100, 200, 400, 800],
+}
+PHASES = ("lex", "yacc", "check", "generate")
+FIT_FROM = 1  # index of the smallest size used in the fit
+
+
+def time_phases(data):
+    """Runs every phase once on `data`; returns {phase: seconds}."""
+    times = {}
+
+    start = time.perf_counter()
+    Parser.lexer.input(data)
+    Parser.lexer.lineno = 1
+    tokens = list(iter(Parser.lexer.token, None))
+    times["lex"] = time.perf_counter() - start
+
+    line_starts = [0] + [i + 1 for i, c in enumerate(data) if c == "\n"]
+    start = time.perf_counter()
+    ast = Parser.parse_unit(tokens, line_starts)
+    times["yacc"] = time.perf_counter() - start
+    if Parser.error:
+        raise RuntimeError(f"generated program has syntax errors: {Parser.error[:3]}")
+
+    checker = SemanticChecker()
+    start = time.perf_counter()
+    errors = checker.check(ast)
+    times["check"] = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f"generated program has semantic errors: {errors[:3]}")
+
+    generator = CodeGenerator(checker.class_table, checker.global_symbol_table)
+    start = time.perf_counter()
+    generator.generate(ast)
+    times["generate"] = time.perf_counter() - start
+    return times
+
+
+def fit_exponent(sizes, seconds):
+    """Least-squares slope of log(seconds) against log(size)."""
+    xs = [math.log(s) for s in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+
+
+def measure_axis(axis, sizes, repeat):
+    """Returns {phase: [best seconds per size]}."""
+    results = {phase: [] for phase in PHASES}
+    for size in sizes:
+        data = generate(**{axis: size})
+        best = None
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                times = time_phases(data)
+            best = times if best is None else {p: min(best[p], times[p]) for p in PHASES}
+        for phase in PHASES:
+            results[phase].append(best[phase])
+    return results
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("axes", nargs="*", metavar="axis",
+                            help=f"axes to measure: {', '.join(AXES)} (default: all)")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--max-exponent", type=float, default=1.3,
+                            help="flag phases growing faster than size^k")
+    args = arg_parser.parse_args(argv)
+    unknown = [axis for axis in args.axes if axis not in AXES]
+    if unknown:
+        arg_parser.error(f"unknown axes: {', '.join(unknown)} (choose from {', '.join(AXES)})")
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    flagged = []
+    for axis in args.axes or list(AXES):
+        sizes = AXES[axis]
+        results = measure_axis(axis, sizes, args.repeat)
+        print(f"\n{axis}")
+        print(f"{'size':>8} " + " ".join(f"{phase:>10}" for phase in PHASES))
+        for i, size in enumerate(sizes):
+            print(f"{size:>8} " + " ".join(f"{results[phase][i]:>10.4f}" for phase in PHASES))
+        exponents = {phase: fit_exponent(sizes[FIT_FROM:], results[phase][FIT_FROM:]) for phase in PHASES}
+        print(f"{'k':>8} " + " ".join(f"{exponents[phase]:>10.2f}" for phase in PHASES))
+        for phase in PHASES:
+            if exponents[phase] > args.max_exponent:
+                flagged.append(f"{axis}/{phase}: time ~ size^{exponents[phase]:.2f}")
+
+    print()
+    if flagged:
+        print("Superlinear phases:")
+        for line in flagged:
+            print(f"  {line}")
+        return 1
+    print(f"All phases scale at most as size^{args.max_exponent}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
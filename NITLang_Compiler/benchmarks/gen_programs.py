@@ -0,0 +1,92 @@
+"""
+Generates synthetic NITLang programs that grow along one axis at a time.
+
+    python benchmarks/gen_programs.py --functions 200 --depth 30 > big.txt
+
+Axes: number of functions, statements per function, expression nesting depth,
+length of a string concatenation chain, number of classes and size of a vector
+literal. Every generated program passes semantic analysis, so all compiler
+phases run to completion on it.
+"""
+import argparse
+
+DEFAULTS = {
+    "functions": 20,
+    "statements": 10,
+    "depth": 4,
+    "concat": 4,
+    "classes": 2,
+    "vector": 8,
+}
+
+
+def nested_expr(depth):
+    """((((a + 1) * 2) + 3) * 4) ... with `depth` levels of parentheses."""
+    expr = "a"
+    for i in range(1, depth + 1):
+        expr = f"({expr} {'+' if i % 2 else '*'} {i % 7 + 1})"
+    return expr
+
+
+def concat_chain(length):
+    parts = ['"s"']
+    for i in range(1, length):
+        parts.append("a" if i % 2 else f'"{i}"')
+    return " + ".join(parts)
+
+
+def class_decl(k):
+    return (
+        f"class C{k} {{\n"
+        f"    let v: int;\n"
+        f"    func init(x: int) <null> {{\n"
+        f"        this.v = x;\n"
+        f"    }}\n"
+        f"    func get() <int> {{\n"
+        f"        return this.v + {k};\n"
+        f"    }}\n"
+        f"}}"
+    )
+
+
+def function_decl(k, statements, depth, concat, vector):
+    body = [
+        f"    let v: vector = [{', '.join(str(i % 100) for i in range(vector))}];",
+        f"    let s: string = {concat_chain(concat)};",
+    ]
+    for j in range(statements):
+        if j % 3 == 2:
+            body.append(f"    if x{j - 1} > {j} then {{ x{j - 1} = x{j - 1} - 1; }}")
+            body.append(f"    let x{j}: int = x{j - 1} + length(v);")
+        else:
+            body.append(f"    let x{j}: int = {nested_expr(depth)};")
+    body.append(f"    return a + {k};")
+    return f"func f{k}(a: int) <int> {{\n" + "\n".join(body) + "\n}"
+
+
+def generate(functions=DEFAULTS["functions"], statements=DEFAULTS["statements"], depth=DEFAULTS["depth"],
+             concat=DEFAULTS["concat"], classes=DEFAULTS["classes"], vector=DEFAULTS["vector"]):
+    """Returns the source of a program sized by the given axes."""
+    decls = [class_decl(k) for k in range(classes)]
+    decls += [function_decl(k, statements, depth, concat, vector) for k in range(functions)]
+    main = ["func main() <int> {", "    let total: int = 0;"]
+    for k in range(classes):
+        main.append(f"    let c{k} = new C{k}({k});")
+        main.append(f"    total = total + c{k}.get();")
+    if functions:
+        main.append("    total = total + f0(1);")
+    main += ['    print("total = " + total);', "    return 0;", "}"]
+    decls.append("\n".join(main))
+    return "\n\n".join(decls) + "\n"
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    for axis, default in DEFAULTS.items():
+        arg_parser.add_argument(f"--{axis}", type=int, default=default)
+    args = arg_parser.parse_args(argv)
+    print(generate(**vars(args)), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares the PLY lexer from Tokenizer.py with FastLexer on a large input.
+
+    python benchmarks/lexer_bench.py [source] --copies 200 --repeat 3
+
+The source (test.txt by default) is repeated `--copies` times. Both lexers must
+produce the same (type, value, lineno, lexpos) stream before any timing is
+reported.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ply.lex as lex
+import Tokenizer
+from FastLexer import FastLexer
+
+
+def tokenize(lexer, data):
+    lexer.input(data)
+    return [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in iter(lexer.token, None)]
+
+
+def best_time(lexer, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokenize(lexer, data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("source", nargs="?", default=os.path.join(here, "..", "test.txt"))
+    arg_parser.add_argument("--copies", type=int, default=200)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    with open(args.source, "r") as f:
+        data = "\n".join([f.read()] * args.copies)
+
+    ply_lexer = lex.lex(module=Tokenizer)
+    fast_lexer = FastLexer()
+
+    expected = tokenize(ply_lexer, data)
+    if tokenize(fast_lexer, data) != expected:
+        print("FastLexer token stream differs from the PLY lexer")
+        return 1
+
+    ply_time = best_time(ply_lexer, data, args.repeat)
+    fast_time = best_time(fast_lexer, data, args.repeat)
+
+    print(f"input: {len(data)} chars, {len(expected)} tokens")
+    print(f"{'lexer':<10} {'seconds':>10} {'tokens/s':>12}")
+    print(f"{'ply':<10} {ply_time:>10.4f} {len(expected) / ply_time:>12.0f}")
+    print(f"{'fast':<10} {fast_time:>10.4f} {len(expected) / fast_time:>12.0f}")
+    print(f"speedup: {ply_time / fast_time:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Runs the NITLang programs in benchmarks/programs on TSVM and compares them with a baseline.
+
+    python benchmarks/run_bench.py                    # compare with baseline.json
+    python benchmarks/run_bench.py --update-baseline  # record a new baseline
+    python benchmarks/run_bench.py fib sieve          # only some programs
+    python benchmarks/run_bench.py --closures         # run on ClosureInterpreter instead
+
+Each program is compiled once and run `--repeat` times in-process. The report has
+the best wall time, the number of TSVM instructions executed (deterministic, so
+any increase is a real regression) and a digest of the program output. A program
+is flagged when its output changes, when it executes more instructions than the
+baseline, or when it is more than `--time-tolerance` (plus 10ms of noise) slower.
+The exit status is 1 if anything was flagged.
+
+With `--closures` the programs run on ClosureInterpreter. Only their output is
+compared with the baseline, which keeps the two backends in agreement; there
+are no instruction counts, and times are reported but not judged.
+"""
+import argparse
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import Parser
+from ClosureInterpreter import load_source
+from tsvm import TSVM
+
+PROGRAMS_DIR = os.path.join(HERE, "programs")
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+TIME_NOISE = 0.01  # seconds; smaller slowdowns are never flagged
+
+
+def compile_program(path):
+    with open(path, "r") as f:
+        data = f.read()
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, semantic_errors, code = Parser.compile_source(data)
+    if code is None:
+        raise RuntimeError(f"{path} does not compile: {(syntax_errors + semantic_errors)[:3]}")
+    return code
+
+
+def run_program(code):
+    """Runs compiled code once; returns (seconds, instructions, output)."""
+    vm = TSVM()
+    vm.load_lines(code.splitlines())
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        vm.run()
+    return time.perf_counter() - start, vm.steps, out.getvalue()
+
+
+def run_closures(program):
+    """Runs a compiled ClosureInterpreter once; returns (seconds, None, output)."""
+    start = time.perf_counter()
+    result = program.run_captured()
+    return time.perf_counter() - start, None, result.output
+
+
+def measure(name, repeat, closures=False):
+    path = os.path.join(PROGRAMS_DIR, name + ".txt")
+    if closures:
+        with open(path, "r") as f:
+            syntax_errors, semantic_errors, program = load_source(f.read())
+        if program is None:
+            raise RuntimeError(f"{path} does not compile: {(syntax_errors + semantic_errors)[:3]}")
+        run = functools.partial(run_closures, program)
+    else:
+        run = functools.partial(run_program, compile_program(path))
+    best = None
+    for _ in range(repeat):
+        seconds, steps, output = run()
+        best = seconds if best is None else min(best, seconds)
+    return {
+        "seconds": round(best, 4),
+        "instructions": steps,
+        "output": hashlib.sha256(output.encode()).hexdigest()[:16],
+    }
+
+
+def compare(result, base, time_tolerance):
+    """Returns the list of regressions of `result` against baseline entry `base`."""
+    if base is None:
+        return []
+    flags = []
+    if result["output"] != base["output"]:
+        flags.append("output changed")
+    if result["instructions"] is None:
+        return flags  # another backend: only the output is comparable
+    if result["instructions"] > base["instructions"]:
+        flags.append(f"+{result['instructions'] - base['instructions']} instructions")
+    if result["seconds"] > base["seconds"] * (1 + time_tolerance) + TIME_NOISE:
+        flags.append(f"{result['seconds'] / base['seconds']:.2f}x slower")
+    return flags
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("programs", nargs="*", help="program names (default: all)")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--baseline", default=BASELINE_PATH)
+    arg_parser.add_argument("--update-baseline", action="store_true")
+    arg_parser.add_argument("--time-tolerance", type=float, default=0.25,
+                            help="flag programs this much slower than the baseline (0.25 = 25%%)")
+    arg_parser.add_argument("--closures", action="store_true",
+                            help="run on ClosureInterpreter and only compare output with the baseline")
+    args = arg_parser.parse_args(argv)
+    if args.closures and args.update_baseline:
+        arg_parser.error("the baseline is recorded on TSVM; --closures cannot update it")
+
+    names = args.programs or sorted(f[:-4] for f in os.listdir(PROGRAMS_DIR) if f.endswith(".txt"))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = 0
+    print(f"{'program':<12} {'seconds':>9} {'base':>9} {'instructions':>13} {'base':>13}  flags")
+    for name in names:
+        result = measure(name, args.repeat, args.closures)
+        results[name] = result
+        base = baseline.get(name)
+        flags = compare(result, base, args.time_tolerance)
+        regressions += bool(flags)
+        print(f"{name:<12} {result['seconds']:>9.4f} {base['seconds'] if base else '-':>9} "
+              f"{result['instructions'] or '-':>13} {base['instructions'] if base else '-':>13}  "
+              f"{', '.join(flags) if flags else ('new' if base is None else 'ok')}")
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
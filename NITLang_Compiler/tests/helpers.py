@@ -0,0 +1,33 @@
+"""Compiling and running NITLang programs from tests."""
+import contextlib
+import io
+import os
+
+import Parser
+from tsvm import TSVM, TSVMRuntimeError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def compile_program(data, **kwargs):
+    """TSVM code for `data` from Parser.compile_source; fails the test on compile errors."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, semantic_errors, code = Parser.compile_source(data, **kwargs)
+    assert code is not None, syntax_errors + semantic_errors
+    return code
+
+
+def outcome(run, stdin=""):
+    """(exit code, output) of `run(stdin)`, or ('error', message, output) when it raises a runtime error."""
+    try:
+        result = run(stdin)
+    except TSVMRuntimeError as e:
+        return "error", str(e), e.output
+    return result.exit_code, result.output
+
+
+def run_code(code, stdin="", vm=None):
+    """Outcome of running TSVM `code`, on `vm` or a fresh TSVM."""
+    vm = vm or TSVM()
+    vm.load_lines(code.splitlines())
+    return outcome(vm.run_captured, stdin)
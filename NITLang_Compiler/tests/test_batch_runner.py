@@ -0,0 +1,20 @@
+from BatchRunner import run_batch
+
+
+def _job(tmp_path, name, lines, expected):
+    path = tmp_path / (name + ".tsvm")
+    path.write_text("\n".join(lines) + "\n")
+    return {"name": name, "program": str(path), "stdin": "", "expected": expected}
+
+
+def test_one_crashing_program_does_not_sink_the_batch(tmp_path):
+    jobs = [
+        _job(tmp_path, "good", ["proc main", "    mov r1, 7", "    call iput, r1", "    ret"], "7"),
+        _job(tmp_path, "crash", ["proc main", "    br"], None),
+        _job(tmp_path, "undefined", ["proc main", "    call nowhere", "    ret"], None),
+        _job(tmp_path, "again", ["proc main", "    mov r1, 8", "    call iput, r1", "    ret"], "8"),
+    ]
+    results = run_batch(jobs, processes=2)
+    assert [r["status"] for r in results] == ["pass", "error", "error", "pass"]
+    assert "Wrong number of operands for 'br'" in results[1]["error"]
+    assert "Undefined label 'nowhere'" in results[2]["error"]
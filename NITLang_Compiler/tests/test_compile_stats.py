@@ -0,0 +1,25 @@
+from CompileStats import CompileStats
+
+CODE = """
+proc f
+    mov r1, 1
+    add r2, r1, r1
+    mov r0, r2
+    ret
+proc main
+    mov r5, 2
+    br L2_end_int
+proc L1_lambda_int
+    mov r6, 1
+    ret
+L2_end_int:
+    add r7, r5, r5
+    ret
+"""
+
+
+def test_registers_per_proc_counts_distinct_registers_with_lambdas_apart():
+    stats = CompileStats()
+    stats.record_code(CODE)
+    assert stats.registers == {"f": 3, "main": 2, "L1_lambda_int": 1}
+    assert stats.code["labels"] == 1 and stats.code["instructions"] == 10
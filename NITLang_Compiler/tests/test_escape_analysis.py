@@ -0,0 +1,30 @@
+from EscapeAnalysis import MAX_FRAME_VECTOR
+from helpers import compile_program, run_code
+
+LARGE_LIST = """
+func main() <null> {
+    let v = list(20000);
+    v[19999] = 7;
+    print(v[19999]);
+}
+"""
+
+SMALL_LIST = """
+func main() <null> {
+    let v = list(%d);
+    v[0] = 7;
+    print(v[0]);
+}
+""" % MAX_FRAME_VECTOR
+
+
+def test_large_list_stays_on_heap():
+    code = compile_program(LARGE_LIST, stack_alloc=True)
+    assert code == compile_program(LARGE_LIST)
+    assert run_code(code) == (0, "7\n")
+
+
+def test_small_list_goes_in_frame():
+    code = compile_program(SMALL_LIST, stack_alloc=True)
+    assert "call mclr" in code
+    assert run_code(code) == run_code(compile_program(SMALL_LIST)) == (0, "7\n")
@@ -0,0 +1,133 @@
+import contextlib
+import functools
+import io
+import json
+
+import pytest
+
+import Linker
+import Parser
+from Linker import LinkError, ModuleLoader, link, link_order
+from helpers import compile_program, run_code
+
+UTIL = """
+let base = 10;
+func L1go(n: int) <int> {
+    if n < 1 then { return base; } else { return n + L1go(n - 1); }
+}
+"""
+
+MAIN = """
+import util;
+func main() <null> {
+    if 1 < 2 then { print(L1go(3)); } else { print(0); }
+    print(base);
+}
+"""
+
+
+def _loader(directory):
+    return ModuleLoader(functools.partial(Parser.compile_object), [str(directory)])
+
+
+def _write(directory, name, source):
+    path = directory / (name + ".txt")
+    path.write_text(source)
+    return str(path)
+
+
+def _compile_object(source, name):
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, semantic_errors, obj = Parser.compile_object(source)
+    assert obj is not None, syntax_errors + semantic_errors
+    obj["module"] = name
+    return obj
+
+
+def test_imported_function_named_like_a_label_links_and_runs(tmp_path):
+    _write(tmp_path, "util", UTIL)
+    code = compile_program(MAIN, loader=_loader(tmp_path))
+    assert "proc L1go" in code
+    assert run_code(code) == (0, "16\n10\n")
+
+
+def test_object_files_are_reused_until_a_module_or_its_imports_change(tmp_path):
+    _write(tmp_path, "base", "let base = 10;\n")
+    _write(tmp_path, "util", "import base;\nfunc twice() <int> { return base * 2; }\n")
+    main = "import util;\nfunc main() <null> { print(twice()); }\n"
+
+    loader = _loader(tmp_path)
+    assert run_code(compile_program(main, loader=loader)) == (0, "20\n")
+    assert (loader.compiled, loader.reused) == (2, 0)
+    assert (tmp_path / "util.nito").exists() and (tmp_path / "base.nito").exists()
+
+    loader = _loader(tmp_path)
+    assert run_code(compile_program(main, loader=loader)) == (0, "20\n")
+    assert (loader.compiled, loader.reused) == (0, 2)
+
+    _write(tmp_path, "base", "let base = 21;\n")
+    loader = _loader(tmp_path)
+    assert run_code(compile_program(main, loader=loader)) == (0, "42\n")
+    assert (loader.compiled, loader.reused) == (2, 0)  # util's key covers the key of base
+
+
+def test_import_cycle_is_reported(tmp_path):
+    _write(tmp_path, "a", "import b;\nfunc fa() <int> { return 1; }\n")
+    _write(tmp_path, "b", "import a;\nfunc fb() <int> { return 2; }\n")
+    loader = _loader(tmp_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, semantic_errors, code = Parser.compile_source(
+            "import a;\nfunc main() <null> { print(fa()); }\n", loader=loader)
+    assert code is None
+    assert "Error: import cycle through module 'a'" in loader.errors
+
+
+def test_link_rejects_duplicate_symbols():
+    first = _compile_object("func f() <int> { return 1; }\n", "first")
+    second = _compile_object("func f() <int> { return 2; }\n", "second")
+    with pytest.raises(LinkError, match="duplicate symbol 'f' in modules 'first' and 'second'"):
+        link([first, second])
+
+
+def test_link_rejects_undefined_globals_and_calls(tmp_path):
+    _write(tmp_path, "util", UTIL)
+    loader = _loader(tmp_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        main = Parser.compile_object(MAIN, loader)[2]
+    main["module"] = "main"
+    with pytest.raises(LinkError, match="module 'main' uses undefined global 'base'"):
+        link([main])
+    del main["code"][:]
+    main["code"].extend(["proc main", "call missing", "ret"])
+    with pytest.raises(LinkError, match="undefined reference to 'missing'"):
+        link([main])
+
+
+def test_link_order_rejects_cycles_and_missing_modules():
+    a = dict(_compile_object("func fa() <int> { return 1; }\n", "a"), imports=["b"])
+    b = dict(_compile_object("func fb() <int> { return 2; }\n", "b"), imports=["a"])
+    with pytest.raises(LinkError, match="import cycle through module"):
+        link_order([a, b])
+    with pytest.raises(LinkError, match="module 'a' imports 'b', which is not being linked"):
+        link_order([a])
+
+
+def test_command_line_compiles_modules_and_links_them(tmp_path):
+    util, main = _write(tmp_path, "util", UTIL), _write(tmp_path, "main", MAIN)
+    with contextlib.redirect_stdout(io.StringIO()):
+        Parser.main(["-c", util])
+        Parser.main(["-c", main])
+    out = io.StringIO()
+    output = str(tmp_path / "program.tsvm")
+    with contextlib.redirect_stdout(out):
+        assert Linker.main([str(tmp_path / "main.nito"), str(tmp_path / "util.nito"), "-o", output]) == 0
+    assert out.getvalue() == f"Linked 2 modules into {output}\n"
+    assert run_code((tmp_path / "program.tsvm").read_text()) == (0, "16\n10\n")
+
+    with open(tmp_path / "util.nito") as f:
+        duplicate = dict(json.load(f), module="copy")
+    (tmp_path / "copy.nito").write_text(json.dumps(duplicate))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert Linker.main([str(tmp_path / "util.nito"), str(tmp_path / "copy.nito"), "-o", output]) == 1
+    assert out.getvalue().startswith("Link error: duplicate symbol")
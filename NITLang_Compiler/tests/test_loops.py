@@ -0,0 +1,82 @@
+import contextlib
+import io
+
+import pytest
+
+from ClosureInterpreter import load_source
+from PartialEvaluator import PartialEvaluator
+from helpers import compile_program, outcome, run_code
+
+
+def _closures(program):
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter = load_source(program)[2]
+    return outcome(interpreter.run_captured)
+
+
+RUNS = {
+    "tsvm": lambda program: run_code(compile_program(program)),
+    "partial-eval": lambda program: run_code(compile_program(program, evaluator=PartialEvaluator())),
+    "closures": _closures,
+}
+
+# Each loop runs both in main and in a pure function the partial evaluator folds.
+LOOPS = {
+    "empty range": ("""
+func count(a: int, b: int) <int> {
+    let n = 0;
+    for i = a to b do { n = n + 1; }
+    return n;
+}
+func main() <null> {
+    for i = 5 to 4 do { print(i); }
+    print(count(5, 4));
+    print(count(4, 4));
+}
+""", "0\n1\n"),
+    "bound changed in the body": ("""
+func count(m: int) <int> {
+    let n = m;
+    let total = 0;
+    for i = 1 to n do { n = n + 1; total = total + i; }
+    return total * 100 + n;
+}
+func main() <null> {
+    let n = 3;
+    for i = 1 to n do { n = n + 10; print(i); }
+    print(n);
+    print(count(3));
+}
+""", "1\n2\n3\n33\n606\n"),
+    "empty vector": ("""
+func total(v: vector) <int> {
+    let t = 0;
+    for x in v do { t = t + x; }
+    return t;
+}
+func empty() <int> {
+    let t = 7;
+    for x in list(0) do { t = t + x; }
+    return t;
+}
+func main() <null> {
+    let v = list(0);
+    for x in v do { print(x); }
+    print(total(v));
+    print(empty());
+}
+""", "0\n7\n"),
+}
+
+
+@pytest.mark.parametrize("run", RUNS.values(), ids=RUNS.keys())
+@pytest.mark.parametrize("program, output", LOOPS.values(), ids=LOOPS.keys())
+def test_loop_edge_cases(program, output, run):
+    assert run(program) == (0, output)
+
+
+@pytest.mark.parametrize("program, calls", [(p, n) for (p, _), n in zip(LOOPS.values(), (2, 1, 1))], ids=LOOPS.keys())
+def test_partial_evaluator_folds_the_pure_loops(program, calls):
+    evaluator = PartialEvaluator()
+    compile_program(program, evaluator=evaluator)
+    assert evaluator.folded["calls"] == calls
@@ -0,0 +1,152 @@
+"""
+Golden-output tests: every program must behave the same under each compiler
+mode and backend as it does compiled plainly and run on TSVM.
+"""
+import contextlib
+import glob
+import io
+import os
+
+import pytest
+
+import Parser
+from ClosureInterpreter import load_source
+from CompileCache import CompileCache
+from MemoryLayout import MemoryLayout
+from PartialEvaluator import PartialEvaluator
+from TreeShaker import TreeShaker
+from helpers import ROOT, compile_program, outcome, run_code
+from tsvm import TSVM
+
+PROGRAMS = [os.path.join(ROOT, "test.txt")] + sorted(glob.glob(os.path.join(ROOT, "benchmarks", "programs", "*.txt")))
+
+
+def _read(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _compiled(**kwargs):
+    return lambda path, tmp_path: run_code(compile_program(_read(path), **kwargs))
+
+
+def _streamed(path, tmp_path):
+    output = str(tmp_path / "stream.tsvm")
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, errors, written = Parser.compile_stream(path, output)
+    assert written, syntax_errors + errors
+    return run_code(_read(output))
+
+
+def _cached(path, tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"))
+    code = compile_program(_read(path), cache=cache)
+    assert compile_program(_read(path), cache=CompileCache(str(tmp_path / "cache"))) == code
+    return run_code(code)
+
+
+def _closures(path, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, semantic_errors, interpreter = load_source(_read(path))
+    assert interpreter is not None, syntax_errors + semantic_errors
+    return outcome(interpreter.run_captured)
+
+
+MODES = {
+    "fast-lexer": _compiled(use_fast_lexer=True),
+    "shake": lambda path, tmp_path: run_code(compile_program(_read(path), shaker=TreeShaker())),
+    "partial-eval": lambda path, tmp_path: run_code(compile_program(_read(path), evaluator=PartialEvaluator())),
+    "stack-alloc": _compiled(stack_alloc=True),
+    "all-passes": lambda path, tmp_path: run_code(compile_program(
+        _read(path), shaker=TreeShaker(), evaluator=PartialEvaluator(), stack_alloc=True)),
+    "check-jobs": _compiled(check_jobs=2),
+    "stream": _streamed,
+    "cache": _cached,
+    "closures": _closures,
+}
+
+
+@pytest.fixture(scope="module")
+def expected():
+    return {path: run_code(compile_program(_read(path))) for path in PROGRAMS}
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("path", PROGRAMS, ids=os.path.basename)
+def test_mode_matches_plain_vm(mode, path, expected, tmp_path):
+    assert MODES[mode](path, tmp_path) == expected[path]
+
+
+def test_programs_finish_normally(expected):
+    for path, result in expected.items():
+        assert result[0] == 0, (path, result)
+
+
+LABEL_TEXT = """
+func f() <int> {
+    if 1 < 2 then { return 1; } else { return 2; }
+}
+func g() <int> {
+    print("L1 and L2");
+    if 2 < 1 then { return 3; } else { return 4; }
+}
+func main() <null> {
+    print(f() + g());
+}
+"""
+
+
+def test_cache_hit_leaves_label_text_in_strings_alone(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"))
+    compile_program(LABEL_TEXT, cache=cache)
+    edited = LABEL_TEXT.replace("return 1; }", "if 3 < 4 then { return 1; } else { return 0; } }")
+    code = compile_program(edited, cache=cache)
+    assert code == compile_program(edited)
+    assert run_code(code) == (0, "L1 and L2\n5\n")
+
+
+RUNAWAY_RECURSION = """
+func rec(n: int) <int> {
+    return rec(n + 1);
+}
+func main() <int> {
+    print("start");
+    return rec(0);
+}
+"""
+
+
+@pytest.mark.parametrize("stack", [10000, 10001, 10002, 10003])
+def test_stack_overflow_reads_the_same_in_both_backends(stack):
+    layout = MemoryLayout.parse(f"stack={stack}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, semantic_errors, interpreter = load_source(RUNAWAY_RECURSION, layout=layout)
+    assert interpreter is not None, syntax_errors + semantic_errors
+    code = compile_program(RUNAWAY_RECURSION, layout=layout)
+    expected = ("error", "Runtime Error: Stack overflow", "start\n")
+    assert outcome(interpreter.run_captured) == run_code(code, vm=TSVM(layout)) == expected
+
+
+LABEL_LIKE_NAME = """
+func L1go(n: int) <int> {
+    if n < 1 then { return 0; } else { return n + L1go(n - 1); }
+}
+func other() <int> {
+    if 1 < 2 then { return 1; } else { return 2; }
+}
+func main() <null> {
+    let v = [1, 2];
+    print(L1go(4) + other());
+    print(map(lambda x -> x + 1, v));
+}
+"""
+
+
+def test_cache_hit_leaves_function_names_starting_with_a_label_alone(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"))
+    compile_program(LABEL_LIKE_NAME, cache=cache)
+    edited = LABEL_LIKE_NAME.replace("return 1; }", "if 3 < 4 then { return 1; } else { return 0; } }")
+    code = compile_program(edited, cache=cache)
+    assert cache.hits
+    assert code == compile_program(edited)
+    assert run_code(code) == (0, "11\n[2,3]\n")
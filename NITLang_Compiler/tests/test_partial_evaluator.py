@@ -0,0 +1,91 @@
+from PartialEvaluator import PartialEvaluator
+from helpers import compile_program, run_code
+
+
+def _folded(program, **kwargs):
+    """(TSVM code, evaluator) of `program` compiled with partial evaluation; its run must match the plain one."""
+    evaluator = PartialEvaluator(**kwargs)
+    code = compile_program(program, evaluator=evaluator)
+    assert run_code(code) == run_code(compile_program(program))
+    return code, evaluator
+
+
+LOOKUP_TABLE = """
+func squares(n: int) <vector> {
+    let t = list(n);
+    let i = 0;
+    while i < n do { t[i] = i * i; i = i + 1; }
+    return t;
+}
+func main() <null> {
+    let a = squares(5);
+    let b = squares(5);
+    a[0] = 99;
+    print(a);
+    print(b);
+    print(length(squares(3)));
+}
+"""
+
+
+def test_vector_result_becomes_a_fresh_literal_at_each_call_site():
+    code, evaluator = _folded(LOOKUP_TABLE)
+    assert "call squares" not in code
+    assert evaluator.folded == {"calls": 3, "expressions": 0, "lengths": 1}
+    assert run_code(code) == (0, "[99,1,4,9,16]\n[0,1,4,9,16]\n3\n")
+
+
+def test_vector_results_with_unwritten_or_too_many_elements_stay_calls():
+    code, evaluator = _folded(LOOKUP_TABLE.replace("i < n do", "i < n - 1 do"))
+    assert code.count("call squares") == 3
+    code, evaluator = _folded(LOOKUP_TABLE.replace("squares(3)", "squares(300)"))
+    assert code.count("call squares") == 1 and evaluator.folded["calls"] == 2
+
+
+SPIN = """
+func spin(n: int) <int> {
+    let i = 0;
+    while i < n do { i = i + 1; }
+    return i;
+}
+func main() <null> {
+    print(spin(1000));
+}
+"""
+
+
+def test_call_past_the_step_budget_is_left_alone():
+    code, evaluator = _folded(SPIN, max_steps=500)
+    assert "call spin" in code and evaluator.folded["calls"] == 0
+    code, evaluator = _folded(SPIN)
+    assert "call spin" not in code and evaluator.folded["calls"] == 1
+
+
+def test_call_failing_at_run_time_is_left_alone():
+    program = """
+func pick(i: int) <int> {
+    let v = [1, 2, 3];
+    return v[i] / (i - 1);
+}
+func main() <null> {
+    print(pick(2));
+    print(pick(1));
+}
+"""
+    code, evaluator = _folded(program)
+    assert evaluator.folded["calls"] == 1 and code.count("call pick") == 1
+    assert run_code(code) == ("error", "Runtime Error: Division by zero", "3\n")
+
+
+def test_length_of_a_reassigned_vector_is_not_folded():
+    program = """
+func main() <null> {
+    let v = [1, 2, 3];
+    print(length(v));
+    v = [4];
+    print(length(v));
+}
+"""
+    code, evaluator = _folded(program)
+    assert evaluator.folded["lengths"] == 0
+    assert run_code(code) == (0, "3\n1\n")
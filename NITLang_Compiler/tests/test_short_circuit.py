@@ -0,0 +1,40 @@
+import contextlib
+import io
+
+import pytest
+
+from ClosureInterpreter import load_source
+from helpers import compile_program, outcome, run_code
+
+SIDE_EFFECTS = """
+let calls = 0;
+func hit(v: bool) <bool> {
+    calls = calls + 1;
+    print("hit");
+    return v;
+}
+func main() <null> {
+    let a = false && hit(true);
+    let b = true || hit(false);
+    let c = true && hit(false);
+    let d = false || hit(true);
+    print(a); print(b); print(c); print(d);
+    if false && hit(true) then { print("no"); } else { print("else"); }
+    if true || hit(true) then { print("yes"); }
+    if hit(false) && hit(true) || hit(true) then { print("mixed"); }
+    while calls < 6 && hit(true) do { print("loop"); }
+    print(calls);
+}
+"""
+EXPECTED = (0, "hit\nhit\n0\n1\n0\n1\nelse\nyes\nhit\nhit\nmixed\nhit\nloop\nhit\nloop\n6\n")
+
+
+def _closures(program):
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter = load_source(program)[2]
+    return outcome(interpreter.run_captured)
+
+
+@pytest.mark.parametrize("run", [lambda p: run_code(compile_program(p)), _closures], ids=["tsvm", "closures"])
+def test_right_operand_runs_only_when_it_decides_the_result(run):
+    assert run(SIDE_EFFECTS) == EXPECTED
@@ -0,0 +1,38 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+import Parser
+
+IMPORTING = """
+import math;
+func main() <null> {
+    print(1);
+}
+"""
+
+
+def test_stream_rejects_imports_without_writing_output(tmp_path):
+    source = tmp_path / "importing.txt"
+    source.write_text(IMPORTING)
+    output = str(tmp_path / "importing.tsvm")
+    with contextlib.redirect_stdout(io.StringIO()):
+        syntax_errors, errors, written = Parser.compile_stream(str(source), output)
+    assert syntax_errors == [] and not written
+    assert errors == ["Error Cannot import module 'math': --stream does not support imports"]
+    assert os.listdir(tmp_path) == ["importing.txt"]
+
+
+def test_stream_removes_partial_output_when_writing_fails(tmp_path, monkeypatch):
+    source = tmp_path / "program.txt"
+    source.write_text("func main() <null> {\n    print(1);\n}\n")
+
+    def fail(self, node):
+        raise RecursionError("too deep")
+
+    monkeypatch.setattr(Parser.CodeGenerator, "visit", fail)
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(RecursionError):
+        Parser.compile_stream(str(source), str(tmp_path / "program.tsvm"))
+    assert os.listdir(tmp_path) == ["program.txt"]
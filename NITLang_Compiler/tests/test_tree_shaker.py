@@ -0,0 +1,47 @@
+import pytest
+
+from PartialEvaluator import PartialEvaluator
+from TreeShaker import TreeShaker
+from helpers import compile_program, run_code
+
+MIXED_RECEIVERS = """
+class A {
+    func get() <int> { return 1; }
+}
+class B {
+    func get() <int> { return 2; }
+}
+func main() <null> {
+    let a = new A();
+    let b = new B();
+    let objs = [a, b];
+    print(map(lambda o -> o.get(), objs));
+}
+"""
+
+
+def test_method_called_in_map_lambda_is_kept_for_every_element_class():
+    code = compile_program(MIXED_RECEIVERS, shaker=TreeShaker())
+    assert "proc A_get" in code and "proc B_get" in code
+    assert run_code(code) == run_code(compile_program(MIXED_RECEIVERS)) == (0, "[1,2]\n")
+
+
+@pytest.mark.parametrize("init", ["1 / z", "(1 / z) + 2", "1 / (z + 0)", "2 / (1 / z)"])
+def test_unused_global_that_can_divide_by_zero_is_kept(init):
+    program = f'let z = 0; let g = {init}; func main() <null> {{ print("hi"); }}'
+    assert run_code(compile_program(program, shaker=TreeShaker())) == run_code(compile_program(program))
+    assert run_code(compile_program(program))[:2] == ("error", "Runtime Error: Division by zero")
+
+
+@pytest.mark.parametrize("init", ["z / 2", "z / -3"])
+def test_unused_global_dividing_by_nonzero_constant_is_dropped(init):
+    shaker = TreeShaker()
+    program = f'let z = 0; let g = {init}; func main() <null> {{ print("hi"); }}'
+    assert run_code(compile_program(program, shaker=shaker)) == (0, "hi\n")
+    assert shaker.removed["globals"] == 2
+
+
+def test_length_of_a_vector_holding_a_division_is_not_folded():
+    program = "let z = 0; func main() <null> { print(length([1 / z, 2])); }"
+    folded = run_code(compile_program(program, evaluator=PartialEvaluator()))
+    assert folded == run_code(compile_program(program)) == ("error", "Runtime Error: Division by zero", "")
@@ -0,0 +1,152 @@
+import asyncio
+import contextlib
+import io
+
+import pytest
+
+from ClosureInterpreter import load_source
+from helpers import ROOT, compile_program, outcome, run_code
+from tsvm import TSVM, VMPool, Checkpointer, TSVMError, TSVMLimitExceeded, TSVMRuntimeError
+
+
+@pytest.mark.parametrize("jump", ["call nowhere", "br nowhere", "bz r1, nowhere", "blt r1, 2, nowhere"])
+def test_undefined_label_fails_to_load(jump):
+    with pytest.raises(TSVMError, match="Undefined label 'nowhere'"):
+        TSVM().load_lines(["proc main", "    " + jump, "    ret"])
+
+
+@pytest.mark.parametrize("line", ["br", "mov r1", "add r1, r2", "ret r1", "call iput", "call vget, r1, r2"])
+def test_wrong_operand_count_fails_to_load(line):
+    with pytest.raises(TSVMError, match="Wrong number of operands"):
+        TSVM().load_lines(["proc main", "    " + line, "    ret"])
+
+
+def test_unknown_instruction_fails_to_load():
+    with pytest.raises(TSVMError, match="Unknown instruction 'jmp'"):
+        TSVM().load_lines(["proc main", "    jmp main", "    ret"])
+
+
+def test_builtin_calls_need_no_label():
+    vm = TSVM()
+    vm.load_lines(["proc main", "    mov r1, 5", "    call iput, r1", "    ret"])
+    assert vm.run_captured().output == "5"
+
+
+UNINITIALIZED_TO_STRING = """
+let v: vector = list(2);
+let s: string = "v=" + v;
+func main() <null> { print(s); }
+"""
+
+
+def test_builtin_reading_uninitialized_memory_raises_a_runtime_error():
+    code = compile_program(UNINITIALIZED_TO_STRING)
+    message = "Runtime Error: Read uninitialized memory at address"
+    assert run_code(code)[1].startswith(message)
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter = load_source(UNINITIALIZED_TO_STRING)[2]
+    assert outcome(interpreter.run_captured)[1].startswith(message)
+    with pytest.raises(TSVMRuntimeError, match=message):
+        VMPool(1).run(code)
+    vm = TSVM()
+    vm.load_lines(code.splitlines())
+    with pytest.raises(TSVMRuntimeError, match=message):
+        asyncio.run(vm.run_async())
+
+
+RESET_PROGRAM = """
+let total = 0;
+func fact(n: int) <int> {
+    if n == 0 then { return 1; } else { return n * fact(n - 1); }
+}
+func main() <null> {
+    let v = [1, 2, 3];
+    total = fact(10) + v[2];
+    print(total);
+}
+"""
+
+
+def test_reset_clears_only_what_the_run_wrote():
+    vm = TSVM()
+    vm.load_lines(compile_program(RESET_PROGRAM).splitlines())
+    fresh = list(vm.memory)
+    first = vm.run_captured()
+    assert vm.stack_low < vm.stack_top and vm.written_high > vm.global_base
+    vm.memory[0] = 5  # below anything the program touches
+    vm.reset()
+    assert vm.memory[0] == 5
+    vm.memory[0] = 0
+    assert vm.memory[:len(fresh)] == fresh and not any(vm.memory[len(fresh):])
+    assert (vm.stack_low, vm.written_high) == (vm.stack_top, vm.stack_top)
+    assert vm.run_captured() == first
+
+
+def test_frame_reservation_past_the_stack_overflows():
+    vm = TSVM()
+    vm.load_lines(["proc main", "    push fp", "    mov fp, sp", "    mov r1, 20000", "    sub sp, sp, r1", "    ret"])
+    with pytest.raises(TSVMRuntimeError, match="Stack overflow"):
+        vm.run()
+
+
+def test_deep_recursion_with_stack_allocated_frames_overflows_cleanly():
+    program = """
+func deep(n: int) <int> {
+    let a = list(200);
+    a[0] = n;
+    if n == 0 then { return 0; } else { return deep(n - 1) + a[0]; }
+}
+func main() <null> {
+    print(deep(1000));
+}
+"""
+    result = run_code(compile_program(program, stack_alloc=True))
+    assert result[:2] == ("error", "Runtime Error: Stack overflow")
+
+
+class RecordingCheckpointer(Checkpointer):
+    def __init__(self, path, every):
+        super().__init__(path, every)
+        self.at = []
+
+    def write(self, vm):
+        self.at.append(vm.steps)
+        super().write(vm)
+
+
+def test_checkpoint_interval_counts_from_the_resumed_step(tmp_path):
+    code = compile_program(open(f"{ROOT}/benchmarks/programs/counter.txt").read()).splitlines()
+    first = str(tmp_path / "first.ckpt")
+    vm = TSVM()
+    vm.load_lines(code)
+    vm.run_captured(checkpoint=Checkpointer(first, 2500))
+    vm.load_checkpoint(first)
+    start = vm.steps
+    checkpoint = RecordingCheckpointer(str(tmp_path / "second.ckpt"), 1000)
+    resumed = TSVM()
+    resumed.load_lines(code)
+    assert resumed.run_captured(checkpoint=checkpoint, resume=first).exit_code == 0
+    assert checkpoint.at[0] == start + 1000
+
+
+def test_run_async_slices_and_budgets_top_level_code():
+    code = compile_program("let i = 0; while i < 1 do { i = 0; } func main() <null> { print(i); }")
+    vm = TSVM()
+    vm.load_lines(code.splitlines())
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(vm.steps)
+            await asyncio.sleep(0)
+
+    async def run():
+        ticker = asyncio.ensure_future(tick())
+        try:
+            await asyncio.wait_for(vm.run_async(slice_steps=100, max_steps=10000), 5)
+        finally:
+            ticker.cancel()
+
+    with pytest.raises(TSVMLimitExceeded, match="Instruction limit of 10000 exceeded"):
+        asyncio.run(run())
+    assert len(ticks) > 10
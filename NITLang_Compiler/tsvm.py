@@ -1,32 +1,337 @@
+import argparse
+import asyncio
+import functools
+import hashlib
+import io
+import marshal
+import operator
+import os
+import queue
+import signal
 import sys
 import shlex
+import time
+import zlib
+from array import array
+from collections import Counter, defaultdict, namedtuple
+
+from MemoryLayout import DEFAULT_LAYOUT, MemoryLayout
+
+BRANCH_TESTS = {
+    'beq': operator.eq, 'bne': operator.ne, 'blt': operator.lt,
+    'ble': operator.le, 'bgt': operator.gt, 'bge': operator.ge,
+}
+BUILTIN_OPERANDS = {  # operands after the name, including the result register
+    'iput': 1, 'nprint': 1, 'sprint': 1, 'vprint': 1, 'nl': 0, 'iget': 1, 'exit': 1,
+    'mem': 2, 'vget': 3, 'itos': 2, 'vtos': 2, 'sconcat': 3, 'mclr': 2,
+}
+BUILTINS = frozenset(BUILTIN_OPERANDS)
+RESULT_BUILTINS = frozenset(('mem', 'vget', 'itos', 'vtos', 'sconcat', 'iget'))  # write their first operand
+LABEL_OPERANDS = dict({'br': 1, 'bz': 2, 'bnz': 2, 'call': 1}, **{op: 3 for op in BRANCH_TESTS})
+OPERAND_COUNTS = dict(  # `call` takes 1 operand, or 1 + BUILTIN_OPERANDS of a builtin
+    {'mov': 2, 'sload': 2, 'push': 1, 'pop': 1, 'ld': 2, 'st': 2, 'add': 3, 'sub': 3, 'mul': 3, 'div': 3,
+     'mod': 3, 'and': 3, 'or': 3, 'br': 1, 'bz': 2, 'bnz': 2, 'proc': 1, 'ret': 0},
+    **{op: 3 for op in BRANCH_TESTS}, **{'cmp' + c: 3 for c in ('==', '!=', '<', '<=', '>', '>=')})
+
+RunResult = namedtuple('RunResult', 'exit_code output steps')
+
+
+async def _flush_async(buffer, stream):
+    """Moves what `buffer` holds to the async `stream`, if there is one."""
+    if stream is None or not buffer.tell():
+        return
+    stream.write(buffer.getvalue().encode())
+    buffer.seek(0)
+    buffer.truncate()
+    await stream.drain()
+
+
+def split_instruction(line):
+    """The words of an instruction line (comment already removed), without separating commas."""
+    try:
+        parts = shlex.split(line)
+    except ValueError as e:
+        raise TSVMError(f"Error parsing line: {line}\n{e}") from None
+    clean_parts = []
+    for p in parts:
+        if p.endswith(','): p = p[:-1]
+        if p == ',': continue
+        clean_parts.append(p)
+    return clean_parts
+
+
+class TSVMError(Exception):
+    """A program could not be loaded, resumed or started."""
+
+
+class TSVMRuntimeError(TSVMError):
+    """
+    The running program failed. `ip` is the instruction it stopped at; `output`
+    is what it printed before, when the run was captured.
+    """
+    def __init__(self, message, ip=None):
+        super().__init__(message)
+        self.ip = ip
+        self.output = None
+
+
+class TSVMLimitExceeded(TSVMRuntimeError):
+    """The program ran past its instruction or time budget."""
+
+
+class _Halt(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+class Profile:
+    """
+    Execution profile filled by `TSVM.run(profile=...)`.
+
+    Every executed instruction is charged to its opcode and to the current call
+    stack (a tuple of proc names), which gives exclusive and inclusive counts per
+    proc and the collapsed stacks flame-graph tools read. Calls to builtins are
+    also timed.
+    """
+    def __init__(self):
+        self.opcodes = Counter()
+        self.stacks = Counter()
+        self.calls = Counter()
+        self.builtin_calls = Counter()
+        self.builtin_seconds = defaultdict(float)
+        self.stack = ('<globals>',)
+
+    def start(self, proc):
+        self.stack = (proc,)
+        self.calls[('<start>', proc)] += 1
+
+    def enter(self, proc):
+        self.calls[(self.stack[-1], proc)] += 1
+        self.stack = self.stack + (proc,)
+
+    def leave(self):
+        if len(self.stack) > 1:
+            self.stack = self.stack[:-1]
+
+    def exclusive(self):
+        counts = Counter()
+        for stack, n in self.stacks.items():
+            counts[stack[-1]] += n
+        return counts
+
+    def inclusive(self):
+        counts = Counter()
+        for stack, n in self.stacks.items():
+            for proc in set(stack):
+                counts[proc] += n
+        return counts
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, n in sorted(self.stacks.items()):
+                f.write(f"{';'.join(stack)} {n}\n")
+
+    def summary(self, top=15):
+        total = sum(self.opcodes.values()) or 1
+        lines = [f"Instructions executed: {sum(self.opcodes.values())}", "", "Opcodes:"]
+        for op, n in self.opcodes.most_common(top):
+            lines.append(f"  {op:<10} {n:>12} {100 * n / total:6.1f}%")
+
+        exclusive, inclusive = self.exclusive(), self.inclusive()
+        calls_into = Counter()
+        for (_, callee), n in self.calls.items():
+            calls_into[callee] += n
+        lines += ["", "Procedures:", f"  {'proc':<24} {'inclusive':>12} {'exclusive':>12} {'calls':>8}"]
+        for proc, n in inclusive.most_common(top):
+            lines.append(f"  {proc:<24} {n:>12} {exclusive[proc]:>12} {calls_into[proc]:>8}")
+
+        lines += ["", "Call edges:"]
+        for (caller, callee), n in self.calls.most_common(top):
+            lines.append(f"  {caller} -> {callee}: {n}")
+
+        if self.builtin_calls:
+            lines += ["", "Builtins:", f"  {'builtin':<10} {'calls':>10} {'seconds':>10}"]
+            for name, n in self.builtin_calls.most_common():
+                lines.append(f"  {name:<10} {n:>10} {self.builtin_seconds[name]:>10.4f}")
+        return "\n".join(lines)
+
+
+_PENDING = object()
+
+
+def _written_register(inst):
+    """The register `inst` writes, or None."""
+    op = inst[0]
+    if op in ('st', 'br', 'bz', 'bnz', 'proc') or op in BRANCH_TESTS:
+        return None
+    if op in ('push', 'ret'):
+        return 'sp'
+    if op == 'call':
+        if inst[1] not in BUILTINS:
+            return 'sp'
+        return inst[2] if inst[1] in RESULT_BUILTINS else None
+    return inst[1]
+
+
+class Trace:
+    """
+    Fixed-size ring buffer of the last `size` executed instructions, filled by
+    `TSVM.run(trace=...)` and dumped when the program stops on a runtime error.
+
+    Each entry keeps the ip, the instruction and the register it wrote with the
+    value before and after. With `sample_every` = k the ip of every k-th executed
+    instruction is also appended to `samples`.
+    """
+    def __init__(self, size=64, sample_every=0):
+        self.size = size
+        self.ring = [None] * size
+        self.next = 0
+        self.sample_every = sample_every
+        self.samples = array('l')
+        self.writes = []
+
+    def entries(self):
+        """Recorded entries, oldest first."""
+        return [e for e in self.ring[self.next:] + self.ring[:self.next] if e is not None]
+
+    def dump(self, file=None):
+        file = file or sys.stderr
+        entries = self.entries()
+        print(f"--- last {len(entries)} instructions (oldest first) ---", file=file)
+        for ip, inst, reg, old, new in entries:
+            if new is _PENDING:
+                delta = "<- stopped here"
+            else:
+                delta = f"{reg}: {old} -> {new}" if reg is not None and old != new else ""
+            print(f"  {ip:>6}: {' '.join(inst):<36} {delta}", file=file)
+
+    def sample_summary(self, program, top=10):
+        lines = [f"Samples: {len(self.samples)} (every {self.sample_every} instructions)"]
+        for ip, n in Counter(self.samples).most_common(top):
+            lines.append(f"  {ip:>6}: {n:>8}  {' '.join(program[ip])}")
+        return "\n".join(lines)
+
+
+CHECKPOINT_MAGIC = b'TSVMCKP1'
+
+
+class Checkpointer:
+    """
+    Writes checkpoints of a `TSVM.run(checkpoint=...)` to `path`, every `every`
+    executed instructions and whenever `signum` is delivered. Each checkpoint
+    replaces the previous one atomically. The interval counts from the step the
+    run starts (or resumes) at.
+    """
+    def __init__(self, path, every=0, signum=None):
+        self.path = path
+        self.every = every
+        self.next_at = every or float('inf')
+        self.requested = False
+        self.written = 0
+        if signum is not None:
+            signal.signal(signum, self._request)
+
+    def _request(self, signum, frame):
+        self.requested = True
+
+    def start(self, steps):
+        if self.every:
+            self.next_at = steps + self.every
+
+    def due(self, steps):
+        return self.requested or steps >= self.next_at
+
+    def write(self, vm):
+        vm.save_checkpoint(self.path)
+        self.requested = False
+        self.written += 1
+        if self.every:
+            self.next_at = vm.steps + self.every
+
+
+class _AsyncSlicer:
+    """
+    Budget and yield points shared by both phases of `TSVM.run_async`: checked
+    before each instruction, it yields to the event loop every `slice_steps`
+    instructions, enforces `max_steps` and feeds `iget` from `stdin`.
+    """
+    def __init__(self, vm, stdin, stdout, out, slice_steps, max_steps):
+        self.vm = vm
+        self.stdin = stdin
+        self.stdout = stdout
+        self.out = out
+        self.slice_steps = slice_steps
+        self.max_steps = max_steps
+        self.limit = float('inf') if max_steps is None else max_steps
+        self.pause_at = min(vm.steps + slice_steps, self.limit)
+
+    async def before(self, inst):
+        vm = self.vm
+        if vm.steps >= self.pause_at:
+            if vm.steps >= self.limit:
+                raise TSVMLimitExceeded(f"Runtime Error: Instruction limit of {self.max_steps} exceeded", vm.ip)
+            await _flush_async(self.out, self.stdout)
+            await asyncio.sleep(0)
+            self.pause_at = min(vm.steps + self.slice_steps, self.limit)
+
+        if inst[0] == 'call' and inst[1] == 'iget':
+            await _flush_async(self.out, self.stdout)
+            line = await self.stdin.readline() if self.stdin is not None else ''
+            vm.stdin = io.StringIO(line.decode() if isinstance(line, bytes) else line)
+
 
 class TSVM:
-    def __init__(self, memory_size=50000):
+    def __init__(self, layout=None):
         # --- Architecture ---
         # Registers: r0-rN, fp, sp
-        # Stack starts at 9000 and grows downwards
-        self.registers = {
-            'r0': 0, 'sp': 9000, 'fp': 9000, 
-        }
-        # Memory: 0-9000 (Stack), 10000+ (Globals), 20000+ (Heap)
-        self.memory = [0] * memory_size
-        self.heap_ptr = 20000 
-        
+        # Memory (see MemoryLayout): stack growing down from stack_top, globals
+        # at global_base, heap at heap_base growing on demand up to heap_end
+        self.set_layout(layout or DEFAULT_LAYOUT)
+
         self.program = []
         self.labels = {}
         self.ip = 0 
+        self.steps = 0  # instructions executed, for benchmarks
+        self.trace = None
+        self.program_hash = None
+        self.stdout = None  # file-like objects; None means sys.stdout / sys.stdin
+        self.stdin = None
+        self.builtins = {name: getattr(self, '_builtin_' + name) for name in BUILTINS}
+
+    def set_layout(self, layout):
+        """Switches to `layout` with a fresh memory."""
+        self.layout = layout
+        self.stack_top = layout.stack_top
+        self.stack_limit = layout.stack_limit
+        self.global_base = layout.global_base
+        self.heap_base = layout.heap_base
+        self.heap_end = layout.heap_end
+        self.registers = {
+            'r0': 0, 'sp': layout.stack_top, 'fp': layout.stack_top,
+        }
+        self.memory = [0] * layout.memory_size
+        self.heap_ptr = layout.heap_base
+        self.stack_low = self.written_high = layout.stack_top  # what reset clears, see mark_written
 
     def load_program(self, filepath):
         try:
             with open(filepath, 'r') as f:
                 lines = f.readlines()
         except FileNotFoundError:
-            print(f"Error: File '{filepath}' not found.")
-            sys.exit(1)
+            raise TSVMError(f"File '{filepath}' not found.") from None
+        self.load_lines(lines)
 
+    def load_lines(self, lines):
+        """Parses TSVM assembly; a `# layout:` header switches to the layout it was compiled for."""
+        self.labels = {}
+        layout = DEFAULT_LAYOUT
         valid_lines = []
         for line in lines:
+            if line.startswith('# layout:'):
+                try:
+                    layout = MemoryLayout.from_header(line.strip())
+                except ValueError as e:
+                    raise TSVMError(f"Bad layout header: {e}") from None
             line = line.split('#')[0].strip()
             if not line:
                 continue
@@ -42,19 +347,37 @@ class TSVM:
                 valid_lines.append(['proc', label]) 
                 continue
             
-            try:
-                parts = shlex.split(line)
-                clean_parts = []
-                for p in parts:
-                    if p.endswith(','): p = p[:-1]
-                    if p == ',': continue
-                    clean_parts.append(p)
-                valid_lines.append(clean_parts)
-            except ValueError as e:
-                print(f"Error parsing line: {line}\n{e}")
-                sys.exit(1)
+            valid_lines.append(split_instruction(line))
+
+        for inst in valid_lines:
+            op = inst[0]
+            if op == 'call':
+                expected = 1 + BUILTIN_OPERANDS.get(inst[1], 0) if len(inst) > 1 else 1
+            else:
+                expected = OPERAND_COUNTS.get(op)
+                if expected is None:
+                    raise TSVMError(f"Unknown instruction '{op}' in: {' '.join(inst)}")
+            if len(inst) - 1 != expected:
+                raise TSVMError(f"Wrong number of operands for '{op}' (expected {expected}) in: {' '.join(inst)}")
+            index = LABEL_OPERANDS.get(op)
+            if index is not None:
+                target = inst[index]
+                if target not in self.labels and not (inst[0] == 'call' and target in BUILTINS):
+                    raise TSVMError(f"Undefined label '{target}' in: {' '.join(inst)}")
         
         self.program = valid_lines
+        self.program_hash = hashlib.sha256(marshal.dumps((valid_lines, layout.spec()))).hexdigest()
+        if layout != self.layout:
+            self.set_layout(layout)
+
+    def loaded_program(self):
+        """What load_lines produced, for another instance's `use_program`."""
+        return self.program, self.labels, self.program_hash, self.layout
+
+    def use_program(self, loaded):
+        self.program, self.labels, self.program_hash, layout = loaded
+        if layout != self.layout:
+            self.set_layout(layout)
 
     def get_val(self, arg):
         try:
@@ -65,11 +388,318 @@ class TSVM:
     def set_reg(self, reg, val):
         self.registers[reg] = int(val)
 
-    def run(self):
+    def _runtime_error(self, message):
+        raise TSVMRuntimeError(message, self.ip)
+
+    def _crashed(self, e):
+        """Raises a Python exception an instruction let escape as a TSVMRuntimeError."""
+        raise TSVMRuntimeError(f"Runtime Error: {type(e).__name__}: {e}", self.ip) from e
+
+    def _reserve(self, words):
+        """Makes room for `words` more heap words, growing memory up to the heap limit."""
+        need = self.heap_ptr + words
+        if need <= len(self.memory):
+            return
+        if need > self.heap_end:
+            self._runtime_error(f"Runtime Error: Out of memory (heap limit of {self.layout.heap_limit} words)")
+        size = min(max(need, 2 * len(self.memory)), self.heap_end)
+        self.memory.extend([0] * (size - len(self.memory)))
+
+    def store_string(self, text):
+        """Copies `text` to the heap as a null-terminated string; returns its address."""
+        return self._store_codes(list(map(ord, text)))
+
+    def _store_codes(self, codes):
+        self._reserve(len(codes) + 1)
+        ptr = self.heap_ptr
+        end = ptr + len(codes)
+        self.memory[ptr:end] = codes
+        self.memory[end] = 0
+        self.heap_ptr = end + 1
+        return ptr
+
+    def _read_codes(self, ptr):
+        """Words of the null-terminated string at `ptr`, stopping at the end of memory."""
+        codes = []
+        while 0 <= ptr < len(self.memory):
+            val = self.memory[ptr]
+            if val == 0 or val is None:
+                break
+            codes.append(val)
+            ptr += 1
+        return codes
+
+    def _read_chars(self, ptr):
+        return "".join(map(chr, self._read_codes(ptr)))
+
+    def _read_word(self, addr, builtin):
+        """memory[addr] for a builtin, failing like `ld` when it is outside memory or uninitialized."""
+        if not 0 <= addr < len(self.memory):
+            self._runtime_error(f"Runtime Error: Memory access out of bounds ({builtin}) at {addr}")
+        val = self.memory[addr]
+        if val is None:
+            self._runtime_error(f"Runtime Error: Read uninitialized memory at address {addr}")
+        return val
+
+    # -------- BUILTINS --------
+    # `call name, ...` runs `_builtin_name` on the operand values; the ones in
+    # RESULT_BUILTINS write what they return to their first operand.
+    def _builtin_iput(self, val):
+        if self.heap_base <= val < self.heap_ptr:
+            (self.stdout or sys.stdout).write(self._read_chars(val))
+        else:
+            (self.stdout or sys.stdout).write(str(val))
+
+    def _builtin_nprint(self, val):
+        (self.stdout or sys.stdout).write(str(val))
+
+    def _builtin_sprint(self, ptr):
+        out = self.stdout or sys.stdout
+        while True:
+            val = self.memory[ptr]
+            if val == 0 or val is None:
+                break
+            out.write(chr(val))
+            ptr += 1
+
+    def _builtin_vprint(self, ptr):
+        out = self.stdout or sys.stdout
+        size_addr = ptr - 1
+        if size_addr < 0 or size_addr >= len(self.memory):
+            self._runtime_error("Runtime Error: Invalid vector pointer")
+        size = self.memory[size_addr]
+        if size is None:
+            self._runtime_error("Runtime Error: Vector corrupted")
+
+        out.write("[")
+        for i in range(size):
+            val = self.memory[ptr + i]
+            if val is None:
+                self._runtime_error(f"\nRuntime Error: Vector index {i} is uninitialized")
+            if self.heap_base <= val < self.heap_ptr:
+                out.write(self._read_chars(val))
+            else:
+                out.write(str(val))
+            if i < size - 1:
+                out.write(",")
+        out.write("]")
+
+    def _builtin_nl(self):
+        (self.stdout or sys.stdout).write("\n")
+
+    def _builtin_iget(self):
+        try:
+            return int((self.stdin or sys.stdin).readline())
+        except ValueError:
+            self._runtime_error("Runtime Error: Invalid input")
+
+    def _builtin_exit(self, code):
+        raise _Halt(code)
+
+    def _builtin_mclr(self, addr, size):
+        if addr < 0 or addr + size > len(self.memory):
+            self._runtime_error(f"Runtime Error: Memory access out of bounds (mclr) at {addr}")
+        self.memory[addr:addr + size] = [None] * size  # uninitialized, as `mem` leaves it
+        self.mark_written(addr, addr + size)
+
+    def _builtin_mem(self, size):
+        self._reserve(size)
+        ptr = self.heap_ptr
+        self.heap_ptr += size
+        for i in range(ptr, ptr + size):
+            self.memory[i] = None
+        return ptr
+
+    def _builtin_vget(self, ptr, idx):
+        if ptr < self.global_base and not self.registers['sp'] < ptr < self.stack_top:
+            self._runtime_error("Runtime Error: Invalid vector pointer")
+        size = self._read_word(ptr - 1, 'vget')
+        if idx < 0 or idx >= size:
+            self._runtime_error(f"Runtime Error: Vector index {idx} out of bounds (size {size})")
+        val = self.memory[ptr + idx]
+        if val is None:
+            self._runtime_error(f"Runtime Error: Vector index {idx} is uninitialized")
+        return val
+
+    def _builtin_itos(self, val):
+        return self.store_string(str(val))
+
+    def _builtin_vtos(self, vec_ptr):
+        if vec_ptr < self.global_base and not self.registers['sp'] < vec_ptr < self.stack_top:
+            self._runtime_error("Runtime Error: Invalid vector pointer for vtos")
+        size = self._read_word(vec_ptr - 1, 'vtos')
+        parts = []
+        for i in range(size):
+            val = self._read_word(vec_ptr + i, 'vtos')
+            parts.append(self._read_chars(val) if self.heap_base <= val < self.heap_ptr else str(val))
+        return self.store_string("[" + ", ".join(parts) + "]")
+
+    def _builtin_sconcat(self, left_ptr, right_ptr):
+        return self._store_codes(self._read_codes(left_ptr) + self._read_codes(right_ptr))
+
+
+    def mark_written(self, low, high):
+        """
+        Widens what `reset` clears to take in memory[low:high] below the heap.
+        Instructions and builtins keep two marks: `stack_low`, the lowest stack
+        address written, and `written_high`, one past the highest address above
+        the stack; code writing `memory` directly must call this.
+        """
+        if low < self.stack_low:
+            self.stack_low = low
+        if high > self.written_high:
+            self.written_high = min(high, self.heap_base)
+
+    def reset(self):
+        """
+        Returns to the state of a fresh TSVM, keeping the loaded program. Only
+        memory the last run wrote is cleared: the stack down to its low-water
+        mark, the globals up to the highest one written and the heap up to
+        `heap_ptr`. Memory the heap grew into is kept.
+        """
+        low, high = self.stack_low, self.written_high
+        if high > low:
+            self.memory[low:high] = [0] * (high - low)
+        base = self.heap_base
+        high = min(self.heap_ptr, len(self.memory))
+        if high > base:
+            self.memory[base:high] = [0] * (high - base)
+        self.heap_ptr = base
+        self.stack_low = self.written_high = self.stack_top
+        self.registers = {'r0': 0, 'sp': self.stack_top, 'fp': self.stack_top}
+        self.ip = 0
+        self.steps = 0
+        self.trace = None
+
+    def snapshot(self):
+        """
+        The state needed to continue the run, as compressed bytes: registers, ip,
+        step count, heap pointer and memory from the stack pointer up to the heap
+        pointer (the stack below sp and the heap above heap_ptr are never read).
+        """
+        start = min(self.registers['sp'], self.stack_top)
+        state = {
+            'program': self.program_hash,
+            'registers': self.registers,
+            'ip': self.ip,
+            'steps': self.steps,
+            'heap_ptr': self.heap_ptr,
+            'memory_size': len(self.memory),
+            'memory_start': start,
+            'memory': self.memory[start:self.heap_ptr],
+        }
+        return CHECKPOINT_MAGIC + zlib.compress(marshal.dumps(state))
+
+    def restore(self, data):
+        """Loads a snapshot taken from the same program; the program must already be loaded."""
+        if not data.startswith(CHECKPOINT_MAGIC):
+            raise ValueError("not a TSVM checkpoint")
+        state = marshal.loads(zlib.decompress(data[len(CHECKPOINT_MAGIC):]))
+        if state['program'] != self.program_hash:
+            raise ValueError("checkpoint was taken from a different program")
+        self.memory = [0] * state['memory_size']
+        start = state['memory_start']
+        self.memory[start:start + len(state['memory'])] = state['memory']
+        self.stack_low = self.written_high = self.stack_top
+        self.mark_written(start, start + len(state['memory']))
+        self.registers = state['registers']
+        self.ip = state['ip']
+        self.steps = state['steps']
+        self.heap_ptr = state['heap_ptr']
+
+    def save_checkpoint(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.snapshot())
+        os.replace(tmp, path)
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path, 'rb') as f:
+                self.restore(f.read())
+        except (OSError, ValueError, EOFError, zlib.error) as e:
+            raise TSVMError(f"cannot resume from '{path}': {e}") from None
+
+    def run(self, profile=None, trace=None, checkpoint=None, resume=None, max_steps=None):
+        """
+        Runs the program and returns its exit code; runtime errors raise
+        TSVMRuntimeError. Given a Profile or a Trace, an instrumented copy of the
+        dispatch loop fills it; the plain loop is left untouched. A Checkpointer
+        saves the state while `main` runs, and `resume` names a checkpoint to
+        continue from instead of starting over. Past `max_steps` instructions
+        the run raises TSVMLimitExceeded.
+        """
+        if profile is not None and trace is not None:
+            raise ValueError("profile and trace cannot be combined")
         if 'main' not in self.labels:
-            print("Error: No 'main' procedure found.")
-            sys.exit(1)
+            raise TSVMError("No 'main' procedure found.")
+        try:
+            self._run(profile, trace, checkpoint, resume, max_steps)
+        except _Halt as halt:
+            return halt.code
+        except TSVMError:
+            raise
+        except Exception as e:
+            self._crashed(e)
+        return 0
+
+    def run_captured(self, stdin="", **kwargs):
+        """Runs with `stdin` as input and returns a RunResult with everything printed."""
+        out = io.StringIO()
+        self.stdout, self.stdin = out, io.StringIO(stdin)
+        try:
+            exit_code = self.run(**kwargs)
+        except TSVMRuntimeError as e:
+            e.output = out.getvalue()
+            raise
+        finally:
+            self.stdout = self.stdin = None
+        return RunResult(exit_code, out.getvalue(), self.steps)
+
+    def _run(self, profile, trace, checkpoint, resume, max_steps):
+        self.trace = trace
+        if profile is not None:
+            execute = functools.partial(self._execute_profiled, profile=profile)
+        elif trace is not None:
+            trace.writes = [_written_register(inst) for inst in self.program]
+            execute = self._execute_traced
+        else:
+            execute = self._execute_instruction
+
+        if resume is not None:
+            self.load_checkpoint(resume)
+            if profile is not None:
+                profile.start('<resumed>')
+            return self._run_instrumented(execute, checkpoint, max_steps)
+
+        self._run_globals(execute)
+        if profile is not None:
+            profile.start('main')
+        if profile is not None or trace is not None or checkpoint is not None or max_steps is not None:
+            return self._run_instrumented(execute, checkpoint, max_steps)
+
+        while self.ip < len(self.program):
+            inst = self.program[self.ip]
+
+            if inst[0] == 'proc':
+                self.ip += 1
+                continue
 
+            self._execute_instruction(inst)
+            self.steps += 1
+            self.ip += 1
+
+    def _run_globals(self, execute):
+        """Runs the top-level code outside procs, then points ip at `main`."""
+        for inst in self._global_instructions():
+            execute(inst)
+            self.steps += 1
+
+    def _global_instructions(self):
+        """
+        Yields each top-level instruction for the caller to execute, skipping
+        proc bodies, and points ip at `main` once they are done.
+        """
         self.ip = 0
         running_globals = True
 
@@ -89,7 +719,7 @@ class TSVM:
                     self.ip += 1
                 continue
 
-            self._execute_instruction(inst)
+            yield inst
 
             if self.ip >= len(self.program) - 1:
                 running_globals = False
@@ -98,19 +728,131 @@ class TSVM:
 
         self.registers['sp'] -= 1
         self.memory[self.registers['sp']] = -1
+        self.mark_written(self.registers['sp'], 0)
 
         self.ip = self.labels['main']
 
+    async def run_async(self, stdin=None, stdout=None, slice_steps=1000, max_steps=None):
+        """
+        Runs the program on the running asyncio event loop, yielding to it every
+        `slice_steps` instructions, and returns a RunResult.
+
+        `iget` awaits `stdin.readline()` (an asyncio.StreamReader or anything
+        with an async readline). Output is written to `stdout` (an
+        asyncio.StreamWriter or anything with write(bytes) and an async drain())
+        at every yield and before reading input; without `stdout` it is
+        returned in the result. Past `max_steps` instructions the run raises
+        TSVMLimitExceeded. Cancelling the task stops the run at its next yield.
+        """
+        if 'main' not in self.labels:
+            raise TSVMError("No 'main' procedure found.")
+        out = io.StringIO()
+        self.stdout = out
+        try:
+            try:
+                slicer = _AsyncSlicer(self, stdin, stdout, out, slice_steps, max_steps)
+                exit_code = await self._run_phases_async(slicer)
+            except TSVMRuntimeError as e:
+                await _flush_async(out, stdout)
+                e.output = out.getvalue()
+                raise
+            await _flush_async(out, stdout)
+        finally:
+            self.stdout = self.stdin = None
+        return RunResult(exit_code, out.getvalue(), self.steps)
+
+    async def _run_phases_async(self, slicer):
+        try:
+            await self._run_globals_async(slicer)
+            await self._run_main_async(slicer)
+        except _Halt as halt:
+            return halt.code
+        except TSVMError:
+            raise
+        except Exception as e:
+            self._crashed(e)
+        return 0
+
+    async def _run_globals_async(self, slicer):
+        for inst in self._global_instructions():
+            await slicer.before(inst)
+            self._execute_instruction(inst)
+            self.steps += 1
+
+    async def _run_main_async(self, slicer):
+        program = self.program
+        while self.ip < len(program):
+            inst = program[self.ip]
+
+            if inst[0] == 'proc':
+                self.ip += 1
+                continue
+
+            await slicer.before(inst)
+            self._execute_instruction(inst)
+            self.steps += 1
+            self.ip += 1
+
+    def _run_instrumented(self, execute, checkpoint=None, max_steps=None):
+        limit = float('inf') if max_steps is None else max_steps
+        if checkpoint is not None:
+            checkpoint.start(self.steps)
         while self.ip < len(self.program):
+            if checkpoint is not None and checkpoint.due(self.steps):
+                checkpoint.write(self)
+            if self.steps >= limit:
+                raise TSVMLimitExceeded(f"Runtime Error: Instruction limit of {max_steps} exceeded", self.ip)
             inst = self.program[self.ip]
 
             if inst[0] == 'proc':
                 self.ip += 1
                 continue
 
-            self._execute_instruction(inst)
+            execute(inst)
+            self.steps += 1
             self.ip += 1
 
+    def _execute_traced(self, inst):
+        trace = self.trace
+        slot = trace.next
+        trace.next = (slot + 1) % trace.size
+        ip = self.ip
+        reg = trace.writes[ip]
+        old = self.registers.get(reg)
+        trace.ring[slot] = (ip, inst, reg, old, _PENDING)
+        if trace.sample_every and self.steps % trace.sample_every == 0:
+            trace.samples.append(ip)
+        try:
+            self._execute_instruction(inst)
+        except (TSVMError, _Halt, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            self._crashed(e)
+        trace.ring[slot] = (ip, inst, reg, old, self.registers.get(reg))
+
+    def _execute_profiled(self, inst, profile):
+        op = inst[0]
+        profile.opcodes[op] += 1
+        profile.stacks[profile.stack] += 1
+
+        if op == 'call':
+            target = inst[1]
+            if target in BUILTINS:
+                start = time.perf_counter()
+                try:
+                    self._execute_instruction(inst)
+                finally:
+                    profile.builtin_calls[target] += 1
+                    profile.builtin_seconds[target] += time.perf_counter() - start
+            else:
+                self._execute_instruction(inst)
+                profile.enter(target)
+        elif op == 'ret':
+            profile.leave()
+            self._execute_instruction(inst)
+        else:
+            self._execute_instruction(inst)
+
     def _execute_instruction(self, inst):
         op = inst[0]
         
@@ -118,23 +860,17 @@ class TSVM:
             self.set_reg(inst[1], self.get_val(inst[2]))
 
         elif op == 'sload':
-            dest_reg = inst[1]
-            string_content = inst[2] 
-            
-            ptr = self.heap_ptr
-            self.set_reg(dest_reg, ptr)
-            
-            for char in string_content:
-                self.memory[self.heap_ptr] = ord(char)
-                self.heap_ptr += 1
-            
-            self.memory[self.heap_ptr] = 0
-            self.heap_ptr += 1
+            self.set_reg(inst[1], self.store_string(inst[2]))
 
         elif op == 'push':
             val = self.get_val(inst[1])
-            self.registers['sp'] -= 1
-            self.memory[self.registers['sp']] = val
+            sp = self.registers['sp'] - 1
+            if sp < self.stack_limit:
+                self._runtime_error("Runtime Error: Stack overflow")
+            if sp < self.stack_low:
+                self.stack_low = sp
+            self.registers['sp'] = sp
+            self.memory[sp] = val
 
         elif op == 'pop':
             val = self.memory[self.registers['sp']]
@@ -147,12 +883,10 @@ class TSVM:
             if 0 <= addr < len(self.memory):
                 val = self.memory[addr]
                 if val is None:
-                    print(f"Runtime Error: Read uninitialized memory at address {addr}")
-                    sys.exit(1)
+                    self._runtime_error(f"Runtime Error: Read uninitialized memory at address {addr}")
                 self.set_reg(inst[1], val)
             else:
-                print(f"Runtime Error: Memory access out of bounds (ld) at {addr}")
-                sys.exit(1)
+                self._runtime_error(f"Runtime Error: Memory access out of bounds (ld) at {addr}")
 
         elif op == 'st':
             dest_str = inst[1].strip('[]')
@@ -160,9 +894,12 @@ class TSVM:
             val = self.get_val(inst[2])
             if 0 <= addr < len(self.memory):
                 self.memory[addr] = val
+                if addr < self.stack_low:
+                    self.stack_low = addr
+                elif self.written_high <= addr < self.heap_base:
+                    self.written_high = addr + 1
             else:
-                print(f"Runtime Error: Memory access out of bounds (st) at {addr}")
-                sys.exit(1)
+                self._runtime_error(f"Runtime Error: Memory access out of bounds (st) at {addr}")
 
         elif op == 'add':
             res = self.get_val(inst[2]) + self.get_val(inst[3])
@@ -170,6 +907,8 @@ class TSVM:
         
         elif op == 'sub':
             res = self.get_val(inst[2]) - self.get_val(inst[3])
+            if res < self.stack_limit and inst[1] == 'sp':  # reserving a frame
+                self._runtime_error("Runtime Error: Stack overflow")
             self.set_reg(inst[1], res)
         
         elif op == 'mul':
@@ -179,8 +918,7 @@ class TSVM:
         elif op == 'div':
             denom = self.get_val(inst[3])
             if denom == 0:
-                print("Runtime Error: Division by zero")
-                sys.exit(1)
+                self._runtime_error("Runtime Error: Division by zero")
             res = int(self.get_val(inst[2]) / denom)
             self.set_reg(inst[1], res)
 
@@ -215,208 +953,128 @@ class TSVM:
                 self.ip = self.labels[inst[2]]
                 self.ip -= 1
 
-        elif op == 'call':
-            target = inst[1]
+        elif op in BRANCH_TESTS:
+            if BRANCH_TESTS[op](self.get_val(inst[1]), self.get_val(inst[2])):
+                self.ip = self.labels[inst[3]]
+                self.ip -= 1
 
-            if target == 'iput':
-                val = self.get_val(inst[2])
-                if val >= 20000 and val < len(self.memory):
-                    ptr = val
-                    while True:
-                        if ptr >= len(self.memory): break
-                        char_val = self.memory[ptr]
-                        if char_val == 0 or char_val is None: break
-                        print(chr(char_val), end="")
-                        ptr += 1
-                else:
-                    print(val, end="")
-
-            elif target == 'sprint':
-                ptr = self.get_val(inst[2])
-                while True:
-                    val = self.memory[ptr]
-                    if val == 0 or val is None:
-                        break
-                    print(chr(val), end="")
-                    ptr += 1
-
-            elif target == 'vprint':
-                ptr = self.get_val(inst[2])
-                size_addr = ptr - 1
-                if size_addr < 0 or size_addr >= len(self.memory):
-                    print("Runtime Error: Invalid vector pointer")
-                    sys.exit(1)
-                size = self.memory[size_addr]
-                if size is None:
-                    print("Runtime Error: Vector corrupted")
-                    sys.exit(1)
-
-                print("[", end="")
-                for i in range(size):
-                    elem_addr = ptr + i
-                    val = self.memory[elem_addr]
-                    if val is None:
-                        print(f"\nRuntime Error: Vector index {i} is uninitialized")
-                        sys.exit(1)
-                    
-                    if val >= 20000 and val < len(self.memory):
-                        str_ptr = val
-                        while True:
-                            if str_ptr >= len(self.memory): break
-                            char_val = self.memory[str_ptr]
-                            if char_val == 0 or char_val is None: break
-                            print(chr(char_val), end="")
-                            str_ptr += 1
-                    else:
-                        print(val, end="")
-                        
-                    if i < size - 1:
-                        print(",", end="")
-                print("]", end="")
-
-            elif target == 'nl':
-                print()
-
-            elif target == 'iget':
-                try:
-                    val = int(input())
-                    self.set_reg(inst[2], val)
-                except ValueError:
-                    print("Runtime Error: Invalid input")
-                    sys.exit(1)
-
-            elif target == 'exit':
-                sys.exit(self.get_val(inst[2]))
-
-            elif target == 'mem':
-                dst_reg = inst[2]
-                size = self.get_val(inst[3])
-                ptr = self.heap_ptr
-                self.heap_ptr += size
-                self.set_reg(dst_reg, ptr)
-                for i in range(ptr, ptr + size):
-                    self.memory[i] = None
-
-            elif target == 'vget':
-                dst_reg = inst[2]
-                ptr = self.get_val(inst[3])
-                idx = self.get_val(inst[4])
-                
-                if ptr < 10000:
-                    print("Runtime Error: Invalid vector pointer")
-                    sys.exit(1)
-
-                size_addr = ptr - 1
-                size = self.memory[size_addr]
-                
-                if idx < 0 or idx >= size:
-                    print(f"Runtime Error: Vector index {idx} out of bounds (size {size})")
-                    sys.exit(1)
-
-                elem_addr = ptr + idx
-                val = self.memory[elem_addr]
+        elif op == 'and':
+            self.set_reg(inst[1], 1 if self.get_val(inst[2]) and self.get_val(inst[3]) else 0)
 
-                if val is None:
-                    print(f"Runtime Error: Vector index {idx} is uninitialized")
-                    sys.exit(1)
+        elif op == 'or':
+            self.set_reg(inst[1], 1 if self.get_val(inst[2]) or self.get_val(inst[3]) else 0)
 
-                self.set_reg(dst_reg, val)
-            
-            elif target == 'itos':
-                dst_reg = inst[2]
-                val = self.get_val(inst[3])
-                res_str = str(val)
-                ptr = self.heap_ptr
-                self.set_reg(dst_reg, ptr)
-                for char in res_str:
-                    self.memory[self.heap_ptr] = ord(char)
-                    self.heap_ptr += 1
-                self.memory[self.heap_ptr] = 0
-                self.heap_ptr += 1
-
-            elif target == 'vtos':
-                dst_reg = inst[2]
-                vec_ptr = self.get_val(inst[3])
-                
-                if vec_ptr < 10000:
-                    print("Runtime Error: Invalid vector pointer for vtos")
-                    sys.exit(1)
-                
-                size_addr = vec_ptr - 1
-                size = self.memory[size_addr]
-                
-                res_str = "["
-                for i in range(size):
-                    val = self.memory[vec_ptr + i]
-                    if val >= 20000:
-                         str_ptr = val
-                         while True:
-                            char_val = self.memory[str_ptr]
-                            if char_val == 0 or char_val is None: break
-                            res_str += chr(char_val)
-                            str_ptr += 1
-                    else:
-                        res_str += str(val)
-
-                    if i < size - 1:
-                        res_str += ", "
-                res_str += "]"
-                
-                ptr = self.heap_ptr
-                self.set_reg(dst_reg, ptr)
-                for char in res_str:
-                    self.memory[self.heap_ptr] = ord(char)
-                    self.heap_ptr += 1
-                self.memory[self.heap_ptr] = 0
-                self.heap_ptr += 1
-
-            elif target == 'sconcat':
-                dst_reg = inst[2]
-                left_ptr = self.get_val(inst[3])
-                right_ptr = self.get_val(inst[4])
-
-                def read_c_string(ptr):
-                    chars = []
-                    while 0 <= ptr < len(self.memory):
-                        val = self.memory[ptr]
-                        if val is None or val == 0:
-                            break
-                        chars.append(val)
-                        ptr += 1
-                    return chars
-
-                left_chars = read_c_string(left_ptr)
-                right_chars = read_c_string(right_ptr)
-
-                start = self.heap_ptr
-                for val in left_chars + right_chars:
-                    self.memory[self.heap_ptr] = val
-                    self.heap_ptr += 1
-                self.memory[self.heap_ptr] = 0
-                self.heap_ptr += 1
-
-                self.set_reg(dst_reg, start)
-            
-            else:
+        elif op == 'call':
+            target = inst[1]
+            builtin = self.builtins.get(target)
+            if builtin is None:
                 ret_addr = self.ip + 1
-                self.registers['sp'] -= 1
-                self.memory[self.registers['sp']] = ret_addr
+                sp = self.registers['sp'] - 1
+                if sp < self.stack_limit:
+                    self._runtime_error("Runtime Error: Stack overflow")
+                if sp < self.stack_low:
+                    self.stack_low = sp
+                self.registers['sp'] = sp
+                self.memory[sp] = ret_addr
                 self.ip = self.labels[target]
                 self.ip -= 1
+            elif target in RESULT_BUILTINS:
+                self.set_reg(inst[2], builtin(*[self.get_val(arg) for arg in inst[3:]]))
+            else:
+                builtin(*[self.get_val(arg) for arg in inst[2:]])
 
         elif op == 'ret':
             ret_addr = self.memory[self.registers['sp']]
             self.registers['sp'] += 1
             if ret_addr == -1:
-                sys.exit(0)
+                raise _Halt(0)
             self.ip = ret_addr
             self.ip -= 1
 
+class VMPool:
+    """
+    Preallocated TSVM instances for running many short programs in one process.
+
+    `run(code)` takes an idle instance (waiting if all are busy), loads the
+    program, runs it with captured output and resets the instance before giving
+    it back, so no memory is allocated per run. Parsed programs are kept by
+    source text, up to `cache_size` of them.
+    """
+    def __init__(self, size=4, layout=None, cache_size=64):
+        self.idle = queue.LifoQueue()
+        for _ in range(size):
+            self.idle.put(TSVM(layout))
+        self.cache_size = cache_size
+        self.programs = {}
+
+    def _load(self, vm, code):
+        loaded = self.programs.get(code)
+        if loaded is None:
+            vm.load_lines(code.splitlines())
+            if len(self.programs) >= self.cache_size:
+                del self.programs[next(iter(self.programs))]
+            self.programs[code] = vm.loaded_program()
+        else:
+            vm.use_program(loaded)
+
+    def run(self, code, stdin="", **kwargs):
+        """Runs TSVM assembly `code`; returns a RunResult or raises TSVMError."""
+        vm = self.idle.get()
+        try:
+            self._load(vm, code)
+            return vm.run_captured(stdin, **kwargs)
+        finally:
+            vm.reset()
+            self.idle.put(vm)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python tsvm.py <input_file.tsvm>")
-        sys.exit(1)
-        
+    arg_parser = argparse.ArgumentParser(description="Run a TSVM assembly program.")
+    arg_parser.add_argument("program")
+    arg_parser.add_argument("--profile", nargs="?", const="", metavar="FOLDED",
+                            help="profile the run; collapsed stacks go to FOLDED (default: PROGRAM.folded)")
+    arg_parser.add_argument("--trace", nargs="?", type=int, const=64, metavar="N",
+                            help="keep the last N instructions and dump them on a runtime error")
+    arg_parser.add_argument("--sample", type=int, default=0, metavar="K",
+                            help="with --trace, also sample the ip of every K-th instruction")
+    arg_parser.add_argument("--checkpoint", metavar="FILE",
+                            help="save the VM state to FILE on SIGUSR1 (and with --checkpoint-every)")
+    arg_parser.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                            help="with --checkpoint, also save every N instructions")
+    arg_parser.add_argument("--resume", metavar="FILE",
+                            help="continue from a checkpoint of the same program")
+    args = arg_parser.parse_args()
+    if args.profile is not None and (args.trace or args.sample):
+        arg_parser.error("--profile cannot be combined with --trace or --sample")
+    if args.checkpoint_every and not args.checkpoint:
+        arg_parser.error("--checkpoint-every needs --checkpoint")
+
     vm = TSVM()
-    vm.load_program(sys.argv[1])
-    vm.run()
\ No newline at end of file
+    try:
+        vm.load_program(args.program)
+    except TSVMError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    profile = Profile() if args.profile is not None else None
+    trace = Trace(args.trace or 64, args.sample) if args.trace or args.sample else None
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpointer(args.checkpoint, args.checkpoint_every, getattr(signal, 'SIGUSR1', None))
+    exit_code = 1
+    try:
+        exit_code = vm.run(profile, trace, checkpoint, args.resume)
+    except TSVMRuntimeError as e:
+        print(e)
+        if trace is not None:
+            trace.dump()
+    except TSVMError as e:
+        print(f"Error: {e}")
+    finally:
+        if profile is not None:
+            folded = args.profile or args.program + '.folded'
+            profile.write_folded(folded)
+            print(profile.summary(), file=sys.stderr)
+            print(f"Collapsed stacks written to {folded}", file=sys.stderr)
+        if trace is not None and trace.sample_every:
+            print(trace.sample_summary(vm.program), file=sys.stderr)
+    sys.exit(exit_code)